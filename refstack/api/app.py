@@ -27,6 +27,8 @@ import six
 import webob
 
 from refstack.api import exceptions as api_exc
+from refstack.api import ingestion
+from refstack.api import sessions
 from refstack.api import utils as api_utils
 from refstack.api import constants as const
 from refstack import db
@@ -107,7 +109,55 @@ API_OPTS = [
                      'all clients will need to authenticate and sign with a '
                      'public/private keypair previously uploaded to their '
                      'user account.'
-                )
+                ),
+    cfg.IntOpt('compliance_cache_size',
+               default=1000,
+               help='Number of compliance reports of test runs against a '
+                    'guideline and target kept in memory by each API '
+                    'process. Set to 0 to disable caching.'
+               ),
+    cfg.IntOpt('compliance_cache_ttl',
+               default=3600,
+               help='Seconds after which a cached compliance report is '
+                    'computed again, so that changes to guidelines are '
+                    'picked up.'
+               ),
+    cfg.IntOpt('guideline_index_cache_size',
+               default=50,
+               help='Number of guideline revisions compiled for test list '
+                    'generation kept in memory by each API process.'
+               ),
+    cfg.IntOpt('test_list_cache_size',
+               default=1000,
+               help='Number of plain-text test lists of a guideline, '
+                    'target and set of options kept in memory by each API '
+                    'process. Set to 0 to disable caching.'
+               ),
+    cfg.IntOpt('compliance_matrix_max_results',
+               default=1000,
+               help='Maximum number of test results, the most recent ones, '
+                    'scored by a compliance matrix request to the API.'
+               ),
+    cfg.IntOpt('guideline_diff_cache_size',
+               default=200,
+               help='Number of differences between two guideline '
+                    'revisions for a target and set of statuses kept in '
+                    'memory by each API process. Set to 0 to disable '
+                    'caching.'
+               ),
+    cfg.IntOpt('pubkey_cache_size',
+               default=1000,
+               help='Number of parsed user public keys kept in memory by '
+                    'each API process to verify signed tokens. Set to 0 to '
+                    'disable caching.'
+               ),
+    cfg.IntOpt('token_cache_size',
+               default=10000,
+               help='Number of verified tokens kept in memory by each API '
+                    'process until they expire, so that repeated requests '
+                    'with the same token are not verified again. Set to 0 '
+                    'to disable caching.'
+               ),
 ]
 
 CONF = cfg.CONF
@@ -204,6 +254,19 @@ class CORSHook(pecan.hooks.PecanHook):
             state.response.headers['Access-Control-Allow-Credentials'] = 'true'
 
 
+class RequestContextHook(pecan.hooks.PecanHook):
+    """A pecan hook that attaches a request context to every request."""
+
+    def on_route(self, state):
+        """Attach a new context to the request."""
+        state.request.environ[const.REQUEST_CONTEXT_ENV] = \
+            api_utils.RequestContext()
+
+    def after(self, state):
+        """Discard the context of the request."""
+        state.request.environ.pop(const.REQUEST_CONTEXT_ENV, None)
+
+
 class JWTAuthHook(pecan.hooks.PecanHook):
     """A pecan hook that handles authentication with JSON Web Tokens."""
 
@@ -244,7 +307,7 @@ def setup_app(config):
         static_root=static_root,
         template_path=template_path,
         hooks=[
-            JWTAuthHook(), JSONErrorHook(), CORSHook(),
+            RequestContextHook(), JWTAuthHook(), JSONErrorHook(), CORSHook(),
             pecan.hooks.RequestViewerHook(
                 {'items': ['status', 'method', 'controller', 'path', 'body']},
                 headers=False, writer=WritableLogger(LOG, logging.DEBUG)
@@ -252,15 +315,10 @@ def setup_app(config):
         ]
     )
 
-    beaker_conf = {
-        'session.key': 'refstack',
-        'session.type': 'ext:database',
-        'session.url': CONF.database.connection,
-        'session.timeout': 604800,
-        'session.validate_key': api_utils.get_token(),
-        'session.sa.pool_recycle': 600
-    }
-    app = SessionMiddleware(app, beaker_conf)
+    app = SessionMiddleware(app, sessions.get_beaker_config())
+
+    if CONF.api.async_uploads and CONF.api.ingestion_workers > 0:
+        ingestion.start_workers(CONF.api.ingestion_workers)
 
     if CONF.api.app_dev_mode:
         LOG.debug('\n\n <<< Refstack UI is available at %s >>>\n\n',
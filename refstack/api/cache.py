@@ -0,0 +1,123 @@
+# Copyright (c) 2018 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""In-process caches shared by API server threads.
+
+Named caches are registered so that their statistics can be reported
+by get_stats. Caches of data written by other processes belong to a
+namespace, and are cleared by clear_namespace when the database reports
+a new generation of that namespace.
+"""
+
+import collections
+import threading
+import time
+
+_registry = {}
+
+
+class LRUCache(object):
+    """Thread-safe LRU cache with an optional time to live for entries.
+
+    The least recently used entry is evicted once 'maxsize' entries are
+    stored. Entries older than 'ttl' seconds are treated as missing. A
+    cache with a 'maxsize' of 0 stores nothing.
+    """
+
+    def __init__(self, maxsize, ttl=None, name=None, namespace=None):
+        """Init."""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        if name:
+            _registry[name] = self
+
+    def get(self, key, default=None):
+        """Return the value cached for the key or the default."""
+        with self._lock:
+            try:
+                expires, value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires <= time.time():
+                self.misses += 1
+                return default
+            # Reinsert the entry as the most recently used one.
+            self._data[key] = (expires, value)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, expires_at=None):
+        """Cache the value for the key.
+
+        The entry expires at the 'expires_at' timestamp if given, and
+        after the cache's time to live otherwise.
+        """
+        if self.maxsize <= 0:
+            return
+        if expires_at is not None:
+            expires = expires_at
+        else:
+            expires = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (expires, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """Remove the key from the cache."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_matching(self, predicate):
+        """Remove entries for which predicate(key, value) is true."""
+        with self._lock:
+            for key, (_, value) in list(self._data.items()):
+                if predicate(key, value):
+                    del self._data[key]
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        """Return the number of cached entries, expired ones included."""
+        return len(self._data)
+
+    def stats(self):
+        """Return the size and hit/miss counters of the cache."""
+        return {'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses}
+
+
+def clear_namespace(namespace):
+    """Clear all named caches belonging to the namespace."""
+    for lru in list(_registry.values()):
+        if lru.namespace == namespace:
+            lru.clear()
+
+
+def get_stats():
+    """Return statistics of all named caches."""
+    return dict((name, lru.stats()) for name, lru in _registry.items())
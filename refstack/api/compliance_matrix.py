@@ -0,0 +1,251 @@
+# Copyright (c) 2018 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Scores of many test runs against many guidelines and targets at once.
+
+The required tests of all (guideline, target) pairs get a column of a
+shared test index, keyed like the tests of Guidelines.check_compliance so
+that a test passes under its idempotent id or any of its names. Each
+distinct set of passed tests is encoded once, and the scores of all of
+them against all pairs are computed together: with matrix products when
+NumPy is installed, and with integer bitsets otherwise. Scores are the
+ones of the 'score' and 'compliant' fields of check_compliance.
+"""
+
+from oslo_log import log
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from refstack import db
+from refstack.api import guidelines
+
+LOG = log.getLogger(__name__)
+
+
+class TestIndex(object):
+    """Columns of the tests of a set of guidelines."""
+
+    def __init__(self):
+        """Init."""
+        self.columns = {}
+        self._name_columns = {}
+
+    def __len__(self):
+        """Return the number of indexed tests."""
+        return len(self.columns)
+
+    def add(self, key, names):
+        """Get the column of a test, adding it if it is new."""
+        column = self.columns.setdefault(key, len(self.columns))
+        for name in names:
+            self._name_columns.setdefault(name, set()).add(column)
+        return column
+
+    def encode(self, results):
+        """Get the sorted columns of the tests passed by a test run.
+
+        'results' is a list of passed tests as returned by
+        db.get_test_results.
+        """
+        columns = set()
+        for result in results:
+            columns.update(self._name_columns.get(result['name'], ()))
+            if result.get('uuid'):
+                column = self.columns.get(
+                    guidelines._normalize_test_id(result['uuid']))
+                if column is not None:
+                    columns.add(column)
+        return sorted(columns)
+
+
+class TargetTests(object):
+    """Required tests of a guideline target, as columns of a test index.
+
+    'weights' maps each column to the number of required capabilities
+    that have the test, which it counts for in scores, and 'unflagged'
+    is the set of columns of tests needed to be compliant.
+    """
+
+    def __init__(self, guideline, target, weights, unflagged):
+        """Init."""
+        self.guideline = guideline
+        self.target = target
+        self.weights = weights
+        self.unflagged = unflagged
+        self.total = sum(weights.values())
+
+    @classmethod
+    def from_guideline(cls, guideline, guideline_json, target, index):
+        """Index the required tests of a guideline target.
+
+        :raises KeyError: If the target is not valid for the guideline.
+        """
+        g = guidelines.Guidelines()
+        weights = {}
+        unflagged = set()
+        capabilities = g.get_capability_statuses(guideline_json,
+                                                 ['required'], target)
+        for capability in capabilities:
+            tests = g._get_capability_tests(guideline_json, capability)
+            for key, names in tests.items():
+                column = index.add(key, names)
+                weights[column] = weights.get(column, 0) + 1
+            for key in g._get_capability_tests(guideline_json, capability,
+                                               show_flagged=False):
+                unflagged.add(index.columns[key])
+        return cls(guideline, target, weights, unflagged)
+
+
+def _popcount(bits):
+    """Count the bits set in an integer."""
+    return bin(bits).count('1')
+
+
+def _score_bitsets(rows, targets):
+    """Compute (passed, compliant) of each row and target with bitsets."""
+    masks = []
+    for target in targets:
+        groups = {}
+        for column, weight in target.weights.items():
+            groups[weight] = groups.get(weight, 0) | 1 << column
+        unflagged = 0
+        for column in target.unflagged:
+            unflagged |= 1 << column
+        masks.append((list(groups.items()), unflagged))
+
+    scores = []
+    for columns in rows:
+        bits = 0
+        for column in columns:
+            bits |= 1 << column
+        scores.append([(sum(weight * _popcount(bits & mask)
+                            for weight, mask in groups),
+                        bits & unflagged == unflagged)
+                       for groups, unflagged in masks])
+    return scores
+
+
+def _score_arrays(rows, targets, size):
+    """Compute (passed, compliant) of each row and target with NumPy."""
+    # Counts are small integers, exact in floating point, which lets the
+    # products use BLAS.
+    passed = numpy.zeros((len(rows), size))
+    for i, columns in enumerate(rows):
+        passed[i, columns] = 1
+    weights = numpy.zeros((size, len(targets)))
+    unflagged = numpy.zeros((size, len(targets)))
+    for j, target in enumerate(targets):
+        weights[list(target.weights), j] = list(target.weights.values())
+        unflagged[list(target.unflagged), j] = 1
+    scores = passed.dot(weights)
+    compliant = passed.dot(unflagged) == unflagged.sum(axis=0)
+    return [list(zip(row_scores, row_compliant))
+            for row_scores, row_compliant in zip(scores.astype(int).tolist(),
+                                                 compliant.tolist())]
+
+
+def compute_scores(rows, targets, size, use_numpy=None):
+    """Score sets of passed tests against guideline targets.
+
+    :param rows: List of sorted index columns of the passed tests of
+                 each set, as returned by TestIndex.encode.
+    :param targets: List of TargetTests of the same index.
+    :param size: Number of columns of the index.
+    :param use_numpy: Whether to use NumPy, by default if installed.
+    :return: For each row, the list of (passed, compliant) tuples of each
+             target.
+    """
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    if use_numpy:
+        return _score_arrays(rows, targets, size)
+    return _score_bitsets(rows, targets)
+
+
+def _get_versions(g):
+    """Get the versions of all powered guidelines."""
+    guideline_list = g.get_guideline_list() or {}
+    return [gl['name'].replace('.json', '')
+            for gl in guideline_list.get('powered', [])]
+
+
+def get_compliance_matrix(filters, versions=None, targets=('platform',),
+                          limit=None):
+    """Score the test runs matching filters against guideline targets.
+
+    Guidelines default to all powered ones. Guidelines which can't be
+    retrieved and targets which are not valid for a guideline are left
+    out of the matrix.
+
+    :param filters: Filters of db.get_test_result_sets.
+    :param versions: List of guideline versions.
+    :param targets: List of targets, e.g. 'platform' or 'compute'.
+    :param limit: The maximum number of test runs, if any.
+    :return: Dict with the (guideline, target) 'columns' of the matrix,
+             and the 'results' test runs with their 'scores' in the
+             order of the columns.
+    """
+    g = guidelines.Guidelines()
+    if not versions:
+        versions = _get_versions(g)
+    index = TestIndex()
+    target_tests = []
+    for version in versions:
+        guideline_json = g.get_guideline_contents(version)
+        if not guideline_json:
+            LOG.warning('Unable to get the JSON content of guideline %s.',
+                        version)
+            continue
+        for target in targets:
+            try:
+                target_tests.append(TargetTests.from_guideline(
+                    version, guideline_json, target, index))
+            except KeyError:
+                LOG.debug('Target %s is not valid for guideline %s.',
+                          target, version)
+
+    test_runs = db.get_test_result_sets(filters, limit)
+    # Test runs sharing a result set are encoded and scored once.
+    rows = []
+    row_ids = {}
+    for test_run in test_runs:
+        key = test_run['result_set_id']
+        if key not in row_ids:
+            row_ids[key] = len(rows)
+            rows.append(index.encode(test_run['results']))
+    scores = compute_scores(rows, target_tests, len(index))
+
+    columns = [{'guideline': target.guideline,
+                'target': target.target,
+                'total': target.total} for target in target_tests]
+    results = []
+    for test_run in test_runs:
+        row_scores = []
+        for target, (passed, compliant) in zip(
+                target_tests, scores[row_ids[test_run['result_set_id']]]):
+            if target.total:
+                percentage = round(100.0 * passed / target.total, 2)
+            else:
+                percentage = None
+            row_scores.append({'passed': passed,
+                               'percentage': percentage,
+                               'compliant': compliant})
+        results.append({'id': test_run['id'],
+                        'cpid': test_run['cpid'],
+                        'created_at': test_run['created_at'],
+                        'scores': row_scores})
+    return {'columns': columns, 'results': results}
@@ -19,6 +19,8 @@ START_DATE = 'start_date'
 END_DATE = 'end_date'
 CPID = 'cpid'
 PAGE = 'page'
+CURSOR = 'cursor'
+LIMIT = 'limit'
 SIGNED = 'signed'
 VERIFICATION_STATUS = 'verification_status'
 PRODUCT_ID = 'product_id'
@@ -26,11 +28,18 @@ ALL_PRODUCT_TESTS = 'all_product_tests'
 OPENID = 'openid'
 USER_PUBKEYS = 'pubkeys'
 
+# Date format of the records position encoded in pagination cursors
+CURSOR_DATE_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
 # Guidelines tests requests parameters
 ALIAS = 'alias'
 FLAG = 'flag'
 TYPE = 'type'
 TARGET = 'target'
+GUIDELINE = 'guideline'
+
+# Capability statuses of guidelines, from the highest priority
+CAPABILITY_STATUSES = ('required', 'advisory', 'deprecated', 'removed')
 
 # OpenID parameters
 OPENID_MODE = 'openid.mode'
@@ -57,6 +66,20 @@ SHARED_TEST_RUN = 'shared'
 TEST_NOT_VERIFIED = 0
 TEST_VERIFIED = 1
 
+# Test visibility values
+TEST_PRIVATE = 0
+TEST_PUBLIC = 1
+
+# Statuses of uploads spooled for asynchronous ingestion
+UPLOAD_PENDING = 'pending'
+UPLOAD_PROCESSING = 'processing'
+UPLOAD_FAILED = 'failed'
+UPLOAD_STORED = 'stored'
+
+# Namespaces of cache generations, bumped on writes to cached data
+CACHE_MEMBERSHIP = 'membership'
+CACHE_PUBKEYS = 'pubkeys'
+
 # Roles
 ROLE_USER = 'user'
 ROLE_OWNER = 'owner'
@@ -84,4 +107,5 @@ HOSTED_PRIVATE_CLOUD = 2
 
 JWT_TOKEN_HEADER = 'Authorization'
 JWT_TOKEN_ENV = 'jwt.token'
+REQUEST_CONTEXT_ENV = 'refstack.context'
 JWT_VALIDATION_LEEWAY = 42
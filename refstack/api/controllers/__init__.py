@@ -23,6 +23,15 @@ CTRLS_OPTS = [
     cfg.IntOpt('results_per_page',
                default=20,
                help='Number of results for one page'),
+    cfg.IntOpt('max_results_limit',
+               default=100,
+               help='Maximum number of results for one page when results '
+                    'are paged with a cursor'),
+    cfg.IntOpt('max_body_size',
+               default=20 * 1024 * 1024,
+               help='Maximum size in bytes of a request body posted to '
+                    'endpoints with validation. Larger requests are '
+                    'rejected before being decoded'),
     cfg.StrOpt('input_date_format',
                default='%Y-%m-%d %H:%M:%S',
                help='The format for %(start)s and %(end)s parameters' % {
@@ -0,0 +1,35 @@
+# Copyright (c) 2018 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""In-process caches statistics controller."""
+
+import pecan
+from pecan import rest
+from pecan.secure import secure
+
+from refstack.api import cache
+from refstack.api import utils as api_utils
+
+
+class CachesController(rest.RestController):
+    """/v1/caches handler."""
+
+    @secure(api_utils.is_authenticated)
+    @pecan.expose('json')
+    def get(self):
+        """Get size and hit/miss counters of caches of this API process."""
+        if not api_utils.check_user_is_foundation_admin():
+            pecan.abort(403, 'Forbidden.')
+        return cache.get_stats()
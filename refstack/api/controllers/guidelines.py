@@ -33,14 +33,14 @@ class TestsController(rest.RestController):
 
     @pecan.expose(content_type='text/plain')
     def get(self, version):
-        """Get the plain-text test list of the specified guideline version."""
+        """Get the plain-text test list of the specified guideline version.
+
+        Lists carry a strong ETag, and requests with a matching
+        If-None-Match header are answered with 304 Not Modified.
+        """
         # Remove the .json from version if it is there.
         version.replace('.json', '')
         g = guidelines.Guidelines()
-        json = g.get_guideline_contents(version)
-
-        if not json:
-            return 'Error getting JSON content for version: ' + version
 
         if pecan.request.GET.get(const.TYPE):
             types = pecan.request.GET.get(const.TYPE).split(',')
@@ -59,12 +59,22 @@ class TestsController(rest.RestController):
 
         target = pecan.request.GET.get('target', 'platform')
         try:
-            target_caps = g.get_target_capabilities(json, types, target)
-            test_list = g.get_test_list(json, target_caps, alias, flag)
+            test_list = g.get_test_list_body(version, types, target, alias,
+                                             flag)
         except KeyError:
             return 'Invalid target: ' + target
 
-        return '\n'.join(test_list)
+        if test_list is None:
+            return 'Error getting JSON content for version: ' + version
+
+        body, sha = test_list
+        # webob quotes the entity tag, and unquotes the ones of the
+        # If-None-Match header.
+        pecan.response.etag = sha
+        if sha in pecan.request.if_none_match:
+            pecan.response.status = 304
+            return ''
+        return body
 
 
 class GuidelinesController(rest.RestController):
@@ -74,6 +84,10 @@ class GuidelinesController(rest.RestController):
     from the openstack/interop Github repository.
     """
 
+    _custom_actions = {
+        'diff': ['GET'],
+    }
+
     tests = TestsController()
 
     @pecan.expose('json')
@@ -87,6 +101,39 @@ class GuidelinesController(rest.RestController):
         else:
             return version_list
 
+    @pecan.expose('json')
+    def diff(self):
+        """Get the differences between two guideline versions.
+
+        The versions are given by the 'from' and 'to' parameters, and
+        capabilities and tests of the 'target' with the statuses of the
+        'type' parameter are compared.
+        """
+        from_version = pecan.request.GET.get('from')
+        to_version = pecan.request.GET.get('to')
+        if not from_version or not to_version:
+            pecan.abort(400, 'Both "from" and "to" guideline versions are '
+                             'required.')
+        target = pecan.request.GET.get(const.TARGET, 'platform')
+        if pecan.request.GET.get(const.TYPE):
+            types = pecan.request.GET.get(const.TYPE).split(',')
+        else:
+            types = None
+
+        g = guidelines.Guidelines()
+        try:
+            diff = g.get_guideline_diff(from_version, to_version, types,
+                                        target)
+        except KeyError:
+            pecan.abort(400, 'Invalid target: ' + target)
+        if diff is None:
+            pecan.abort(500, 'The server was unable to get the JSON '
+                             'content for the specified guideline files.')
+        result = {'from': from_version, 'to': to_version, 'target': target,
+                  'type': types}
+        result.update(diff)
+        return result
+
     @pecan.expose('json')
     def get_one(self, file_name):
         """Handler for getting contents of specific guideline file."""
@@ -149,7 +149,7 @@ class ProductsController(validation.BaseRestControllerWithValidation):
         allowed_keys = ['id', 'name', 'description', 'product_ref_id', 'type',
                         'product_type', 'public', 'organization_id']
         user = api_utils.get_user_id()
-        is_admin = user in db.get_foundation_users()
+        is_admin = api_utils.check_user_is_foundation_admin(user)
         try:
             if is_admin:
                 products = db.get_products(allowed_keys=allowed_keys,
@@ -24,7 +24,11 @@ from pecan import rest
 from six.moves.urllib import parse
 
 from refstack import db
+from refstack.api import compliance_matrix
 from refstack.api import constants as const
+from refstack.api import exceptions as api_exc
+from refstack.api import guidelines
+from refstack.api import ingestion
 from refstack.api import utils as api_utils
 from refstack.api import validators
 from refstack.api.controllers import validation
@@ -96,12 +100,86 @@ class MetadataController(rest.RestController):
         pecan.response.status = 204
 
 
+class UploadStatusController(rest.RestController):
+    """/v1/results/<test_id>/status handler."""
+
+    @pecan.expose('json')
+    def get(self, test_id):
+        """Get the ingestion status of uploaded test results.
+
+        The error of a failed upload is only shown to the user who signed
+        the upload and to foundation admins.
+        """
+        try:
+            upload = db.get_spooled_upload(test_id)
+        except db.NotFound:
+            # Stored uploads are removed from the spool.
+            db.get_test_result(test_id, allowed_keys=['id'])
+            return {'test_id': test_id,
+                    'status': const.UPLOAD_STORED,
+                    'url': parse.urljoin(CONF.ui_url,
+                                         CONF.api.test_results_url) % test_id}
+        status = {'test_id': test_id, 'status': upload['status']}
+        if upload['status'] == const.UPLOAD_FAILED:
+            user_id = api_utils.get_user_id()
+            is_uploader = bool(user_id) and upload.get('openid') == user_id
+            if is_uploader or api_utils.check_user_is_foundation_admin():
+                status['error'] = upload['error']
+        return status
+
+
+class ComplianceController(rest.RestController):
+    """/v1/results/<test_id>/compliance handler."""
+
+    @pecan.expose('json')
+    @api_utils.check_permissions(level=const.ROLE_USER)
+    def get(self, test_id):
+        """Get compliance of a test run with a guideline and target.
+
+        The guideline and target default to the ones saved in the test
+        run metadata.
+        """
+        version = (pecan.request.GET.get(const.GUIDELINE) or
+                   db.get_test_result_meta_key(test_id, const.GUIDELINE))
+        if not version:
+            pecan.abort(400, 'No guideline given and none is set in the '
+                             'test run metadata.')
+        target = (pecan.request.GET.get(const.TARGET) or
+                  db.get_test_result_meta_key(test_id, const.TARGET) or
+                  'platform')
+        if pecan.request.GET.get(const.TYPE):
+            types = pecan.request.GET.get(const.TYPE).split(',')
+        else:
+            types = None
+
+        g = guidelines.Guidelines()
+        try:
+            compliance = g.get_result_compliance(test_id, version, target,
+                                                 types)
+        except KeyError:
+            pecan.abort(400, 'Invalid target: ' + target)
+        if compliance is None:
+            pecan.abort(404, 'Unable to get the JSON content of guideline '
+                             '%s.' % version)
+        return compliance
+
+
 class ResultsController(validation.BaseRestControllerWithValidation):
     """/v1/results handler."""
 
     __validator__ = validators.TestResultValidator
 
+    _custom_actions = {
+        "schema": ["GET"],
+        "batch": ["POST"],
+        "matrix": ["GET"],
+    }
+
+    batch_validator = validators.TestResultBatchValidator()
+
     meta = MetadataController()
+    status = UploadStatusController()
+    compliance = ComplianceController()
 
     def _check_authentication(self):
         x_public_key = pecan.request.headers.get('X-Public-Key')
@@ -122,20 +200,21 @@ class ResultsController(validation.BaseRestControllerWithValidation):
 
         return stored_public_key
 
-    def _auto_version_associate(self, test, test_, pubkey):
-        if test.get('cpid'):
-            version = db.get_product_version_by_cpid(
-                test['cpid'], allowed_keys=['id', 'product_id'])
-            # Only auto-associate if there is a single product version
-            # with the given cpid.
-            if len(version) == 1:
-                is_foundation = api_utils.check_user_is_foundation_admin(
-                    pubkey.openid)
-                is_product_admin = api_utils.check_user_is_product_admin(
-                    version[0]['product_id'], pubkey.openid)
-                if is_foundation or is_product_admin:
-                    test_['product_version_id'] = version[0]['id']
-        return test_
+    def _check_product_filter(self, filters):
+        """Check access to the test results of a filtered product.
+
+        Vendor and Foundation admins get all test results of the product,
+        and other users only the public ones of public products.
+        """
+        if const.PRODUCT_ID in filters:
+            product = db.get_product(filters[const.PRODUCT_ID])
+            vendor_id = product['organization_id']
+            is_admin = (api_utils.check_user_is_foundation_admin() or
+                        api_utils.check_user_is_vendor_admin(vendor_id))
+            if is_admin:
+                filters[const.ALL_PRODUCT_TESTS] = True
+            elif not product['public']:
+                pecan.abort(403, 'Forbidden.')
 
     @pecan.expose('json')
     @api_utils.check_permissions(level=const.ROLE_USER)
@@ -170,23 +249,99 @@ class ResultsController(validation.BaseRestControllerWithValidation):
             }
         return test_info
 
+    @pecan.expose('json')
+    def post(self):
+        """Handler for uploading test results."""
+        item = super(ResultsController, self).post()
+        if CONF.api.async_uploads:
+            pecan.response.status = 202
+        return item
+
     def store_item(self, test):
         """Handler for storing item. Should return new item id."""
         # If we need a key, or the key isn't available, this will throw
         # an exception with a 401
         pubkey = self._check_authentication()
-        test_ = test.copy()
-        if pubkey:
-            if 'meta' not in test_:
-                test_['meta'] = {}
-            test_['meta'][const.USER] = pubkey.openid
-            test_ = self._auto_version_associate(test, test_, pubkey)
-
+        openid = pubkey.openid if pubkey else None
+
+        if CONF.api.async_uploads:
+            test_id = db.spool_test_results(test, openid)
+            return {'test_id': test_id,
+                    'url': parse.urljoin(CONF.ui_url,
+                                         CONF.api.test_results_url) % test_id,
+                    'status_url': parse.urljoin(
+                        CONF.api.api_url,
+                        CONF.api.upload_status_url) % test_id}
+
+        test_ = ingestion.prepare_test_results(test, openid)
         test_id = db.store_test_results(test_)
         return {'test_id': test_id,
                 'url': parse.urljoin(CONF.ui_url,
                                      CONF.api.test_results_url) % test_id}
 
+    @pecan.expose('json')
+    def batch(self):
+        """Handler for uploading a batch of test results.
+
+        The request body is a list of test runs, signed as a whole. Every
+        run is validated and stored separately, and the response lists
+        either the id or the error of each run, in the order of the
+        request.
+        """
+        self._check_body_size()
+        runs = self.batch_validator.validate(pecan.request)
+        pubkey = self._check_authentication()
+        openid = pubkey.openid if pubkey else None
+
+        items = []
+        valid_runs = []
+        for run in runs:
+            try:
+                self.validator.validate_item(run)
+            except api_exc.ValidationError as ex:
+                items.append({'error': str(ex)})
+            else:
+                items.append(None)
+                valid_runs.append(
+                    ingestion.prepare_test_results(run, openid))
+
+        stored = iter(db.store_test_results_batch(valid_runs))
+        for index, item in enumerate(items):
+            if item is None:
+                item = next(stored)
+                if 'test_id' in item:
+                    item['url'] = parse.urljoin(
+                        CONF.ui_url,
+                        CONF.api.test_results_url) % item['test_id']
+                items[index] = item
+
+        pecan.response.status = 201
+        return {'results': items}
+
+    @pecan.expose('json')
+    def matrix(self):
+        """Get the compliance matrix of the test results of a product.
+
+        Test results are filtered by 'product_id' or 'cpid' like when
+        listing them, and scored against each of the comma-separated
+        'guideline' versions, all powered guidelines by default, and
+        'target' values, 'platform' by default.
+        """
+        filters = api_utils.parse_input_params([const.CPID,
+                                                const.PRODUCT_ID])
+        if const.CPID not in filters and const.PRODUCT_ID not in filters:
+            pecan.abort(400, 'Either product_id or cpid is required.')
+        self._check_product_filter(filters)
+
+        if pecan.request.GET.get(const.GUIDELINE):
+            versions = pecan.request.GET.get(const.GUIDELINE).split(',')
+        else:
+            versions = None
+        targets = pecan.request.GET.get(const.TARGET, 'platform').split(',')
+        return compliance_matrix.get_compliance_matrix(
+            filters, versions, targets,
+            limit=CONF.api.compliance_matrix_max_results)
+
     @pecan.expose('json')
     @api_utils.check_permissions(level=const.ROLE_OWNER)
     def delete(self, test_id):
@@ -196,6 +351,7 @@ class ResultsController(validation.BaseRestControllerWithValidation):
             pecan.abort(403, 'Can not delete a verified test run.')
 
         db.delete_test_result(test_id)
+        guidelines.forget_result_compliance(test_id)
         pecan.response.status = 204
 
     @pecan.expose('json')
@@ -209,6 +365,9 @@ class ResultsController(validation.BaseRestControllerWithValidation):
             /v1/results?page=<page number>&cpid=1234.
         By default, page is set to page number 1,
         if the page parameter is not specified.
+        Results can also be paged with an opaque cursor instead of
+        a page number, which avoids counting all matching records:
+            /v1/results?limit=<N>&cursor=<next_cursor of previous page>.
         """
         expected_input_params = [
             const.START_DATE,
@@ -220,29 +379,38 @@ class ResultsController(validation.BaseRestControllerWithValidation):
         ]
 
         filters = api_utils.parse_input_params(expected_input_params)
+        self._check_product_filter(filters)
 
-        if const.PRODUCT_ID in filters:
-            product = db.get_product(filters[const.PRODUCT_ID])
-            vendor_id = product['organization_id']
-            is_admin = (api_utils.check_user_is_foundation_admin() or
-                        api_utils.check_user_is_vendor_admin(vendor_id))
-            if is_admin:
-                filters[const.ALL_PRODUCT_TESTS] = True
-            elif not product['public']:
-                pecan.abort(403, 'Forbidden.')
-
-        records_count = db.get_test_result_records_count(filters)
-        page_number, total_pages_number = \
-            api_utils.get_page_number(records_count)
+        cursor_params = api_utils.get_cursor_params()
+        if cursor_params is None:
+            records_count = db.get_test_result_records_count(filters)
+            page_number, total_pages_number = \
+                api_utils.get_page_number(records_count)
 
         try:
-            per_page = CONF.api.results_per_page
-            results = db.get_test_result_records(
-                page_number, per_page, filters)
-            is_foundation = api_utils.check_user_is_foundation_admin()
+            if cursor_params is None:
+                per_page = CONF.api.results_per_page
+                results = db.get_test_result_records(
+                    page_number, per_page, filters)
+                pagination = {'current_page': page_number,
+                              'total_pages': total_pages_number}
+            else:
+                position, limit = cursor_params
+                # Fetch one extra record to know if there is a next page.
+                results = db.get_test_result_records_by_cursor(
+                    position, limit + 1, filters)
+                next_cursor = None
+                if len(results) > limit:
+                    results = results[:limit]
+                    next_cursor = api_utils.encode_cursor(
+                        results[-1]['created_at'], results[-1]['id'])
+                pagination = {'next_cursor': next_cursor,
+                              'limit': limit}
+            permissions = api_utils.resolve_test_permissions(
+                [result['id'] for result in results])
             for result in results:
-
-                if not (api_utils.check_owner(result['id']) or is_foundation):
+                permission = permissions[result['id']]
+                if not (permission['owner'] or permission['foundation']):
 
                     # Don't expose product info if the product is not public.
                     if (result.get('product_version') and not
@@ -261,10 +429,7 @@ class ResultsController(validation.BaseRestControllerWithValidation):
                 ) % result['id']})
 
             page = {'results': results,
-                    'pagination': {
-                        'current_page': page_number,
-                        'total_pages': total_pages_number
-                    }}
+                    'pagination': pagination}
         except Exception as ex:
             LOG.debug('An error occurred during '
                       'operation with database: %s' % str(ex))
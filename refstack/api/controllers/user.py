@@ -44,6 +44,7 @@ class PublicKeysController(validation.BaseRestControllerWithValidation):
             parts.append('')
         pubkey['format'], pubkey['pubkey'], pubkey['comment'] = parts
         pubkey_id = db.store_pubkey(pubkey)
+        api_utils.forget_pubkey(pubkey)
         return pubkey_id
 
     @secure(api_utils.is_authenticated)
@@ -16,6 +16,7 @@
 """Version 1 of the API."""
 
 from refstack.api.controllers import auth
+from refstack.api.controllers import caches
 from refstack.api.controllers import guidelines
 from refstack.api.controllers import products
 from refstack.api.controllers import results
@@ -32,3 +33,4 @@ class V1Controller(object):
     profile = user.ProfileController()
     products = products.ProductsController()
     vendors = vendors.VendorsController()
+    caches = caches.CachesController()
@@ -15,11 +15,12 @@
 
 """Base for controllers with validation."""
 
-import json
-
+from oslo_config import cfg
 import pecan
 from pecan import rest
 
+CONF = cfg.CONF
+
 
 class BaseRestControllerWithValidation(rest.RestController):
     """Rest controller with validation.
@@ -53,11 +54,26 @@ class BaseRestControllerWithValidation(rest.RestController):
         """Return validation schema."""
         return self.validator.schema
 
+    def _check_body_size(self):
+        """Reject request bodies larger than the configured maximum."""
+        max_size = CONF.api.max_body_size
+        size = pecan.request.content_length
+        if size is None:
+            # Read at most one byte past the limit of a body of unknown
+            # length, e.g. a chunked one.
+            body = pecan.request.body_file.read(max_size + 1)
+            size = len(body)
+            if size <= max_size:
+                pecan.request.body = body
+        if size > max_size:
+            pecan.abort(413, 'Request body is larger than the maximum '
+                             'allowed size of %d bytes.' % max_size)
+
     @pecan.expose('json')
     def post(self, ):
         """POST handler."""
-        self.validator.validate(pecan.request)
-        item = json.loads(pecan.request.body.decode('utf-8'))
+        self._check_body_size()
+        item = self.validator.validate(pecan.request)
         item_id = self.store_item(item)
         pecan.response.status = 201
         return item_id
@@ -0,0 +1,178 @@
+# Copyright (c) 2018 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Guideline files served from a local directory.
+
+The directory is laid out like the openstack/interop repository, with
+add-on guidelines in its 'add-ons' subdirectory, and can be a git
+checkout of it. Listings and file contents are kept in memory, and the
+modification times of the directories and files are checked at most
+every guideline_local_check_interval seconds, so that files added,
+removed or changed, e.g. by a 'git pull', are picked up without
+restarting the API.
+"""
+
+import os
+import threading
+import time
+
+from oslo_config import cfg
+from oslo_log import log
+
+from refstack.api import guideline_store
+
+LOG = log.getLogger(__name__)
+
+GUIDELINE_LOCAL_OPTS = [
+    cfg.StrOpt('guideline_local_path',
+               help='Directory laid out like the openstack/interop '
+                    'repository, e.g. a git checkout of it, from which '
+                    'guideline files are served instead of the GitHub '
+                    'URLs. Guidelines are fetched from GitHub if it is '
+                    'not set.'
+               ),
+    cfg.FloatOpt('guideline_local_check_interval',
+                 default=1,
+                 help='Seconds between checks of the guideline directory '
+                      'for added, removed or changed files.'
+                 ),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(GUIDELINE_LOCAL_OPTS, group='api')
+
+# Subdirectory of the add-on guidelines.
+ADDONS_DIR = 'add-ons'
+
+_sources = {}
+_sources_lock = threading.Lock()
+
+
+class _IndexedFile(object):
+    """Guideline file of the index, with its content once it is read."""
+
+    def __init__(self, mtime, size):
+        """Init."""
+        self.mtime = mtime
+        self.size = size
+        self.content = None
+
+
+class LocalGuidelineSource(object):
+    """In-memory index of the guideline files of a directory."""
+
+    def __init__(self, root):
+        """Init."""
+        self.root = root
+        self._dir_mtimes = {}
+        self._files = {}
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def _stat(self, path):
+        """Return the (mtime, size) of a path, None if it is missing."""
+        try:
+            st = os.stat(os.path.join(self.root, path))
+        except OSError:
+            return None
+        return st.st_mtime, st.st_size
+
+    def _scan(self, directory):
+        """Index the JSON files of a directory of the tree."""
+        try:
+            names = os.listdir(os.path.join(self.root, directory))
+        except OSError:
+            names = []
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            path = '/'.join((directory, name)) if directory else name
+            if not os.path.isfile(os.path.join(self.root, path)):
+                continue
+            stat = self._stat(path)
+            if stat is not None and path not in self._files:
+                self._files[path] = _IndexedFile(*stat)
+
+    def _check(self):
+        """Update the index if the tree changed since the last check.
+
+        Must be called with the lock held.
+        """
+        now = time.time()
+        interval = CONF.api.guideline_local_check_interval
+        if self._checked_at is not None and now - self._checked_at < interval:
+            return
+        self._checked_at = now
+        dir_mtimes = {}
+        for directory in ('', ADDONS_DIR):
+            stat = self._stat(directory)
+            dir_mtimes[directory] = stat[0] if stat else None
+        if dir_mtimes != self._dir_mtimes:
+            LOG.debug('Guideline directory %s changed, rescanning it.',
+                      self.root)
+            self._dir_mtimes = dir_mtimes
+            for directory in ('', ADDONS_DIR):
+                self._scan(directory)
+        # Files edited in place don't change the mtime of their directory.
+        for path, indexed in list(self._files.items()):
+            stat = self._stat(path)
+            if stat is None:
+                del self._files[path]
+            elif stat != (indexed.mtime, indexed.size):
+                self._files[path] = _IndexedFile(*stat)
+
+    def list_files(self):
+        """List the guideline files like the GitHub contents API does.
+
+        :return: List of {'name', 'path', 'type'} dicts, sorted by path,
+                 of the files of the root directory and 'add-ons'.
+        """
+        with self._lock:
+            self._check()
+            paths = sorted(self._files)
+        return [{'name': path.rsplit('/', 1)[-1], 'path': path,
+                 'type': 'file'} for path in paths]
+
+    def get(self, path):
+        """Get the response for a guideline file, None if it is missing.
+
+        Only files of the index are served, so paths can't escape the
+        directory.
+        """
+        with self._lock:
+            self._check()
+            indexed = self._files.get(path)
+            if indexed is None:
+                return None
+            if indexed.content is None:
+                try:
+                    with open(os.path.join(self.root, path), 'rb') as f:
+                        indexed.content = f.read()
+                except (IOError, OSError) as e:
+                    LOG.warning('Failed to read guideline file %s: %s',
+                                path, e)
+                    return None
+            return guideline_store.CachedResponse(
+                200, indexed.content, from_cache=True,
+                fetched_at=indexed.mtime)
+
+
+def get_source(root):
+    """Get the index of a guideline directory, creating it once."""
+    with _sources_lock:
+        source = _sources.get(root)
+        if source is None:
+            source = _sources[root] = LocalGuidelineSource(root)
+    return source
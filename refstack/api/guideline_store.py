@@ -0,0 +1,516 @@
+# Copyright (c) 2018 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Persistent cache of guideline files and listings fetched over HTTP.
+
+Successful responses are saved to an SQLite database on local disk, which
+is shared by all API processes of a host and survives restarts. Entries
+older than guideline_cache_ttl are still served right away, while a
+single process refreshes them in a background thread. If the refresh
+fails, the last good copy keeps being served. Refreshes are conditional
+requests with the ETag and Last-Modified values of the cached copy, so
+that an unchanged file only has its age reset. The SHA-256 digest of
+each file is computed once when it is fetched and saved along with it,
+so that users of a file can tell its revisions apart without hashing it.
+
+Concurrent requests of a URL which is not cached yet are coalesced: a
+single thread of the process fetches it while the others wait for its
+response. With guideline_fetch_lock, a file lock extends this to all
+processes of the host. Requests share a pool of keep-alive connections.
+"""
+
+import contextlib
+import fcntl
+import functools
+import hashlib
+import json
+from multiprocessing import pool
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from oslo_config import cfg
+from oslo_log import log
+import requests
+from requests import adapters
+
+from refstack.api import cache
+
+LOG = log.getLogger(__name__)
+
+GUIDELINE_STORE_OPTS = [
+    cfg.StrOpt('guideline_cache_path',
+               default='/var/lib/refstack/guidelines.sqlite',
+               help='SQLite database where guideline files fetched from '
+                    'the guideline repositories are cached. It is shared '
+                    'by all API processes of a host, and should be in a '
+                    'directory only writable by the user of the API, '
+                    'which is created if it is missing. Files owned by '
+                    'another user are not used.'
+               ),
+    cfg.IntOpt('guideline_cache_ttl',
+               default=43200,
+               help='Seconds after which a cached guideline file is '
+                    'refreshed in the background. The cached copy is '
+                    'served until the refresh succeeds.'
+               ),
+    cfg.IntOpt('guideline_memory_cache_size',
+               default=200,
+               help='Number of guideline files and listings kept in memory '
+                    'by each process for guideline_cache_ttl seconds when '
+                    'the guideline cache database is unavailable.'
+               ),
+    cfg.IntOpt('guideline_refresh_timeout',
+               default=60,
+               help='Seconds during which other processes leave the '
+                    'refresh of a stale guideline file to the process '
+                    'which started it. A failed refresh is retried after '
+                    'this delay.'
+               ),
+    cfg.BoolOpt('guideline_fetch_lock',
+                default=False,
+                help='Let a single API process of the host fetch a '
+                     'guideline file which is not cached yet, while the '
+                     'other processes wait for it. A lock file is created '
+                     'next to guideline_cache_path.'
+                ),
+    cfg.IntOpt('guideline_fetch_workers',
+               default=8,
+               help='Number of guideline sources fetched concurrently, '
+                    'which is also the number of keep-alive connections '
+                    'kept to each guideline host.'
+               ),
+    cfg.FloatOpt('guideline_connect_timeout',
+                 default=5,
+                 help='Seconds to wait for a connection to a guideline '
+                      'host.'
+                 ),
+    cfg.FloatOpt('guideline_read_timeout',
+                 default=30,
+                 help='Seconds to wait for data from a guideline host.'
+                 ),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(GUIDELINE_STORE_OPTS, group='api')
+
+_SCHEMA = ('CREATE TABLE IF NOT EXISTS guideline_cache ('
+           'url TEXT PRIMARY KEY, '
+           'status_code INTEGER NOT NULL, '
+           'content BLOB NOT NULL, '
+           'headers TEXT NOT NULL, '
+           'fetched_at REAL NOT NULL, '
+           'refresh_until REAL NOT NULL DEFAULT 0, '
+           'digest TEXT)')
+
+# Number of byte ranges of the lock file that URLs are spread over.
+_LOCK_SLOTS = 1024
+
+_initialized_paths = set()
+_init_lock = threading.Lock()
+# Cache paths which were found unavailable, warned about once.
+_unavailable_paths = set()
+
+_memory_cache = None
+_memory_cache_lock = threading.Lock()
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+_fetch_pool = None
+_fetch_pool_lock = threading.Lock()
+
+
+class CachedResponse(object):
+    """Response to a GET request, possibly served from the cache."""
+
+    def __init__(self, status_code, content, headers=None, from_cache=False,
+                 fetched_at=None, digest=None):
+        """Init."""
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.from_cache = from_cache
+        self.fetched_at = fetched_at
+        # SHA-256 hex digest of the content, None if it isn't known.
+        self.digest = digest
+
+    @property
+    def text(self):
+        """Body of the response decoded as UTF-8."""
+        return self.content.decode('utf-8', 'replace')
+
+    def json(self):
+        """Body of the response decoded as JSON."""
+        return json.loads(self.text)
+
+
+def _check_owner(path):
+    """Refuse a file of the cache which is owned by another user.
+
+    :raises sqlite3.DatabaseError: If the file, or the symbolic link at
+            its path, exists and is not owned by the user of the process.
+    """
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return
+    if st.st_uid != os.geteuid():
+        raise sqlite3.DatabaseError('%s is owned by another user' % path)
+
+
+def _make_directory(path):
+    """Create the directory of a cache file if it is missing.
+
+    :raises sqlite3.DatabaseError: If the directory can't be created or
+            is owned by another user.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory, 0o700)
+        except OSError as e:
+            if not os.path.isdir(directory):
+                raise sqlite3.OperationalError(
+                    'Unable to create %s: %s' % (directory, e))
+    _check_owner(directory)
+
+
+def _connect():
+    """Open the cache database, creating it and its table on first use."""
+    path = CONF.api.guideline_cache_path
+    if path not in _initialized_paths:
+        _make_directory(path)
+    _check_owner(path)
+    conn = sqlite3.connect(path, timeout=30)
+    if path not in _initialized_paths:
+        with _init_lock:
+            if path not in _initialized_paths:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute(_SCHEMA)
+                columns = [row[1] for row in conn.execute(
+                    'PRAGMA table_info(guideline_cache)')]
+                # Caches created by older versions have no digests, which
+                # are then left to the users of the files.
+                if 'digest' not in columns:
+                    conn.execute('ALTER TABLE guideline_cache '
+                                 'ADD COLUMN digest TEXT')
+                conn.commit()
+                _initialized_paths.add(path)
+    return conn
+
+
+def _read(url):
+    """Get the cached response for the URL, None if there is none."""
+    conn = _connect()
+    try:
+        row = conn.execute('SELECT status_code, content, headers, '
+                           'fetched_at, digest FROM guideline_cache '
+                           'WHERE url = ?', (url,)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    return CachedResponse(row[0], bytes(row[1]), json.loads(row[2]),
+                          from_cache=True, fetched_at=row[3], digest=row[4])
+
+
+def _write(url, response):
+    """Save a successful response to the cache."""
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO guideline_cache '
+                         '(url, status_code, content, headers, fetched_at, '
+                         'digest) VALUES (?, ?, ?, ?, ?, ?)',
+                         (url, response.status_code,
+                          sqlite3.Binary(response.content),
+                          json.dumps(dict(response.headers)),
+                          response.fetched_at, response.digest))
+    finally:
+        conn.close()
+
+
+def _touch(url, fetched_at):
+    """Reset the age of a cached response which is still valid."""
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute('UPDATE guideline_cache SET fetched_at = ?, '
+                         'refresh_until = 0 WHERE url = ?',
+                         (fetched_at, url))
+    finally:
+        conn.close()
+
+
+def _claim_refresh(url):
+    """Check that no other process is already refreshing the URL."""
+    now = time.time()
+    conn = _connect()
+    try:
+        with conn:
+            claimed = conn.execute(
+                'UPDATE guideline_cache SET refresh_until = ? '
+                'WHERE url = ? AND refresh_until < ?',
+                (now + CONF.api.guideline_refresh_timeout, url, now))
+            return claimed.rowcount == 1
+    finally:
+        conn.close()
+
+
+def _get_http_session():
+    """Get the HTTP session with pooled connections, creating it once."""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            _http_session = requests.Session()
+            adapter = adapters.HTTPAdapter(
+                pool_maxsize=CONF.api.guideline_fetch_workers)
+            _http_session.mount('http://', adapter)
+            _http_session.mount('https://', adapter)
+    return _http_session
+
+
+def _get_header(headers, name):
+    """Get the value of a header, whatever the case of its name."""
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _conditional_headers(cached):
+    """Get the headers revalidating a cached response, if any."""
+    headers = {}
+    if cached is not None:
+        etag = _get_header(cached.headers, 'ETag')
+        if etag:
+            headers['If-None-Match'] = etag
+        last_modified = _get_header(cached.headers, 'Last-Modified')
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+    return headers
+
+
+def _fetch(url, cached=None, store=True):
+    """Send the GET request and save the response if it succeeded.
+
+    If a cached response is given, the request is conditional, and the
+    cached response is returned with its age reset when the server
+    replies that it is not modified. The cache database is left alone
+    if store is False.
+    """
+    resp = _get_http_session().get(
+        url, headers=_conditional_headers(cached),
+        timeout=(CONF.api.guideline_connect_timeout,
+                 CONF.api.guideline_read_timeout))
+    if resp.status_code == 304 and cached is not None:
+        fetched_at = time.time()
+        try:
+            if store:
+                _touch(url, fetched_at)
+        except sqlite3.Error as e:
+            LOG.warning('Failed to update %s in the guideline cache: %s',
+                        url, e)
+        return CachedResponse(cached.status_code, cached.content,
+                              cached.headers, from_cache=True,
+                              fetched_at=fetched_at, digest=cached.digest)
+    response = CachedResponse(resp.status_code, resp.content,
+                              resp.headers, fetched_at=time.time())
+    if response.status_code != 200:
+        return response
+    response.digest = hashlib.sha256(response.content).hexdigest()
+    if store:
+        try:
+            _write(url, response)
+        except sqlite3.Error as e:
+            LOG.warning('Failed to save %s to the guideline cache: %s',
+                        url, e)
+    return response
+
+
+class _Flight(object):
+    """Fetch of a URL in progress, whose outcome is shared by waiters."""
+
+    def __init__(self):
+        """Init."""
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+def _single_flight(url, func):
+    """Call func(url), or wait for the call in progress for the URL."""
+    with _flights_lock:
+        flight = _flights.get(url)
+        leader = flight is None
+        if leader:
+            flight = _flights[url] = _Flight()
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.response
+    try:
+        flight.response = func(url)
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[url]
+        flight.done.set()
+    return flight.response
+
+
+@contextlib.contextmanager
+def _node_lock(url):
+    """Hold the lock of the URL shared by the processes of the host."""
+    if not CONF.api.guideline_fetch_lock:
+        yield
+        return
+    slot = zlib.crc32(url.encode('utf-8')) % _LOCK_SLOTS
+    lock_path = CONF.api.guideline_cache_path + '.lock'
+    _check_owner(lock_path)
+    with open(lock_path, 'a') as lock_file:
+        fcntl.lockf(lock_file, fcntl.LOCK_EX, 1, slot)
+        try:
+            yield
+        finally:
+            fcntl.lockf(lock_file, fcntl.LOCK_UN, 1, slot)
+
+
+def _fetch_missing(url):
+    """Fetch a URL which was not cached, unless another process did."""
+    with _node_lock(url):
+        cached = _read(url)
+        if cached is not None:
+            return cached
+        return _fetch(url)
+
+
+def _refresh(url, cached=None):
+    """Fetch the URL again, keeping the cached copy on failure."""
+    try:
+        response = _fetch(url, cached)
+    except requests.exceptions.RequestException as e:
+        LOG.warning('Failed to refresh cached guideline file %s, the '
+                    'cached copy is still used: %s', url, e)
+        return
+    if response.status_code != 200:
+        LOG.warning('Failed to refresh cached guideline file %s, the '
+                    'cached copy is still used: HTTP code %s',
+                    url, response.status_code)
+
+
+def _start_refresh(url, cached):
+    """Refresh the URL in a background thread."""
+    thread = threading.Thread(target=_refresh, args=(url, cached))
+    thread.daemon = True
+    thread.start()
+
+
+def _get_memory_cache():
+    """Get the in-process cache of responses, creating it on first use."""
+    global _memory_cache
+    with _memory_cache_lock:
+        if _memory_cache is None:
+            _memory_cache = cache.LRUCache(
+                CONF.api.guideline_memory_cache_size,
+                ttl=CONF.api.guideline_cache_ttl, name='guideline_files')
+    return _memory_cache
+
+
+def _get_from_memory(url):
+    """Get the response for the URL without the cache database.
+
+    Successful responses are kept in memory for guideline_cache_ttl
+    seconds.
+    """
+    memory_cache = _get_memory_cache()
+    cached = memory_cache.get(url)
+    if cached is not None:
+        return cached
+    response = _single_flight(url, functools.partial(_fetch, store=False))
+    if response.status_code == 200:
+        memory_cache.set(url, CachedResponse(
+            response.status_code, response.content, response.headers,
+            from_cache=True, fetched_at=response.fetched_at,
+            digest=response.digest))
+    return response
+
+
+def get(url):
+    """Get the response to a GET request of the URL.
+
+    Responses are fetched only if they are not cached yet. Stale ones
+    are served while they are refreshed in the background. If the cache
+    database is unavailable, responses are cached in memory instead.
+
+    :raises requests.exceptions.RequestException: If the URL is not
+            cached and the request fails.
+    """
+    try:
+        cached = _read(url)
+        if cached is None:
+            return _single_flight(url, _fetch_missing)
+        if (time.time() - cached.fetched_at >= CONF.api.guideline_cache_ttl
+                and _claim_refresh(url)):
+            _start_refresh(url, cached)
+        return cached
+    except sqlite3.Error as e:
+        path = CONF.api.guideline_cache_path
+        if path not in _unavailable_paths:
+            _unavailable_paths.add(path)
+            LOG.warning('Guideline cache %s is unavailable, guideline '
+                        'files are cached in memory: %s', path, e)
+        else:
+            LOG.debug('Guideline cache %s is unavailable: %s', path, e)
+        return _get_from_memory(url)
+
+
+def _get_fetch_pool():
+    """Get the pool of threads fetching several URLs, creating it once."""
+    global _fetch_pool
+    with _fetch_pool_lock:
+        if _fetch_pool is None:
+            _fetch_pool = pool.ThreadPool(CONF.api.guideline_fetch_workers)
+    return _fetch_pool
+
+
+def _get_or_error(url):
+    """Get the response for the URL, or the exception of the request."""
+    try:
+        return get(url)
+    except requests.exceptions.RequestException as e:
+        return e
+
+
+def get_many(urls):
+    """Get the responses to GET requests of several URLs concurrently.
+
+    :return: List with, for each URL in the same order, either its
+             response or the requests.exceptions.RequestException raised
+             while fetching it.
+    """
+    if len(urls) < 2:
+        return [_get_or_error(url) for url in urls]
+    return _get_fetch_pool().map(_get_or_error, urls)
@@ -15,21 +15,251 @@
 
 """Class for retrieving Interop WG guideline information."""
 
+import hashlib
 import itertools
 from oslo_config import cfg
 from oslo_log import log
 from operator import itemgetter
 import re
 import requests
-import requests_cache
+import threading
+
+from refstack import db
+from refstack.api import cache
+from refstack.api import constants as const
+from refstack.api import guideline_local
+from refstack.api import guideline_store
 
 CONF = cfg.CONF
 LOG = log.getLogger(__name__)
 
-# Cached requests will expire after 12 hours.
-requests_cache.install_cache(cache_name='github_cache',
-                             backend='memory',
-                             expire_after=43200)
+# Test list entries of schema 1.3 and later have the form 'name[id]'.
+TEST_ENTRY_REGEX = re.compile(r'^(.*)\[([^\]]*)\]$')
+
+_compliance_cache = None
+_cache_lock = threading.Lock()
+_guideline_index_cache = None
+_test_list_cache = None
+_guideline_diff_cache = None
+
+
+def _get_compliance_cache():
+    """Get the cache of compliance reports, creating it on first use."""
+    global _compliance_cache
+    with _cache_lock:
+        if _compliance_cache is None:
+            _compliance_cache = cache.LRUCache(
+                CONF.api.compliance_cache_size,
+                ttl=CONF.api.compliance_cache_ttl, name='compliance')
+    return _compliance_cache
+
+
+def forget_result_compliance(test_id):
+    """Evict the cached compliance reports of a deleted test run."""
+    _get_compliance_cache().delete_matching(
+        lambda key, compliance: key[1] == test_id)
+
+
+def _get_guideline_index_cache():
+    """Get the cache of compiled guidelines, creating it on first use."""
+    global _guideline_index_cache
+    with _cache_lock:
+        if _guideline_index_cache is None:
+            _guideline_index_cache = cache.LRUCache(
+                CONF.api.guideline_index_cache_size, name='guideline_index')
+    return _guideline_index_cache
+
+
+def _get_test_list_cache():
+    """Get the cache of plain-text test lists, creating it on first use."""
+    global _test_list_cache
+    with _cache_lock:
+        if _test_list_cache is None:
+            _test_list_cache = cache.LRUCache(
+                CONF.api.test_list_cache_size, name='test_lists')
+    return _test_list_cache
+
+
+def _get_guideline_diff_cache():
+    """Get the cache of guideline differences, creating it on first use."""
+    global _guideline_diff_cache
+    with _cache_lock:
+        if _guideline_diff_cache is None:
+            _guideline_diff_cache = cache.LRUCache(
+                CONF.api.guideline_diff_cache_size, name='guideline_diffs')
+    return _guideline_diff_cache
+
+
+def _diff_statuses(old, new):
+    """Compare two mappings of names to their status."""
+    return {
+        'added': sorted(set(new) - set(old)),
+        'removed': sorted(set(old) - set(new)),
+        'reclassified': [{'name': name, 'from': old[name], 'to': new[name]}
+                         for name in sorted(set(old) & set(new))
+                         if old[name] != new[name]],
+    }
+
+
+def _normalize_test_id(test_id):
+    """Strip the 'id-' prefix used by idempotent ids in guidelines."""
+    if test_id.startswith('id-'):
+        return test_id[3:]
+    return test_id
+
+
+def _get_target_statuses(guideline_json, target):
+    """Map each capability status to the capabilities of a target.
+
+    :raises KeyError: If the target is not valid for the guideline.
+    """
+    components = guideline_json['components']
+    if ('metadata' in guideline_json and
+            guideline_json['metadata']['schema'] >= '2.0'):
+        schema = guideline_json['metadata']['schema']
+        platformsMap = {
+            'platform': 'OpenStack Powered Platform',
+            'compute': 'OpenStack Powered Compute',
+            'object': 'OpenStack Powered Storage',
+            'dns': 'OpenStack with DNS',
+            'orchestration': 'OpenStack with Orchestration'
+
+        }
+        if target == 'dns' or target == 'orchestration':
+            targets = ['os_powered_' + target]
+        else:
+            comps = \
+                guideline_json['platforms'][platformsMap[target]
+                                            ]['components']
+            targets = (obj['name'] for obj in comps)
+    else:
+        schema = guideline_json['schema']
+        targets = set()
+        if target != 'platform':
+            targets.add(target)
+        else:
+            targets.update(guideline_json['platform']['required'])
+    statuses = {}
+    for component in targets:
+        complist = components[component]
+        if schema >= '2.0':
+            complist = complist['capabilities']
+        for status, capabilities in complist.items():
+            statuses.setdefault(status, set()).update(capabilities)
+    return statuses
+
+
+class GuidelineIndex(object):
+    """Revision of a guideline compiled for test list generation.
+
+    Test entries of each capability are formatted once, split by whether
+    they are flagged and whether they are aliases. Capabilities of each
+    target are grouped by status on first use.
+    """
+
+    def __init__(self, guideline_json, revision):
+        """Init."""
+        self.guideline_json = guideline_json
+        self.revision = revision
+        self._target_statuses = {}
+        self._lock = threading.Lock()
+        if ('metadata' in guideline_json and
+                guideline_json['metadata']['schema'] >= '2.0'):
+            schema = guideline_json['metadata']['schema']
+        else:
+            schema = guideline_json['schema']
+        # Capability name to (tests, aliases, flagged tests, flagged
+        # aliases) entries.
+        self._capability_tests = {}
+        for cap, cap_details in guideline_json['capabilities'].items():
+            entries = ([], [], [], [])
+            if schema == '1.2':
+                flagged = set(cap_details.get('flagged', []))
+                for test in cap_details['tests']:
+                    entries[2 if test in flagged else 0].append(test)
+            else:
+                for test, test_details in cap_details['tests'].items():
+                    test_id = test_details.get('idempotent_id', '')
+                    offset = 2 if test_details.get('flagged') else 0
+                    entries[offset].append('{}[{}]'.format(test, test_id))
+                    for test_alias in test_details.get('aliases') or []:
+                        entries[offset + 1].append(
+                            '{}[{}]'.format(test_alias, test_id))
+            self._capability_tests[cap] = entries
+
+    def _get_statuses(self, target):
+        """Get the capabilities of the target grouped by status.
+
+        :raises KeyError: If the target is not valid for the guideline.
+        """
+        statuses = self._target_statuses.get(target)
+        if statuses is None:
+            statuses = _get_target_statuses(self.guideline_json, target)
+            with self._lock:
+                self._target_statuses[target] = statuses
+        return statuses
+
+    def get_target_capabilities(self, types=None, target='platform'):
+        """Get capabilities of the target with the given statuses.
+
+        :raises KeyError: If the target is not valid for the guideline.
+        """
+        target_caps = set()
+        for status, capabilities in self._get_statuses(target).items():
+            if types is None or status in types:
+                target_caps.update(capabilities)
+        return target_caps
+
+    def get_statuses(self, types=None, target='platform'):
+        """Map capabilities and tests of the target to their status.
+
+        Tests are the entries of get_test_list without aliases.
+
+        :return: (capabilities, tests, flagged) tuple, with dicts of the
+                 status of each capability and test, and the set of
+                 flagged tests.
+        :raises KeyError: If the target is not valid for the guideline.
+        """
+        # Capabilities and tests are mapped to their status by listing
+        # them one status at a time, from the lowest priority to the
+        # highest, so that ones listed under several statuses get the
+        # first of const.CAPABILITY_STATUSES, as in
+        # Guidelines.get_capability_statuses.
+        target_statuses = self._get_statuses(target)
+        ordered = [status for status in sorted(target_statuses)
+                   if status not in const.CAPABILITY_STATUSES]
+        ordered.extend(status for status in reversed(const.CAPABILITY_STATUSES)
+                       if status in target_statuses)
+        cap_statuses = {}
+        test_statuses = {}
+        flagged = set()
+        for status in ordered:
+            if types is not None and status not in types:
+                continue
+            capabilities = self.get_target_capabilities([status], target)
+            tests = self.get_test_list(capabilities, alias=False)
+            flagged.update(set(tests).difference(self.get_test_list(
+                capabilities, alias=False, show_flagged=False)))
+            cap_statuses.update((cap, status) for cap in capabilities)
+            test_statuses.update((test, status) for test in tests)
+        return cap_statuses, test_statuses, flagged
+
+    def get_test_list(self, capabilities, alias=True, show_flagged=True):
+        """Get the sorted test list of Guidelines.get_test_list."""
+        test_list = []
+        for cap in capabilities:
+            entries = self._capability_tests.get(cap)
+            if entries is None:
+                continue
+            test_list.extend(entries[0])
+            if alias:
+                test_list.extend(entries[1])
+            if show_flagged:
+                test_list.extend(entries[2])
+                if alias:
+                    test_list.extend(entries[3])
+        test_list.sort()
+        return test_list
 
 
 class Guidelines:
@@ -38,14 +268,17 @@ class Guidelines:
     def __init__(self,
                  repo_url=None,
                  raw_url=None,
-                 additional_capability_urls=None):
+                 additional_capability_urls=None,
+                 local_path=None):
         """Initialize class with needed URLs.
 
         The URL for the guidelines repository is specified with 'repo_url'.
         The URL for where raw files are served is specified with 'raw_url'.
-        These values will default to the values specified in the RefStack
-        config file.
+        A local directory serving guidelines instead of these URLs is
+        specified with 'local_path'. These values will default to the
+        values specified in the RefStack config file.
         """
+        self.local_path = local_path or CONF.api.guideline_local_path
         self.guideline_sources = list()
         if additional_capability_urls:
             self.additional_urls = additional_capability_urls.split(',')
@@ -64,6 +297,29 @@ class Guidelines:
         else:
             self.raw_url = CONF.api.github_raw_base_url
 
+    def _list_source_files(self):
+        """List the files of all guideline sources, in their order."""
+        if self.local_path:
+            return guideline_local.get_source(self.local_path).list_files()
+        files = []
+        # Sources are fetched concurrently, and merged in their order.
+        responses = guideline_store.get_many(self.guideline_sources)
+        for src_url, resp in zip(self.guideline_sources, responses):
+            if isinstance(resp, requests.exceptions.RequestException):
+                LOG.warning('An error occurred trying to get repository '
+                            'contents through %s: %s' % (src_url, resp))
+                continue
+
+            LOG.debug("Response Status: %s / Used Requests Cache: %s",
+                      resp.status_code, getattr(resp, 'from_cache', False))
+            if resp.status_code == 200:
+                files.extend(resp.json())
+            else:
+                LOG.warning('Guidelines repo URL (%s) returned '
+                            'non-success HTTP code: %s' %
+                            (src_url, resp.status_code))
+        return files
+
     def get_guideline_list(self):
         """Return a list of a guideline files.
 
@@ -74,38 +330,20 @@ class Guidelines:
         capability_list = []
         powered_files = []
         addon_files = []
-        for src_url in self.guideline_sources:
-            try:
-                resp = requests.get(src_url)
-
-                LOG.debug("Response Status: %s / Used Requests Cache: %s" %
-                          (resp.status_code,
-                           getattr(resp, 'from_cache', False)))
-                if resp.status_code == 200:
-                    regex = re.compile('([0-9]{4}\.[0-9]{2}|next)\.json')
-                    for rfile in resp.json():
-                        if rfile["type"] == "file" and \
-                                regex.search(rfile["name"]):
-                            if 'add-ons' in rfile['path'] and \
-                                    rfile[
-                                        'name'] not in map(itemgetter('name'),
-                                                           addon_files):
-                                file_dict = {'name': rfile['name']}
-                                addon_files.append(file_dict)
-                            elif 'add-ons' not in rfile['path'] and \
-                                rfile['name'] not in map(itemgetter('name'),
-                                                         powered_files):
-                                file_dict = {'name': rfile['name'],
-                                             'file': rfile['path']}
-                                powered_files.append(file_dict)
-                else:
-                    LOG.warning('Guidelines repo URL (%s) returned '
-                                'non-success HTTP code: %s' %
-                                (src_url, resp.status_code))
-
-            except requests.exceptions.RequestException as e:
-                LOG.warning('An error occurred trying to get repository '
-                            'contents through %s: %s' % (src_url, e))
+        regex = re.compile('([0-9]{4}\.[0-9]{2}|next)\.json')
+        for rfile in self._list_source_files():
+            if rfile["type"] == "file" and regex.search(rfile["name"]):
+                if 'add-ons' in rfile['path'] and \
+                        rfile['name'] not in map(itemgetter('name'),
+                                                 addon_files):
+                    file_dict = {'name': rfile['name']}
+                    addon_files.append(file_dict)
+                elif 'add-ons' not in rfile['path'] and \
+                    rfile['name'] not in map(itemgetter('name'),
+                                             powered_files):
+                    file_dict = {'name': rfile['name'],
+                                 'file': rfile['path']}
+                    powered_files.append(file_dict)
         for k, v in itertools.groupby(addon_files,
                                       key=lambda x: x['name'].split('.')[0]):
             values = [{'name': x['name'].split('.', 1)[1], 'file': x['name']}
@@ -115,8 +353,8 @@ class Guidelines:
         capability_files = dict((x, y) for x, y in capability_list)
         return capability_files
 
-    def get_guideline_contents(self, gl_file):
-        """Get contents for a given guideline path."""
+    def _get_guideline_response(self, gl_file):
+        """Get the response for a given guideline path, None on failure."""
         if '.json' not in gl_file:
             gl_file = '.'.join((gl_file, 'json'))
         regex = re.compile("[a-z]*\.([0-9]{4}\.[0-9]{2}|next)\.json")
@@ -125,17 +363,27 @@ class Guidelines:
         else:
             guideline_path = gl_file
 
+        if self.local_path:
+            response = guideline_local.get_source(
+                self.local_path).get(guideline_path)
+            if response is None:
+                LOG.warning('Guideline file %s was not found in %s' %
+                            (guideline_path, self.local_path))
+            return response
+
         file_url = ''.join((self.raw_url.rstrip('/'),
                             '/', guideline_path))
-        LOG.debug("file_url: %s" % (file_url))
+        LOG.debug("file_url: %s", file_url)
         try:
-            response = requests.get(file_url)
-            LOG.debug("Response Status: %s / Used Requests Cache: %s" %
-                      (response.status_code,
-                       getattr(response, 'from_cache', False)))
-            LOG.debug("Response body: %s" % str(response.text))
+            response = guideline_store.get(file_url)
+            # Only the size of the body is logged, guideline files are
+            # large and formatting them is costly even if it's discarded.
+            LOG.debug("Response Status: %s / Used Requests Cache: %s / "
+                      "Response body: %d bytes", response.status_code,
+                      getattr(response, 'from_cache', False),
+                      len(response.content))
             if response.status_code == 200:
-                return response.json()
+                return response
             else:
                 LOG.warning('Raw guideline URL (%s) returned non-success HTTP '
                             'code: %s' % (self.raw_url, response.status_code))
@@ -146,6 +394,97 @@ class Guidelines:
                         'contents from %s: %s' % (self.raw_url, e))
             return None
 
+    def get_guideline_contents(self, gl_file):
+        """Get contents for a given guideline path."""
+        response = self._get_guideline_response(gl_file)
+        return response.json() if response else None
+
+    def get_guideline_index(self, gl_file):
+        """Get the compiled index of a given guideline path.
+
+        Indexes are built once per revision of the guideline file, told
+        apart by the digest saved by the guideline store, and None is
+        returned if the file can't be retrieved.
+        """
+        response = self._get_guideline_response(gl_file)
+        if response is None:
+            return None
+        revision = getattr(response, 'digest', None)
+        if not revision:
+            # The file was cached before digests were saved.
+            revision = hashlib.sha256(response.content).hexdigest()
+        index_cache = _get_guideline_index_cache()
+        index = index_cache.get(revision)
+        if index is None:
+            index = GuidelineIndex(response.json(), revision)
+            index_cache.set(revision, index)
+        return index
+
+    def get_test_list_body(self, gl_file, types=None, target='platform',
+                           alias=True, show_flagged=True):
+        """Get the plain-text test list of a guideline and its digest.
+
+        The list is the one of get_test_list for the capabilities of the
+        target with the given statuses, joined by newlines and encoded.
+        Lists are memoized per guideline revision and parameters.
+
+        :return: (body, sha) tuple, where sha is the SHA-256 hex digest of
+                 the body, used unquoted as its entity tag, or None if the
+                 guideline file can't be retrieved.
+        :raises KeyError: If the target is not valid for the guideline.
+        """
+        index = self.get_guideline_index(gl_file)
+        if index is None:
+            return None
+        key = (index.revision, target,
+               tuple(sorted(types)) if types is not None else None,
+               bool(alias), bool(show_flagged))
+        test_list_cache = _get_test_list_cache()
+        test_list = test_list_cache.get(key)
+        if test_list is None:
+            capabilities = index.get_target_capabilities(types, target)
+            body = '\n'.join(index.get_test_list(
+                capabilities, alias, show_flagged)).encode('utf-8')
+            test_list = (body, hashlib.sha256(body).hexdigest())
+            test_list_cache.set(key, test_list)
+        return test_list
+
+    def get_guideline_diff(self, from_file, to_file, types=None,
+                           target='platform'):
+        """Get the differences between two guidelines for a target.
+
+        Capabilities and tests with the given statuses are compared, and
+        the ones added, removed and reclassified to another status are
+        listed, as well as tests flagged and unflagged. Differences are
+        memoized per pair of guideline revisions and parameters.
+
+        :return: Dict with 'capabilities' and 'tests' differences, or None
+                 if a guideline file can't be retrieved.
+        :raises KeyError: If the target is not valid for a guideline.
+        """
+        from_index = self.get_guideline_index(from_file)
+        to_index = self.get_guideline_index(to_file)
+        if from_index is None or to_index is None:
+            return None
+        key = (from_index.revision, to_index.revision, target,
+               tuple(sorted(types)) if types is not None else None)
+        diff_cache = _get_guideline_diff_cache()
+        diff = diff_cache.get(key)
+        if diff is None:
+            old_caps, old_tests, old_flagged = from_index.get_statuses(
+                types, target)
+            new_caps, new_tests, new_flagged = to_index.get_statuses(
+                types, target)
+            tests = set(old_tests) & set(new_tests)
+            diff = {'capabilities': _diff_statuses(old_caps, new_caps),
+                    'tests': _diff_statuses(old_tests, new_tests)}
+            diff['tests']['flagged'] = sorted(
+                tests & (new_flagged - old_flagged))
+            diff['tests']['unflagged'] = sorted(
+                tests & (old_flagged - new_flagged))
+            diff_cache.set(key, diff)
+        return diff
+
     def get_target_capabilities(self, guideline_json, types=None,
                                 target='platform'):
         """Get list of capabilities that match the given statuses and target.
@@ -153,40 +492,11 @@ class Guidelines:
         If no list of types in given, then capabilities of all types
         are given. If not target is specified, then all capabilities are given.
         """
-        components = guideline_json['components']
-        if ('metadata' in guideline_json and
-                guideline_json['metadata']['schema'] >= '2.0'):
-            schema = guideline_json['metadata']['schema']
-            platformsMap = {
-                'platform': 'OpenStack Powered Platform',
-                'compute': 'OpenStack Powered Compute',
-                'object': 'OpenStack Powered Storage',
-                'dns': 'OpenStack with DNS',
-                'orchestration': 'OpenStack with Orchestration'
-
-            }
-            if target == 'dns' or target == 'orchestration':
-                targets = ['os_powered_' + target]
-            else:
-                comps = \
-                    guideline_json['platforms'][platformsMap[target]
-                                                ]['components']
-                targets = (obj['name'] for obj in comps)
-        else:
-            schema = guideline_json['schema']
-            targets = set()
-            if target != 'platform':
-                targets.add(target)
-            else:
-                targets.update(guideline_json['platform']['required'])
         target_caps = set()
-        for component in targets:
-            complist = components[component]
-            if schema >= '2.0':
-                complist = complist['capabilities']
-            for status, capabilities in complist.items():
-                if types is None or status in types:
-                    target_caps.update(capabilities)
+        for status, capabilities in _get_target_statuses(
+                guideline_json, target).items():
+            if types is None or status in types:
+                target_caps.update(capabilities)
         return list(target_caps)
 
     def get_test_list(self, guideline_json, capabilities=[],
@@ -243,3 +553,132 @@ class Guidelines:
                                 test_list.append(test_str)
         test_list.sort()
         return test_list
+
+    def get_capability_statuses(self, guideline_json, types=None,
+                                target='platform'):
+        """Get the status of each capability of the given target.
+
+        A capability listed under several statuses, e.g. by several
+        components of the target, gets the status of highest priority.
+        """
+        statuses = {}
+        for status in reversed(const.CAPABILITY_STATUSES):
+            if types is None or status in types:
+                for capability in self.get_target_capabilities(
+                        guideline_json, [status], target):
+                    statuses[capability] = status
+        return statuses
+
+    def _get_capability_tests(self, guideline_json, capability,
+                              show_flagged=True):
+        """Map tests of a capability to the names they can pass under.
+
+        Tests are keyed by their idempotent id when the guideline gives
+        one, so that a test also passes under any of its aliases.
+        """
+        tests = {}
+        for entry in self.get_test_list(guideline_json, [capability],
+                                        alias=True,
+                                        show_flagged=show_flagged):
+            match = TEST_ENTRY_REGEX.match(entry)
+            if match:
+                name, test_id = match.groups()
+            else:
+                name, test_id = entry, ''
+            key = _normalize_test_id(test_id) or name
+            tests.setdefault(key, set()).add(name)
+        return tests
+
+    def check_compliance(self, guideline_json, results, types=None,
+                         target='platform'):
+        """Score passed tests against the capabilities of a target.
+
+        'results' is a list of passed tests as returned by
+        db.get_test_results. Pass and flag counts are given for each
+        capability and each status. The overall score and compliance are
+        given for required capabilities, where flagged tests are not
+        needed to be compliant.
+        """
+        passed_names = set(result['name'] for result in results)
+        passed_ids = set(_normalize_test_id(result['uuid'])
+                         for result in results if result.get('uuid'))
+        if ('metadata' in guideline_json and
+                guideline_json['metadata']['schema'] >= '2.0'):
+            schema = guideline_json['metadata']['schema']
+        else:
+            schema = guideline_json['schema']
+
+        capabilities = []
+        summary = dict((status, {'capabilities': 0, 'total': 0,
+                                 'passed': 0, 'flagged': 0})
+                       for status in const.CAPABILITY_STATUSES
+                       if types is None or status in types)
+        missing_required = 0
+        statuses = self.get_capability_statuses(guideline_json, types,
+                                                target)
+        for capability, status in sorted(statuses.items()):
+            tests = self._get_capability_tests(guideline_json, capability)
+            unflagged = set(self._get_capability_tests(
+                guideline_json, capability, show_flagged=False))
+            passed = set(key for key, names in tests.items()
+                         if key in passed_ids or names & passed_names)
+            flagged = set(tests) - unflagged
+            capabilities.append({'id': capability,
+                                 'status': status,
+                                 'total': len(tests),
+                                 'passed': len(passed),
+                                 'flagged': len(flagged),
+                                 'flagged_passed': len(flagged & passed)})
+            counts = summary[status]
+            counts['capabilities'] += 1
+            counts['total'] += len(tests)
+            counts['passed'] += len(passed)
+            counts['flagged'] += len(flagged)
+            if status == 'required':
+                missing_required += len(unflagged - passed)
+
+        required = summary.get('required', {'total': 0, 'passed': 0})
+        if required['total']:
+            percentage = round(100.0 * required['passed'] /
+                               required['total'], 2)
+        else:
+            percentage = None
+        return {'schema': schema,
+                'capabilities': capabilities,
+                'statuses': summary,
+                'score': {'passed': required['passed'],
+                          'total': required['total'],
+                          'percentage': percentage},
+                'compliant': 'required' in summary and not missing_required}
+
+    def get_result_compliance(self, test_id, version, target='platform',
+                              types=None):
+        """Get the compliance of a test run with a guideline and target.
+
+        Reports are cached per test run, guideline, target and status
+        types. The test run is looked up first, so that reports of test
+        runs deleted through another API process are not served. None is
+        returned if the guideline can not be retrieved, and KeyError is
+        raised for an invalid target.
+
+        :raises NotFound: If the test run doesn't exist.
+        """
+        db.get_test_result(test_id, allowed_keys=['id'])
+        key = (self.raw_url, test_id, version, target,
+               tuple(sorted(types)) if types else None)
+        compliance_cache = _get_compliance_cache()
+        compliance = compliance_cache.get(key)
+        if compliance is not None:
+            return compliance
+
+        guideline_json = self.get_guideline_contents(version)
+        if not guideline_json:
+            return None
+        results = db.get_test_results(test_id)
+        compliance = self.check_compliance(guideline_json, results, types,
+                                           target)
+        compliance.update({'test_id': test_id,
+                           'guideline': version,
+                           'target': target})
+        compliance_cache.set(key, compliance)
+        return compliance
@@ -0,0 +1,169 @@
+# Copyright (c) 2018 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Storing of test results uploads, either directly or through a spool.
+
+With asynchronous uploads enabled, accepted test results are saved to the
+result_upload table of the database and stored as test runs later by
+ingestion workers. Workers run either as threads of the API server or
+through the 'refstack-manage ingest' command.
+"""
+
+import threading
+
+from oslo_config import cfg
+from oslo_log import log
+
+from refstack import db
+from refstack.api import constants as const
+from refstack.api import utils as api_utils
+
+LOG = log.getLogger(__name__)
+
+INGESTION_OPTS = [
+    cfg.BoolOpt('async_uploads',
+                default=False,
+                help='Accept uploaded test results into a database spool '
+                     'and answer with 202 right away. The results are '
+                     'stored as test runs by ingestion workers.'
+                ),
+    cfg.StrOpt('upload_status_url',
+               default='/v1/results/%s/status',
+               help='Template for the status url of a spooled upload, '
+                    'relative to api_url.'
+               ),
+    cfg.IntOpt('ingestion_workers',
+               default=0,
+               help='Number of ingestion worker threads started by the API '
+                    'server when async_uploads is enabled. Set to 0 to run '
+                    'workers with "refstack-manage ingest" instead.'
+               ),
+    cfg.IntOpt('ingestion_poll_interval',
+               default=5,
+               help='Seconds an idle ingestion worker waits before checking '
+                    'the spool for new uploads.'
+               ),
+    cfg.IntOpt('ingestion_claim_timeout',
+               default=600,
+               help='Seconds after which an upload claimed by a worker is '
+                    'considered abandoned and can be claimed again.'
+               ),
+    cfg.IntOpt('ingestion_max_attempts',
+               default=3,
+               help='Number of attempts to store a spooled upload before it '
+                    'is marked as failed.'
+               ),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(INGESTION_OPTS, group='api')
+
+
+def prepare_test_results(test, openid=None):
+    """Add uploader information to test results before storing them.
+
+    Test results uploaded with a user's key are owned by that user, and
+    are associated to the product version with the same cpid if the user
+    can manage it.
+    """
+    test_ = test.copy()
+    if openid:
+        if 'meta' not in test_:
+            test_['meta'] = {}
+        test_['meta'][const.USER] = openid
+        if test.get('cpid'):
+            version = db.get_product_version_by_cpid(
+                test['cpid'], allowed_keys=['id', 'product_id'])
+            # Only auto-associate if there is a single product version
+            # with the given cpid.
+            if len(version) == 1:
+                is_foundation = api_utils.check_user_is_foundation_admin(
+                    openid)
+                is_product_admin = api_utils.check_user_is_product_admin(
+                    version[0]['product_id'], openid)
+                if is_foundation or is_product_admin:
+                    test_['product_version_id'] = version[0]['id']
+    return test_
+
+
+def store_upload(upload):
+    """Store a claimed spooled upload as a test run."""
+    test = prepare_test_results(upload['results'], upload['openid'])
+    try:
+        db.store_test_results(test, test_id=upload['id'])
+    except db.Duplication as ex:
+        # A previous attempt may have stored the test run and then died
+        # before removing the upload from the spool.
+        try:
+            db.get_test_result(upload['id'])
+        except db.NotFound:
+            raise ex
+    db.complete_spooled_upload(upload['id'])
+
+
+def process_next_upload():
+    """Store the next spooled upload. Return False if the spool is empty."""
+    upload = db.claim_spooled_upload(CONF.api.ingestion_claim_timeout)
+    if upload is None:
+        return False
+    try:
+        store_upload(upload)
+    except Exception as ex:
+        LOG.exception('Failed to store spooled upload %s', upload['id'])
+        failed = (isinstance(ex, db.Duplication) or
+                  upload['attempts'] >= CONF.api.ingestion_max_attempts)
+        db.release_spooled_upload(upload['id'], str(ex), failed=failed)
+    return True
+
+
+def drain_spool():
+    """Store spooled uploads until the spool is empty."""
+    processed = 0
+    while process_next_upload():
+        processed += 1
+    return processed
+
+
+class IngestionWorker(threading.Thread):
+    """Thread storing spooled uploads until it is stopped."""
+
+    def __init__(self):
+        """Init."""
+        super(IngestionWorker, self).__init__()
+        self.daemon = True
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        """Ask the worker to stop after the current upload."""
+        self._stop_event.set()
+
+    def run(self):
+        """Poll the spool and store uploads while not stopped."""
+        while not self._stop_event.is_set():
+            try:
+                if process_next_upload():
+                    continue
+            except Exception:
+                LOG.exception('Ingestion worker failed to poll the spool')
+            self._stop_event.wait(CONF.api.ingestion_poll_interval)
+
+
+def start_workers(count):
+    """Start the given number of ingestion worker threads."""
+    workers = [IngestionWorker() for _ in range(count)]
+    for worker in workers:
+        worker.start()
+    LOG.info('Started %d ingestion workers', count)
+    return workers
@@ -0,0 +1,114 @@
+# Copyright (c) 2018 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Configuration of beaker user sessions.
+
+Sessions are stored either in the main database, in signed and optionally
+encrypted cookies without any server storage, or in local files or dbm
+databases of each API host. Expired database sessions are deleted with
+the 'refstack-manage purge-sessions' command.
+"""
+
+import datetime
+
+from oslo_config import cfg
+
+from refstack import db
+from refstack.api import utils as api_utils
+
+# Name of the table of database sessions, created by beaker.
+SESSION_TABLE = 'beaker_cache'
+
+SESSION_OPTS = [
+    cfg.StrOpt('session_type',
+               default='database',
+               choices=['database', 'cookie', 'file', 'dbm'],
+               help='Storage of user sessions. "database" stores them in '
+                    'the main database, "cookie" in signed cookies which '
+                    'need no server storage, "file" and "dbm" in '
+                    'session_data_dir of each API host.'
+               ),
+    cfg.IntOpt('session_timeout',
+               default=604800,
+               help='Seconds after which an unused session expires.'
+               ),
+    cfg.StrOpt('session_secret',
+               secret=True,
+               help='Key used to sign session cookies. It is required '
+                    'when sessions are stored in cookies, and must then be '
+                    'the same for all API processes. A random key is '
+                    'generated by each process if it is not set.'
+               ),
+    cfg.StrOpt('session_encrypt_key',
+               secret=True,
+               help='Key used to encrypt the content of cookie sessions. '
+                    'Cookie sessions are only signed if it is not set.'
+               ),
+    cfg.StrOpt('session_data_dir',
+               default='/var/lib/refstack/sessions',
+               help='Directory of session files and locks for the "file" '
+                    'and "dbm" session types.'
+               ),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(SESSION_OPTS, group='api')
+
+
+def get_beaker_config():
+    """Get the beaker session middleware settings.
+
+    :raises oslo_config.cfg.RequiredOptError: If sessions are stored in
+            cookies and session_secret is not set, as cookies signed with
+            a random key of each process would only be valid on it.
+    """
+    session_type = CONF.api.session_type
+    if session_type == 'cookie' and not CONF.api.session_secret:
+        raise cfg.RequiredOptError('session_secret', cfg.OptGroup('api'))
+    beaker_conf = {
+        'session.key': 'refstack',
+        'session.timeout': CONF.api.session_timeout,
+        'session.validate_key': (CONF.api.session_secret or
+                                 api_utils.get_token()),
+    }
+    if session_type == 'database':
+        beaker_conf.update({
+            'session.type': 'ext:database',
+            'session.url': CONF.database.connection,
+            'session.table_name': SESSION_TABLE,
+            'session.sa.pool_recycle': 600,
+        })
+    elif session_type == 'cookie':
+        beaker_conf['session.type'] = 'cookie'
+        beaker_conf['session.httponly'] = True
+        if CONF.api.session_encrypt_key:
+            beaker_conf['session.encrypt_key'] = CONF.api.session_encrypt_key
+            beaker_conf['session.crypto_type'] = 'cryptography'
+    else:
+        beaker_conf.update({
+            'session.type': session_type,
+            'session.data_dir': CONF.api.session_data_dir,
+            'session.lock_dir': CONF.api.session_data_dir,
+        })
+    return beaker_conf
+
+
+def purge_expired_sessions(batch_size):
+    """Delete expired database sessions. Return the number deleted."""
+    # Beaker records the last access time of sessions in local time.
+    accessed_before = (datetime.datetime.now() -
+                       datetime.timedelta(seconds=CONF.api.session_timeout))
+    return db.purge_expired_sessions(SESSION_TABLE, accessed_before,
+                                     batch_size)
@@ -14,15 +14,20 @@
 #    under the License.
 
 """Refstack API's utils."""
+import base64
 import binascii
 import copy
 import functools
+import hashlib
 import random
 import requests
 import string
+import threading
+import time
 import types
 
 from cryptography.hazmat import backends
+from cryptography.hazmat.primitives.asymmetric import rsa
 from cryptography.hazmat.primitives import serialization
 from oslo_config import cfg
 from oslo_log import log
@@ -31,15 +36,21 @@ import pecan
 import pecan.rest
 import jwt
 
+import six
 from six.moves.urllib import parse
 
 from refstack import db
+from refstack.api import cache
 from refstack.api import constants as const
 from refstack.api import exceptions as api_exc
 
 LOG = log.getLogger(__name__)
 CONF = cfg.CONF
 
+_pubkey_cache = None
+_token_cache = None
+_cache_lock = threading.Lock()
+
 
 def _get_input_params_from_request(expected_params):
     """Get input parameters from request.
@@ -147,6 +158,59 @@ def get_page_number(records_count):
     return (page_number, total_pages)
 
 
+def encode_cursor(created_at, record_id):
+    """Encode an opaque keyset pagination cursor.
+
+    :param created_at: (datetime) creation date of the last seen record.
+    :param record_id: id of the last seen record.
+    """
+    raw = '%s,%s' % (created_at.strftime(const.CURSOR_DATE_FORMAT),
+                     record_id)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('utf-8')
+
+
+def decode_cursor(cursor):
+    """Decode a keyset pagination cursor into (created_at, id)."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('utf-8'))
+        created_at, record_id = raw.decode('utf-8').split(',', 1)
+        created_at = timeutils.parse_strtime(created_at,
+                                             const.CURSOR_DATE_FORMAT)
+    except (ValueError, TypeError, binascii.Error):
+        raise api_exc.ParseInputsError('Invalid cursor')
+    return created_at, record_id
+
+
+def get_cursor_params():
+    """Get keyset pagination params from request.
+
+    Return None if neither a cursor nor a limit was requested, otherwise
+    a tuple of the decoded cursor position (None for the first page) and
+    the number of records for one page.
+    """
+    cursor = pecan.request.GET.get(const.CURSOR)
+    limit = pecan.request.GET.get(const.LIMIT)
+    if cursor is None and limit is None:
+        return None
+
+    if limit is None:
+        limit = CONF.api.results_per_page
+    else:
+        try:
+            limit = int(limit)
+        except (ValueError, TypeError):
+            raise api_exc.ParseInputsError(
+                'Invalid limit: The limit can not be converted to '
+                'an integer')
+        if limit <= 0:
+            raise api_exc.ParseInputsError('Invalid limit: '
+                                           'The limit less or equal zero.')
+        limit = min(limit, CONF.api.max_results_limit)
+
+    position = decode_cursor(cursor) if cursor else None
+    return position, limit
+
+
 def set_query_params(url, params):
     """Set params in given query."""
     url_parts = parse.urlparse(url)
@@ -173,6 +237,54 @@ def delete_params_from_user_session(params):
         if session.get(param):
             del session[param]
     session.save()
+    context = get_request_context()
+    if context is not None and const.USER_OPENID in params:
+        # The user identity of the request has changed.
+        context.clear()
+
+
+class RequestContext(object):
+    """Values computed at most once during an API request.
+
+    A context is attached to the environ of every request by
+    RequestContextHook and is discarded with the request. Identity and
+    permission helpers memoize their database lookups in it.
+    """
+
+    def __init__(self):
+        """Init."""
+        self._values = {}
+
+    def memoize(self, key, func, *args, **kwargs):
+        """Return the value stored for the key, computing it if missing."""
+        try:
+            return self._values[key]
+        except KeyError:
+            value = self._values[key] = func(*args, **kwargs)
+            return value
+
+    def clear(self):
+        """Forget all memoized values."""
+        self._values.clear()
+
+
+def get_request_context():
+    """Return the context of the current request, if any."""
+    try:
+        context = pecan.request.environ.get(const.REQUEST_CONTEXT_ENV)
+    except AttributeError:
+        # Not called while serving a request.
+        return None
+    if isinstance(context, RequestContext):
+        return context
+
+
+def _memoize(key, func, *args, **kwargs):
+    """Compute a value once per request, or on every call out of one."""
+    context = get_request_context()
+    if context is None:
+        return func(*args, **kwargs)
+    return context.memoize(key, func, *args, **kwargs)
 
 
 def get_user_session():
@@ -185,8 +297,8 @@ def get_token_data():
     return pecan.request.environ.get(const.JWT_TOKEN_ENV)
 
 
-def get_user_id(from_session=True, from_token=True):
-    """Return authenticated user id."""
+def _get_user_id(from_session, from_token):
+    """Get authenticated user id from the session or the token."""
     session = get_user_session()
     token = get_token_data()
     if from_session and session.get(const.USER_OPENID):
@@ -195,11 +307,17 @@ def get_user_id(from_session=True, from_token=True):
         return token.get(const.USER_OPENID)
 
 
+def get_user_id(from_session=True, from_token=True):
+    """Return authenticated user id."""
+    return _memoize(('user_id', from_session, from_token),
+                    _get_user_id, from_session, from_token)
+
+
 def get_user(user_id=None):
     """Return db record for authenticated user."""
     if not user_id:
         user_id = get_user_id()
-    return db.user_get(user_id)
+    return _memoize(('user', user_id), db.user_get, user_id)
 
 
 def get_user_public_keys():
@@ -209,6 +327,12 @@ def get_user_public_keys():
 
 def is_authenticated(by_session=True, by_token=True):
     """Return True if user is authenticated."""
+    return _memoize(('authenticated', by_session, by_token),
+                    _is_authenticated, by_session, by_token)
+
+
+def _is_authenticated(by_session, by_token):
+    """Check that the user id belongs to a known user."""
     user_id = get_user_id(from_session=by_session, from_token=by_token)
     if user_id:
         try:
@@ -242,6 +366,11 @@ def enforce_permissions(test_id, level):
 
 def get_user_role(test_id):
     """Return user role for current user and specified test run."""
+    return _memoize(('role', test_id), _get_user_role, test_id)
+
+
+def _get_user_role(test_id):
+    """Compute user role for current user and specified test run."""
     if check_user_is_foundation_admin():
         return const.ROLE_FOUNDATION
     if check_owner(test_id):
@@ -278,6 +407,44 @@ def check_owner(test_id):
         return user and user == get_user_id()
 
 
+def resolve_test_permissions(test_ids):
+    """Resolve current user permissions for a batch of test runs.
+
+    This is a batched equivalent of check_owner/check_user which uses a
+    fixed number of queries regardless of the number of test runs.
+    Returns a dict mapping each test ID to a dict with keys:
+    'owner' - the user owns the test run (directly or through a product),
+    'foundation' - the user is a member of the Foundation group,
+    'visible' - the test run is visible to the user.
+    """
+    user_id = get_user_id()
+    is_foundation = check_user_is_foundation_admin(user_id)
+    if not is_authenticated():
+        user_id = None
+    owners = db.get_test_result_owners(test_ids)
+
+    vendor_ids = set()
+    if user_id and any(owner['product_version_id']
+                       for owner in owners.values()):
+        vendors = db.get_organizations_by_user(user_id, allowed_keys=['id'])
+        vendor_ids = set(vendor['id'] for vendor in vendors)
+
+    permissions = {}
+    for test_id in test_ids:
+        owner = owners.get(test_id, {})
+        if owner.get('product_version_id'):
+            is_owner = owner['organization_id'] in vendor_ids
+        else:
+            is_owner = bool(user_id) and owner.get(const.USER) == user_id
+        is_visible = (is_owner or is_foundation or
+                      not owner.get(const.USER) or
+                      bool(owner.get(const.SHARED_TEST_RUN)))
+        permissions[test_id] = {'owner': is_owner,
+                                'foundation': is_foundation,
+                                'visible': is_visible}
+    return permissions
+
+
 def check_permissions(level):
     """Decorator for checking permissions.
 
@@ -351,28 +518,106 @@ def verify_openid_request(request):
 def check_user_is_foundation_admin(user_id=None):
     """Check is user in foundation group or not."""
     user = user_id if user_id else get_user_id()
-    org_users = db.get_foundation_users()
-    return user in org_users
+    return _memoize(('foundation_user', user), db.is_foundation_user, user)
 
 
 def check_user_is_vendor_admin(vendor_id, user_id=None):
     """Check is user in vendor group or not."""
     user = user_id if user_id else get_user_id()
-    org_users = db.get_organization_users(vendor_id)
-    return user in org_users
+    return _memoize(('vendor_user', vendor_id, user),
+                    db.is_organization_user, vendor_id, user)
 
 
 def check_user_is_product_admin(product_id, user_id=None):
     """Check if the current user is in the vendor group for a product."""
-    product = db.get_product(product_id)
-    vendor_id = product['organization_id']
-    return check_user_is_vendor_admin(vendor_id, user_id=user_id)
+    user = user_id if user_id else get_user_id()
+    return _memoize(('product_admin', product_id, user),
+                    db.is_product_admin, user, product_id)
+
+
+def _get_pubkey_cache():
+    """Get the cache of parsed public keys, creating it on first use."""
+    global _pubkey_cache
+    with _cache_lock:
+        if _pubkey_cache is None:
+            _pubkey_cache = cache.LRUCache(CONF.api.pubkey_cache_size,
+                                           name='pubkeys',
+                                           namespace=const.CACHE_PUBKEYS)
+    return _pubkey_cache
+
+
+def _get_token_cache():
+    """Get the cache of verified tokens, creating it on first use."""
+    global _token_cache
+    with _cache_lock:
+        if _token_cache is None:
+            _token_cache = cache.LRUCache(CONF.api.token_cache_size,
+                                          name='tokens',
+                                          namespace=const.CACHE_PUBKEYS)
+    return _token_cache
+
+
+def get_pubkey_fingerprint(pubkey):
+    """Get the MD5 fingerprint of a stored public key as a hex string.
+
+    This is the value saved as md5_hash of the key and the one expected
+    in the 'kid' header of tokens.
+    """
+    return hashlib.md5(base64.b64decode(pubkey['pubkey'])).hexdigest()
+
+
+def _normalize_fingerprint(fingerprint):
+    """Turn an 'MD5:aa:bb:...' style fingerprint into a hex string."""
+    fingerprint = fingerprint.lower()
+    if fingerprint.startswith('md5:'):
+        fingerprint = fingerprint[4:]
+    return fingerprint.replace(':', '')
+
+
+def _load_pubkey(pubkey, fingerprint):
+    """Get the parsed RSA key object of a stored public key.
+
+    Parsed keys are cached by fingerprint. None is returned for keys
+    which can not verify RS256 signatures.
+    """
+    key_cache = _get_pubkey_cache()
+    key_obj = key_cache.get(fingerprint, False)
+    if key_obj is not False:
+        return key_obj
+    try:
+        pubkey_string = '%s %s' % (pubkey['format'], pubkey['pubkey'])
+        key_obj = serialization.load_ssh_public_key(
+            pubkey_string.encode('utf-8'),
+            backend=backends.default_backend()
+        )
+    except (ValueError, IndexError, TypeError, binascii.Error,
+            NotImplementedError):
+        key_obj = None
+    if not isinstance(key_obj, rsa.RSAPublicKey):
+        key_obj = None
+    key_cache.set(fingerprint, key_obj)
+    return key_obj
+
+
+def forget_pubkey(pubkey):
+    """Drop a public key from the caches, with the tokens it verified."""
+    try:
+        fingerprint = get_pubkey_fingerprint(pubkey)
+    except (KeyError, ValueError, TypeError, binascii.Error):
+        return
+    _get_pubkey_cache().delete(fingerprint)
+    _get_token_cache().delete_matching(
+        lambda key, entry: entry[0] == fingerprint)
 
 
 def decode_token(request):
     """Validate request signature.
 
-    ValidationError rises if request is not valid.
+    ValidationError rises if request is not valid. A token with a 'kid'
+    header is only checked against the user's key with that fingerprint.
+    Claims of verified tokens are cached until the tokens expire, along
+    with the fingerprint of the key which verified them. Both caches are
+    dropped when any process deletes a public key.
     """
     if not request.headers.get(const.JWT_TOKEN_HEADER):
         return
@@ -384,40 +629,50 @@ def decode_token(request):
     if auth_schema != 'Bearer':
         raise api_exc.ValidationError(
             "Authorization schema 'Bearer' should be used")
+    db.check_cache_generations()
+    token_cache = _get_token_cache()
+    token_key = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    cached = token_cache.get(token_key)
+    if cached is not None:
+        return dict(cached[1])
     try:
         token_data = jwt.decode(token, algorithms='RS256', verify=False)
+        kid = jwt.get_unverified_header(token).get('kid')
     except jwt.InvalidTokenError:
         raise api_exc.ValidationError("Token is not valid")
 
     openid = token_data.get(const.USER_OPENID)
     if not openid:
         raise api_exc.ValidationError("Token does not contain user's openid")
+    if kid:
+        kid = _normalize_fingerprint(six.text_type(kid))
     pubkeys = db.get_user_pubkeys(openid)
     for pubkey in pubkeys:
         try:
-            pubkey_string = '%s %s' % (pubkey['format'], pubkey['pubkey'])
-            pubkey_obj = serialization.load_ssh_public_key(
-                pubkey_string.encode('utf-8'),
-                backend=backends.default_backend()
-            )
-            pem_pubkey = pubkey_obj.public_bytes(
-                serialization.Encoding.PEM,
-                serialization.PublicFormat.SubjectPublicKeyInfo)
-        except (ValueError, IndexError, TypeError, binascii.Error):
+            fingerprint = get_pubkey_fingerprint(pubkey)
+        except (ValueError, TypeError, binascii.Error):
+            continue
+        if kid and fingerprint != kid:
+            continue
+        pubkey_obj = _load_pubkey(pubkey, fingerprint)
+        if pubkey_obj is None:
+            continue
+        try:
+            token_data = jwt.decode(
+                token, key=pubkey_obj,
+                options={'verify_signature': True,
+                         'verify_exp': True,
+                         'require_exp': True},
+                leeway=const.JWT_VALIDATION_LEEWAY)
+            # NOTE(sslipushenko) If at least one key is valid, let
+            # the validation pass
+            expires_at = token_data['exp'] - const.JWT_VALIDATION_LEEWAY
+            if expires_at > time.time():
+                token_cache.set(token_key, (fingerprint, dict(token_data)),
+                                expires_at=expires_at)
+            return token_data
+        except jwt.InvalidTokenError:
             pass
-        else:
-            try:
-                token_data = jwt.decode(
-                    token, key=pem_pubkey,
-                    options={'verify_signature': True,
-                             'verify_exp': True,
-                             'require_exp': True},
-                    leeway=const.JWT_VALIDATION_LEEWAY)
-                # NOTE(sslipushenko) If at least one key is valid, let
-                # the validation pass
-                return token_data
-            except jwt.InvalidTokenError:
-                pass
 
     # NOTE(sslipushenko) If all user's keys are not valid, the validation fails
     raise api_exc.ValidationError("Token is not valid")
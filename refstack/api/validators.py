@@ -61,16 +61,23 @@ class BaseValidator(object):
             self.schema,
             format_checker=ext_format_checker
         )
+        # Formats such as uuid_hex are not enforced on request bodies.
+        self._body_validator = jsonschema.Draft4Validator(self.schema)
 
     def validate(self, request):
-        """Validate request."""
+        """Validate request and return its decoded body."""
         try:
             body = json.loads(request.body.decode('utf-8'))
         except (ValueError, TypeError) as e:
             raise api_exc.ValidationError('Malformed request', e)
 
+        self.validate_body(body)
+        return body
+
+    def validate_body(self, body):
+        """Validate decoded request body against the schema."""
         try:
-            jsonschema.validate(body, self.schema)
+            self._body_validator.validate(body)
         except jsonschema.ValidationError as e:
             raise api_exc.ValidationError(
                 'Request doesn''t correspond to schema', e)
@@ -118,7 +125,24 @@ class TestResultValidator(BaseValidator):
 
     def validate(self, request):
         """Validate uploaded test results."""
-        super(TestResultValidator, self).validate(request)
+        body = super(TestResultValidator, self).validate(request)
+        self.check_signature(request)
+        self.check_not_empty(body)
+        return body
+
+    def validate_item(self, item):
+        """Validate test results of a single run from a batch upload."""
+        self.validate_body(item)
+        self.check_not_empty(item)
+
+    def check_not_empty(self, body):
+        """Check that test results contain at least one passing test."""
+        if self._is_empty_result(body):
+            raise api_exc.ValidationError('Uploaded results must contain at '
+                                          'least one passing test.')
+
+    def check_signature(self, request):
+        """Verify the signature of the request body, if it is signed."""
         if request.headers.get('X-Signature') or \
                 request.headers.get('X-Public-Key'):
             try:
@@ -140,13 +164,9 @@ class TestResultValidator(BaseValidator):
                 verifier.verify()
             except InvalidSignature:
                 raise api_exc.ValidationError('Signature verification failed')
-        if self._is_empty_result(request):
-            raise api_exc.ValidationError('Uploaded results must contain at '
-                                          'least one passing test.')
 
-    def _is_empty_result(self, request):
+    def _is_empty_result(self, body):
         """Check if the test results list is empty."""
-        body = json.loads(request.body.decode('utf-8'))
         if len(body['results']) != 0:
             return False
         return True
@@ -157,6 +177,26 @@ class TestResultValidator(BaseValidator):
         return is_uuid(_id)
 
 
+class TestResultBatchValidator(TestResultValidator):
+    """Validator for batches of incoming test results.
+
+    Only the batch itself and its signature are checked here, every run
+    is checked separately with TestResultValidator.validate_item.
+    """
+
+    schema = {
+        'type': 'array',
+        'items': {'type': 'object'},
+        'minItems': 1
+    }
+
+    def validate(self, request):
+        """Validate uploaded batch of test results."""
+        body = super(TestResultValidator, self).validate(request)
+        self.check_signature(request)
+        return body
+
+
 class PubkeyValidator(BaseValidator):
     """Validator for uploaded public pubkeys."""
 
@@ -172,8 +212,7 @@ class PubkeyValidator(BaseValidator):
 
     def validate(self, request):
         """Validate uploaded test results."""
-        super(PubkeyValidator, self).validate(request)
-        body = json.loads(request.body.decode('utf-8'))
+        body = super(PubkeyValidator, self).validate(request)
         key_format = body['raw_key'].strip().split()[0]
 
         if key_format not in ('ssh-dss', 'ssh-rsa',
@@ -197,6 +236,7 @@ class PubkeyValidator(BaseValidator):
             verifier.verify()
         except InvalidSignature:
             raise api_exc.ValidationError('Signature verification failed')
+        return body
 
 
 class VendorValidator(BaseValidator):
@@ -214,10 +254,10 @@ class VendorValidator(BaseValidator):
 
     def validate(self, request):
         """Validate uploaded vendor data."""
-        super(VendorValidator, self).validate(request)
-        body = json.loads(request.body.decode('utf-8'))
+        body = super(VendorValidator, self).validate(request)
 
         self.check_emptyness(body, ['name'])
+        return body
 
 
 class ProductValidator(BaseValidator):
@@ -238,10 +278,10 @@ class ProductValidator(BaseValidator):
 
     def validate(self, request):
         """Validate uploaded test results."""
-        super(ProductValidator, self).validate(request)
-        body = json.loads(request.body.decode('utf-8'))
+        body = super(ProductValidator, self).validate(request)
 
         self.check_emptyness(body, ['name', 'product_type'])
+        return body
 
 
 class ProductVersionValidator(BaseValidator):
@@ -259,7 +299,7 @@ class ProductVersionValidator(BaseValidator):
 
     def validate(self, request):
         """Validate product version data."""
-        super(ProductVersionValidator, self).validate(request)
-        body = json.loads(request.body.decode('utf-8'))
+        body = super(ProductVersionValidator, self).validate(request)
 
         self.check_emptyness(body, ['version'])
+        return body
@@ -19,9 +19,15 @@ Functions in this module are imported into the refstack.db namespace.
 Call these functions from refstack.db namespace, not the refstack.db.api
 namespace.
 """
+import threading
+import time
+
 from oslo_config import cfg
 from oslo_db import api as db_api
 
+from refstack.api import cache
+from refstack.api import constants as const
+
 
 db_opts = [
     cfg.StrOpt('db_backend',
@@ -33,6 +39,30 @@ db_opts = [
                     'database. To allow RefStack to upload and store ' +
                     'the full set of subunit data, set this option to ' +
                     'refstack_alembic_version.'),
+    cfg.IntOpt('results_insert_batch_size',
+               default=500,
+               help='Maximum number of test result rows written by a '
+                    'single INSERT statement when storing an upload.'),
+    cfg.IntOpt('results_batch_chunk_size',
+               default=20,
+               help='Number of test runs of a batch upload stored in a '
+                    'single transaction.'),
+    cfg.IntOpt('membership_cache_size',
+               default=10000,
+               help='Number of group memberships and organization groups '
+                    'kept in memory by each process for permission checks. '
+                    'Set to 0 to disable caching.'),
+    cfg.IntOpt('membership_cache_ttl',
+               default=60,
+               help='Seconds after which a cached group membership is read '
+                    'from the database again. Changes made by other '
+                    'processes are seen after at most this delay.'),
+    cfg.IntOpt('cache_generation_check_interval',
+               default=1000,
+               help='Milliseconds between checks of the cache_generation '
+                    'table. Caches of data changed by other processes are '
+                    'dropped at the first check after the change. Set to '
+                    '0 to check before every cached lookup.'),
 ]
 
 CONF = cfg.CONF
@@ -45,13 +75,140 @@ IMPL = db_api.DBAPI.from_config(cfg.CONF, backend_mapping=_BACKEND_MAPPING,
 NotFound = IMPL.NotFound
 Duplication = IMPL.Duplication
 
+_membership_cache = None
+_membership_cache_lock = threading.Lock()
+# Marks missing entries of the membership cache, which may store None.
+_MISSING = object()
+
+# Last seen generation of each cache namespace and time of the last check.
+_cache_generations = None
+_cache_generations_checked = 0
+_cache_generations_lock = threading.Lock()
+
+
+def check_cache_generations():
+    """Drop local caches whose namespace changed in another process.
 
-def store_test_results(results):
+    The cache_generation table is read at most once per
+    cache_generation_check_interval milliseconds.
+    """
+    global _cache_generations, _cache_generations_checked
+    now = time.time()
+    interval = CONF.cache_generation_check_interval / 1000.0
+    if now - _cache_generations_checked < interval:
+        return
+    with _cache_generations_lock:
+        if now - _cache_generations_checked < interval:
+            return
+        _cache_generations_checked = now
+        generations = IMPL.get_cache_generations()
+        previous = _cache_generations
+        _cache_generations = generations
+    if previous is None:
+        return
+    for namespace in set(generations) | set(previous):
+        if generations.get(namespace) != previous.get(namespace):
+            cache.clear_namespace(namespace)
+
+
+def _get_membership_cache():
+    """Get the cache of group memberships, creating it on first use."""
+    global _membership_cache
+    with _membership_cache_lock:
+        if _membership_cache is None:
+            _membership_cache = cache.LRUCache(
+                CONF.membership_cache_size,
+                ttl=CONF.membership_cache_ttl, name='membership',
+                namespace=const.CACHE_MEMBERSHIP)
+    return _membership_cache
+
+
+def _cached_membership(key, func, *args):
+    """Get a membership value from the cache, reading it on a miss."""
+    check_cache_generations()
+    membership_cache = _get_membership_cache()
+    value = membership_cache.get(key, _MISSING)
+    if value is _MISSING:
+        value = func(*args)
+        membership_cache.set(key, value)
+    return value
+
+
+def store_test_results(results, test_id=None):
     """Storing results into database.
 
     :param results: Dict describes test results.
+    :param test_id: ID for the new test run, generated if not given.
     """
-    return IMPL.store_test_results(results)
+    return IMPL.store_test_results(results, test_id=test_id)
+
+
+def store_test_results_batch(results_list):
+    """Storing several test runs into database.
+
+    :param results_list: List of dicts describing test results.
+    :return: List with a dict for each test run in the same order, with
+             either the 'test_id' of the stored run or an 'error'.
+    """
+    return IMPL.store_test_results_batch(results_list)
+
+
+def spool_test_results(results, openid=None):
+    """Save test results to be stored later by an ingestion worker.
+
+    :param results: Dict describes test results.
+    :param openid: OpenID of the user who uploaded the results.
+    :return: ID of the test run the results will be stored as.
+    """
+    return IMPL.spool_test_results(results, openid=openid)
+
+
+def claim_spooled_upload(claim_timeout):
+    """Claim the oldest spooled upload which no worker is processing.
+
+    :param claim_timeout: Seconds after which a claimed upload can be
+                          claimed again.
+    :return: Dict with the upload info and its decoded results, or None.
+    """
+    return IMPL.claim_spooled_upload(claim_timeout)
+
+
+def complete_spooled_upload(upload_id):
+    """Remove a spooled upload whose test results have been stored.
+
+    :param upload_id: ID of the upload.
+    """
+    return IMPL.complete_spooled_upload(upload_id)
+
+
+def release_spooled_upload(upload_id, error, failed=False):
+    """Return a claimed upload to the spool, or mark it as failed.
+
+    :param upload_id: ID of the upload.
+    :param error: Description of the error which prevented storing it.
+    :param failed: Whether the upload should not be retried.
+    """
+    return IMPL.release_spooled_upload(upload_id, error, failed=failed)
+
+
+def get_spooled_upload(upload_id):
+    """Get status information of a spooled upload.
+
+    :param upload_id: ID of the upload.
+    """
+    return IMPL.get_spooled_upload(upload_id)
+
+
+def purge_expired_sessions(table_name, accessed_before, batch_size):
+    """Delete user sessions which were not used since the given time.
+
+    :param table_name: Name of the session table.
+    :param accessed_before: Local time of the oldest session to keep.
+    :param batch_size: Number of sessions deleted by each transaction.
+    :return: Number of deleted sessions.
+    """
+    return IMPL.purge_expired_sessions(table_name, accessed_before,
+                                       batch_size)
 
 
 def get_test_result(test_id, allowed_keys=None):
@@ -119,6 +276,17 @@ def delete_test_result_meta_item(test_id, key):
     return IMPL.delete_test_result_meta_item(test_id, key)
 
 
+def get_test_result_owners(test_ids):
+    """Get ownership information for a batch of test runs.
+
+    :param test_ids: List of test run IDs.
+    :return: Dict mapping each found test ID to its product version ID,
+             owning organization ID, owner openid ('user') and sharing
+             flag ('shared').
+    """
+    return IMPL.get_test_result_owners(test_ids)
+
+
 def get_test_result_records(page_number, per_page, filters):
     """Get page with applied filters for uploaded test records.
 
@@ -129,6 +297,34 @@ def get_test_result_records(page_number, per_page, filters):
     return IMPL.get_test_result_records(page_number, per_page, filters)
 
 
+def get_test_result_records_by_cursor(position, limit, filters):
+    """Get uploaded test records that follow a keyset position.
+
+    Records are ordered by creation date and id, newest first.
+
+    :param position: (created_at, id) of the last seen record or None
+                     for the first page.
+    :param limit: The maximum number of records to return.
+    :param filters: (Dict) Filters that will be applied for records.
+    """
+    return IMPL.get_test_result_records_by_cursor(position, limit, filters)
+
+
+def get_test_result_sets(filters, limit=None):
+    """Get uploaded test records with their passed tests.
+
+    Records are ordered by creation date and id, newest first.
+
+    :param filters: (Dict) Filters that will be applied for records.
+    :param limit: The maximum number of records to return, if any.
+    :return: List of dicts with the 'id', 'cpid', 'created_at' and
+             'result_set_id' of each record, and its passed tests in
+             'results' as returned by get_test_results. Records sharing
+             a result set share the same 'results' list.
+    """
+    return IMPL.get_test_result_sets(filters, limit)
+
+
 def get_test_result_records_count(filters):
     """Get total pages number with applied filters for uploaded test records.
 
@@ -168,7 +364,10 @@ def store_pubkey(pubkey_info):
 
 def delete_pubkey(pubkey_id):
     """Delete public key from DB."""
-    return IMPL.delete_pubkey(pubkey_id)
+    try:
+        return IMPL.delete_pubkey(pubkey_id)
+    finally:
+        cache.clear_namespace(const.CACHE_PUBKEYS)
 
 
 def get_user_pubkeys(user_openid):
@@ -176,19 +375,33 @@ def get_user_pubkeys(user_openid):
     return IMPL.get_user_pubkeys(user_openid)
 
 
+def get_cache_generations():
+    """Get the current generation of each cache namespace."""
+    return IMPL.get_cache_generations()
+
+
 def add_user_to_group(user_openid, group_id, created_by_user):
     """Add specified user to specified group."""
-    return IMPL.add_user_to_group(user_openid, group_id, created_by_user)
+    try:
+        return IMPL.add_user_to_group(user_openid, group_id, created_by_user)
+    finally:
+        _get_membership_cache().delete(('member', group_id, user_openid))
 
 
 def remove_user_from_group(user_openid, group_id):
     """Remove specified user from specified group."""
-    return IMPL.remove_user_from_group(user_openid, group_id)
+    try:
+        return IMPL.remove_user_from_group(user_openid, group_id)
+    finally:
+        _get_membership_cache().delete(('member', group_id, user_openid))
 
 
 def add_organization(organization_info, creator):
     """Add organization."""
-    return IMPL.add_organization(organization_info, creator)
+    try:
+        return IMPL.add_organization(organization_info, creator)
+    finally:
+        _get_membership_cache().delete(('foundation_group',))
 
 
 def update_organization(organization_info):
@@ -203,7 +416,12 @@ def get_organization(organization_id, allowed_keys=None):
 
 def delete_organization(organization_id):
     """delete organization by id."""
-    return IMPL.delete_organization(organization_id)
+    try:
+        return IMPL.delete_organization(organization_id)
+    finally:
+        membership_cache = _get_membership_cache()
+        membership_cache.delete(('organization_group', organization_id))
+        membership_cache.delete(('foundation_group',))
 
 
 def add_product(product_info, creator):
@@ -236,6 +454,46 @@ def get_organization_users(organization_id):
     return IMPL.get_organization_users(organization_id)
 
 
+def is_foundation_user(user_openid):
+    """Check that user belongs to group of foundation."""
+    if not user_openid:
+        return False
+    group_id = _cached_membership(('foundation_group',),
+                                  IMPL.get_foundation_group_id)
+    if group_id is None:
+        return False
+    return _cached_membership(('member', group_id, user_openid),
+                              IMPL.is_user_in_group, user_openid, group_id)
+
+
+def is_organization_user(organization_id, user_openid):
+    """Check that user belongs to group of organization."""
+    group_id = _cached_membership(('organization_group', organization_id),
+                                  IMPL.get_organization_group_id,
+                                  organization_id)
+    if not user_openid:
+        return False
+    return _cached_membership(('member', group_id, user_openid),
+                              IMPL.is_user_in_group, user_openid, group_id)
+
+
+def is_product_admin(user_openid, product_id):
+    """Check that user belongs to group of the product's organization.
+
+    :raises NotFound: If the product does not exist, even for anonymous
+            users.
+    """
+    return IMPL.is_product_admin(user_openid, product_id)
+
+
+def rebuild_product_acl():
+    """Recompute the products each user can manage from vendor groups.
+
+    :return: Number of product rights after the rebuild.
+    """
+    return IMPL.rebuild_product_acl()
+
+
 def get_organizations(allowed_keys=None):
     """Get all organizations."""
     return IMPL.get_organizations(allowed_keys=allowed_keys)
@@ -0,0 +1,24 @@
+"""Add (created_at, id) index to test for keyset pagination.
+
+Revision ID: 268bda722935
+Revises: 6380a256e396
+Create Date: 2026-10-18 05:41:12
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '268bda722935'
+down_revision = '6380a256e396'
+MYSQL_CHARSET = 'utf8'
+
+from alembic import op
+
+
+def upgrade():
+    """Upgrade DB."""
+    op.create_index('ix_test_created_at_id', 'test', ['created_at', 'id'])
+
+
+def downgrade():
+    """Downgrade DB."""
+    op.drop_index('ix_test_created_at_id', 'test')
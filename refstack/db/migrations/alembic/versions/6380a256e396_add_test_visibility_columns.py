@@ -0,0 +1,91 @@
+"""Add denormalized owner and visibility columns to test.
+
+The owner_openid and is_shared columns mirror the 'user' and 'shared'
+metadata items of a test run, and visibility is derived from both so
+that listing public test runs is a single indexed range scan. Existing
+rows are backfilled in batches walking the meta table by primary key.
+
+Revision ID: 6380a256e396
+Revises: 434be17a6ec3
+Create Date: 2026-10-18 05:22:39
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '6380a256e396'
+down_revision = '434be17a6ec3'
+MYSQL_CHARSET = 'utf8'
+
+from alembic import op
+import sqlalchemy as sa
+
+BATCH_SIZE = 1000
+TEST_PRIVATE = 0
+TEST_PUBLIC = 1
+
+
+def upgrade():
+    """Upgrade DB."""
+    op.add_column('test', sa.Column('owner_openid', sa.String(128),
+                                    nullable=True))
+    op.add_column('test', sa.Column('is_shared', sa.Boolean(),
+                                    nullable=False,
+                                    server_default=sa.false()))
+    op.add_column('test', sa.Column('visibility', sa.Integer(),
+                                    nullable=False,
+                                    server_default=str(TEST_PUBLIC)))
+    op.create_index('ix_test_visibility_created_at', 'test',
+                    ['visibility', 'created_at'])
+    op.create_index('ix_test_owner_openid_created_at', 'test',
+                    ['owner_openid', 'created_at'])
+
+    meta = sa.table('meta',
+                    sa.column('_id', sa.Integer),
+                    sa.column('test_id', sa.String),
+                    sa.column('meta_key', sa.String),
+                    sa.column('value', sa.Text))
+    test = sa.table('test',
+                    sa.column('id', sa.String),
+                    sa.column('owner_openid', sa.String),
+                    sa.column('is_shared', sa.Boolean),
+                    sa.column('visibility', sa.Integer))
+    set_owner = (test.update()
+                 .where(test.c.id == sa.bindparam('_test_id'))
+                 .values(owner_openid=sa.bindparam('_value'),
+                         visibility=sa.case(
+                             [(test.c.is_shared == sa.true(), TEST_PUBLIC)],
+                             else_=TEST_PRIVATE)))
+    set_shared = (test.update()
+                  .where(test.c.id == sa.bindparam('_test_id'))
+                  .values(is_shared=True, visibility=TEST_PUBLIC))
+
+    conn = op.get_bind()
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select([meta.c._id, meta.c.test_id,
+                       meta.c.meta_key, meta.c.value])
+            .where(meta.c._id > last_id)
+            .where(meta.c.meta_key.in_(('user', 'shared')))
+            .order_by(meta.c._id)
+            .limit(BATCH_SIZE)).fetchall()
+        if not rows:
+            break
+        owners = [{'_test_id': row.test_id, '_value': row.value}
+                  for row in rows if row.meta_key == 'user']
+        shared = [{'_test_id': row.test_id}
+                  for row in rows if row.meta_key == 'shared']
+        if owners:
+            conn.execute(set_owner, owners)
+        if shared:
+            conn.execute(set_shared, shared)
+        last_id = rows[-1]._id
+
+
+def downgrade():
+    """Downgrade DB."""
+    op.drop_index('ix_test_owner_openid_created_at', 'test')
+    op.drop_index('ix_test_visibility_created_at', 'test')
+    op.drop_column('test', 'visibility')
+    op.drop_column('test', 'is_shared')
+    op.drop_column('test', 'owner_openid')
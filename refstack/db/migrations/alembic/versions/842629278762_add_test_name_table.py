@@ -0,0 +1,168 @@
+"""Move test names of results into a test_name dictionary table.
+
+Nearly every upload repeats the same test names, so results now only
+reference a row of the test_name table. Existing results are converted
+in chunks of rows which still have no name_id, and every schema step is
+skipped if it was already applied, so an interrupted upgrade can simply
+be run again.
+
+Revision ID: 842629278762
+Revises: 268bda722935
+Create Date: 2026-10-18 06:02:51
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '842629278762'
+down_revision = '268bda722935'
+MYSQL_CHARSET = 'utf8'
+
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+BATCH_SIZE = 1000
+
+test_name = sa.table('test_name',
+                     sa.column('id', sa.Integer),
+                     sa.column('created_at', sa.DateTime),
+                     sa.column('name', sa.String),
+                     sa.column('uuid', sa.String))
+results = sa.table('results',
+                   sa.column('_id', sa.Integer),
+                   sa.column('name_id', sa.Integer),
+                   sa.column('name', sa.String),
+                   sa.column('uuid', sa.String))
+
+
+def _lookup_name_ids(conn, names):
+    """Get ids of known (name, uuid) pairs."""
+    rows = conn.execute(
+        sa.select([test_name.c.id, test_name.c.name, test_name.c.uuid])
+        .where(test_name.c.name.in_(set(name for name, _ in names))))
+    return {(row.name, row.uuid): row.id for row in rows
+            if (row.name, row.uuid) in names}
+
+
+def _convert_chunk(conn, rows):
+    """Point a chunk of results rows to their test_name rows."""
+    names = set((row.name or '', row.uuid or '') for row in rows)
+    name_ids = _lookup_name_ids(conn, names)
+    missing = names - set(name_ids)
+    if missing:
+        now = datetime.datetime.utcnow()
+        conn.execute(test_name.insert(),
+                     [{'name': name, 'uuid': uuid, 'created_at': now}
+                      for name, uuid in missing])
+        name_ids.update(_lookup_name_ids(conn, missing))
+    conn.execute(
+        results.update()
+        .where(results.c._id == sa.bindparam('_row_id'))
+        .values(name_id=sa.bindparam('_name_id')),
+        [{'_row_id': row._id,
+          '_name_id': name_ids[(row.name or '', row.uuid or '')]}
+         for row in rows])
+
+
+def _convert_results(conn):
+    """Fill results.name_id in chunks, committing every chunk."""
+    if conn.dialect.name == 'mysql':
+        # MySQL has implicitly committed the schema changes made so far,
+        # so use a separate connection to keep the progress of every
+        # converted chunk even if the upgrade is interrupted.
+        chunk_conn = conn.engine.connect()
+    else:
+        chunk_conn = conn
+    try:
+        last_id = 0
+        while True:
+            rows = chunk_conn.execute(
+                sa.select([results.c._id, results.c.name, results.c.uuid])
+                .where(results.c.name_id.is_(None))
+                .where(results.c._id > last_id)
+                .order_by(results.c._id)
+                .limit(BATCH_SIZE)).fetchall()
+            if not rows:
+                break
+            with chunk_conn.begin():
+                _convert_chunk(chunk_conn, rows)
+            last_id = rows[-1]._id
+    finally:
+        if chunk_conn is not conn:
+            chunk_conn.close()
+
+
+def upgrade():
+    """Upgrade DB."""
+    conn = op.get_bind()
+    if 'test_name' not in sa.inspect(conn).get_table_names():
+        op.create_table(
+            'test_name',
+            sa.Column('updated_at', sa.DateTime()),
+            sa.Column('deleted_at', sa.DateTime()),
+            sa.Column('deleted', sa.Integer, default=0),
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('name',
+                      sa.String(length=512, collation='latin1_bin'),
+                      nullable=False),
+            sa.Column('uuid', sa.String(length=36), nullable=False,
+                      server_default=''),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('name', 'uuid',
+                                name='uq_test_name_name_uuid'),
+            mysql_charset=MYSQL_CHARSET
+        )
+
+    columns = [c['name'] for c in sa.inspect(conn).get_columns('results')]
+    if 'name_id' not in columns:
+        op.add_column('results', sa.Column('name_id', sa.Integer(),
+                                           nullable=True))
+    if 'name' not in columns:
+        # Conversion has already been completed.
+        return
+
+    _convert_results(conn)
+
+    op.alter_column('results', 'name_id', existing_type=sa.Integer(),
+                    nullable=False)
+    indexes = [i['name'] for i in sa.inspect(conn).get_indexes('results')]
+    if 'ix_results_name_id' not in indexes:
+        op.create_index('ix_results_name_id', 'results', ['name_id'])
+    foreign_keys = [fk['name'] for fk in
+                    sa.inspect(conn).get_foreign_keys('results')]
+    if 'fk_results_name_id' not in foreign_keys:
+        op.create_foreign_key('fk_results_name_id', 'results', 'test_name',
+                              ['name_id'], ['id'])
+    unique_constraints = sa.inspect(conn).get_unique_constraints('results')
+    if 'uq_results_test_id_name_id' not in [uc['name'] for uc in
+                                            unique_constraints]:
+        op.create_unique_constraint('uq_results_test_id_name_id', 'results',
+                                    ['test_id', 'name_id'])
+    for uc in unique_constraints:
+        if uc['column_names'] == ['test_id', 'name']:
+            op.drop_constraint(uc['name'], 'results', type_='unique')
+    op.drop_column('results', 'uuid')
+    op.drop_column('results', 'name')
+
+
+def downgrade():
+    """Downgrade DB."""
+    op.add_column('results', sa.Column('name', sa.String(
+        length=512, collation='latin1_swedish_ci'), nullable=True))
+    op.add_column('results', sa.Column('uuid', sa.String(length=36),
+                                       nullable=True))
+    conn = op.get_bind()
+    conn.execute(results.update().values(
+        name=sa.select([test_name.c.name])
+        .where(test_name.c.id == results.c.name_id).as_scalar(),
+        uuid=sa.select([sa.func.nullif(test_name.c.uuid, '')])
+        .where(test_name.c.id == results.c.name_id).as_scalar()))
+    op.create_unique_constraint('test_id', 'results', ['test_id', 'name'])
+    op.drop_constraint('uq_results_test_id_name_id', 'results',
+                       type_='unique')
+    op.drop_constraint('fk_results_name_id', 'results', type_='foreignkey')
+    op.drop_index('ix_results_name_id', 'results')
+    op.drop_column('results', 'name_id')
+    op.drop_table('test_name')
@@ -0,0 +1,44 @@
+"""Create result_upload table for asynchronous uploads.
+
+Revision ID: 94b2cb4efcdb
+Revises: 842629278762
+Create Date: 2026-10-18 06:48:10
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '94b2cb4efcdb'
+down_revision = '842629278762'
+MYSQL_CHARSET = 'utf8'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    """Upgrade DB."""
+    op.create_table(
+        'result_upload',
+        sa.Column('updated_at', sa.DateTime()),
+        sa.Column('deleted_at', sa.DateTime()),
+        sa.Column('deleted', sa.Integer, default=0),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('id', sa.String(36), nullable=False),
+        sa.Column('status', sa.String(16), nullable=False),
+        sa.Column('openid', sa.String(128), nullable=True),
+        sa.Column('data', sa.LargeBinary(length=2 ** 32 - 1),
+                  nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False,
+                  server_default='0'),
+        sa.Column('claimed_at', sa.DateTime(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.Index('ix_result_upload_status_created_at',
+                 'status', 'created_at'),
+        mysql_charset=MYSQL_CHARSET
+    )
+
+
+def downgrade():
+    """Downgrade DB."""
+    op.drop_table('result_upload')
@@ -0,0 +1,209 @@
+"""Share identical lists of passing tests between test runs.
+
+Results rows now belong to a result_set identified by the digest of its
+sorted (name, uuid) pairs, and test runs reference a result set instead
+of owning their results rows. Existing test runs are converted in chunks
+of runs which still have no result_set_id, and every schema step is
+skipped if it was already applied, so an interrupted upgrade can simply
+be run again.
+
+Revision ID: a8f0c2d5e7b1
+Revises: 94b2cb4efcdb
+Create Date: 2026-10-18 07:31:24
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'a8f0c2d5e7b1'
+down_revision = '94b2cb4efcdb'
+MYSQL_CHARSET = 'utf8'
+
+import datetime
+import hashlib
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+BATCH_SIZE = 100
+
+test = sa.table('test',
+                sa.column('id', sa.String),
+                sa.column('result_set_id', sa.Integer))
+test_name = sa.table('test_name',
+                     sa.column('id', sa.Integer),
+                     sa.column('name', sa.String),
+                     sa.column('uuid', sa.String))
+result_set = sa.table('result_set',
+                      sa.column('id', sa.Integer),
+                      sa.column('created_at', sa.DateTime),
+                      sa.column('digest', sa.String),
+                      sa.column('ref_count', sa.Integer))
+results = sa.table('results',
+                   sa.column('_id', sa.Integer),
+                   sa.column('created_at', sa.DateTime),
+                   sa.column('test_id', sa.String),
+                   sa.column('result_set_id', sa.Integer),
+                   sa.column('name_id', sa.Integer))
+
+
+def _digest(names):
+    """Compute the digest of (name, uuid) pairs as the API does."""
+    canonical = json.dumps(sorted(names), separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _convert_test(conn, test_id):
+    """Point a test run to the result set of its passing tests."""
+    names = [(row.name, row.uuid) for row in conn.execute(
+        sa.select([test_name.c.name, test_name.c.uuid])
+        .select_from(results.join(test_name,
+                                  test_name.c.id == results.c.name_id))
+        .where(results.c.test_id == test_id))]
+    digest = _digest(names)
+    result_set_id = conn.execute(
+        sa.select([result_set.c.id]).where(result_set.c.digest == digest)
+    ).scalar()
+    if result_set_id is None:
+        result_set_id = conn.execute(result_set.insert().values(
+            digest=digest, ref_count=1,
+            created_at=datetime.datetime.utcnow())).inserted_primary_key[0]
+        conn.execute(results.update()
+                     .where(results.c.test_id == test_id)
+                     .values(result_set_id=result_set_id))
+    else:
+        conn.execute(results.delete().where(results.c.test_id == test_id))
+        conn.execute(result_set.update()
+                     .where(result_set.c.id == result_set_id)
+                     .values(ref_count=result_set.c.ref_count + 1))
+    conn.execute(test.update().where(test.c.id == test_id)
+                 .values(result_set_id=result_set_id))
+
+
+def _convert_tests(conn):
+    """Fill test.result_set_id in chunks, committing every chunk."""
+    if conn.dialect.name == 'mysql':
+        # MySQL has implicitly committed the schema changes made so far,
+        # so use a separate connection to keep the progress of every
+        # converted chunk even if the upgrade is interrupted.
+        chunk_conn = conn.engine.connect()
+    else:
+        chunk_conn = conn
+    try:
+        last_id = ''
+        while True:
+            test_ids = [row.id for row in chunk_conn.execute(
+                sa.select([test.c.id])
+                .where(test.c.result_set_id.is_(None))
+                .where(test.c.id > last_id)
+                .order_by(test.c.id)
+                .limit(BATCH_SIZE))]
+            if not test_ids:
+                break
+            with chunk_conn.begin():
+                for test_id in test_ids:
+                    _convert_test(chunk_conn, test_id)
+            last_id = test_ids[-1]
+    finally:
+        if chunk_conn is not conn:
+            chunk_conn.close()
+
+
+def upgrade():
+    """Upgrade DB."""
+    conn = op.get_bind()
+    if 'result_set' not in sa.inspect(conn).get_table_names():
+        op.create_table(
+            'result_set',
+            sa.Column('updated_at', sa.DateTime()),
+            sa.Column('deleted_at', sa.DateTime()),
+            sa.Column('deleted', sa.Integer, default=0),
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('digest', sa.String(length=64), nullable=False),
+            sa.Column('ref_count', sa.Integer(), nullable=False,
+                      server_default='0'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('digest', name='uq_result_set_digest'),
+            mysql_charset=MYSQL_CHARSET
+        )
+
+    test_columns = [c['name'] for c in sa.inspect(conn).get_columns('test')]
+    if 'result_set_id' not in test_columns:
+        op.add_column('test', sa.Column('result_set_id', sa.Integer(),
+                                        nullable=True))
+    columns = [c['name'] for c in sa.inspect(conn).get_columns('results')]
+    if 'result_set_id' not in columns:
+        op.add_column('results', sa.Column('result_set_id', sa.Integer(),
+                                           nullable=True))
+    if 'test_id' in columns:
+        _convert_tests(conn)
+
+        op.alter_column('results', 'result_set_id',
+                        existing_type=sa.Integer(), nullable=False)
+        for uc in sa.inspect(conn).get_unique_constraints('results'):
+            if uc['name'] == 'uq_results_test_id_name_id':
+                op.drop_constraint(uc['name'], 'results', type_='unique')
+        for fk in sa.inspect(conn).get_foreign_keys('results'):
+            if fk['referred_table'] == 'test':
+                op.drop_constraint(fk['name'], 'results',
+                                   type_='foreignkey')
+        op.drop_column('results', 'test_id')
+
+    indexes = [i['name'] for i in sa.inspect(conn).get_indexes('results')]
+    if 'ix_results_result_set_id' not in indexes:
+        op.create_index('ix_results_result_set_id', 'results',
+                        ['result_set_id'])
+    foreign_keys = [fk['name'] for fk in
+                    sa.inspect(conn).get_foreign_keys('results')]
+    if 'fk_results_result_set_id' not in foreign_keys:
+        op.create_foreign_key('fk_results_result_set_id', 'results',
+                              'result_set', ['result_set_id'], ['id'])
+    unique_constraints = [uc['name'] for uc in
+                          sa.inspect(conn).get_unique_constraints('results')]
+    if 'uq_results_result_set_id_name_id' not in unique_constraints:
+        op.create_unique_constraint('uq_results_result_set_id_name_id',
+                                    'results', ['result_set_id', 'name_id'])
+
+    indexes = [i['name'] for i in sa.inspect(conn).get_indexes('test')]
+    if 'ix_test_result_set_id' not in indexes:
+        op.create_index('ix_test_result_set_id', 'test', ['result_set_id'])
+    foreign_keys = [fk['name'] for fk in
+                    sa.inspect(conn).get_foreign_keys('test')]
+    if 'fk_test_result_set_id' not in foreign_keys:
+        op.create_foreign_key('fk_test_result_set_id', 'test', 'result_set',
+                              ['result_set_id'], ['id'])
+
+
+def downgrade():
+    """Downgrade DB."""
+    op.add_column('results', sa.Column('test_id', sa.String(length=36),
+                                       nullable=True))
+    op.drop_constraint('uq_results_result_set_id_name_id', 'results',
+                       type_='unique')
+    op.drop_constraint('fk_results_result_set_id', 'results',
+                       type_='foreignkey')
+    op.drop_index('ix_results_result_set_id', 'results')
+    op.alter_column('results', 'result_set_id', existing_type=sa.Integer(),
+                    nullable=True)
+
+    # Give every test run its own copy of the results of its set.
+    conn = op.get_bind()
+    conn.execute(results.insert().from_select(
+        ['created_at', 'test_id', 'name_id'],
+        sa.select([sa.literal(datetime.datetime.utcnow()), test.c.id,
+                   results.c.name_id])
+        .select_from(test.join(
+            results, results.c.result_set_id == test.c.result_set_id))))
+    conn.execute(results.delete().where(results.c.test_id.is_(None)))
+
+    op.drop_column('results', 'result_set_id')
+    op.alter_column('results', 'test_id', existing_type=sa.String(36),
+                    nullable=False)
+    op.create_foreign_key(None, 'results', 'test', ['test_id'], ['id'])
+    op.create_unique_constraint('uq_results_test_id_name_id', 'results',
+                                ['test_id', 'name_id'])
+    op.drop_constraint('fk_test_result_set_id', 'test', type_='foreignkey')
+    op.drop_index('ix_test_result_set_id', 'test')
+    op.drop_column('test', 'result_set_id')
+    op.drop_table('result_set')
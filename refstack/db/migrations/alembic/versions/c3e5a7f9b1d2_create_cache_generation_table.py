@@ -0,0 +1,41 @@
+"""Create cache_generation table for cross-process cache coherence.
+
+Revision ID: c3e5a7f9b1d2
+Revises: a8f0c2d5e7b1
+Create Date: 2026-10-18 08:12:37
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c3e5a7f9b1d2'
+down_revision = 'a8f0c2d5e7b1'
+MYSQL_CHARSET = 'utf8'
+
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    """Upgrade DB."""
+    cache_generation = op.create_table(
+        'cache_generation',
+        sa.Column('updated_at', sa.DateTime()),
+        sa.Column('deleted_at', sa.DateTime()),
+        sa.Column('deleted', sa.Integer, default=0),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('namespace', sa.String(64), nullable=False),
+        sa.Column('generation', sa.BigInteger(), nullable=False,
+                  server_default='0'),
+        sa.PrimaryKeyConstraint('namespace'),
+        mysql_charset=MYSQL_CHARSET
+    )
+    op.bulk_insert(cache_generation,
+                   [{'namespace': 'membership', 'generation': 0,
+                     'created_at': datetime.datetime.utcnow()}])
+
+
+def downgrade():
+    """Downgrade DB."""
+    op.drop_table('cache_generation')
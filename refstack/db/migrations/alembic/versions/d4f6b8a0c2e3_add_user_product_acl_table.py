@@ -0,0 +1,64 @@
+"""Add user_product_acl table with product management rights.
+
+Revision ID: d4f6b8a0c2e3
+Revises: c3e5a7f9b1d2
+Create Date: 2026-10-18 09:03:51
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'd4f6b8a0c2e3'
+down_revision = 'c3e5a7f9b1d2'
+MYSQL_CHARSET = 'utf8'
+
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    """Upgrade DB."""
+    acl = op.create_table(
+        'user_product_acl',
+        sa.Column('updated_at', sa.DateTime()),
+        sa.Column('deleted_at', sa.DateTime()),
+        sa.Column('deleted', sa.Integer, default=0),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('user_openid', sa.String(128), nullable=False),
+        sa.Column('product_id', sa.String(36), nullable=False),
+        sa.Column('organization_id', sa.String(36), nullable=False),
+        sa.PrimaryKeyConstraint('user_openid', 'product_id'),
+        sa.ForeignKeyConstraint(['user_openid'], ['user.openid'], ),
+        sa.ForeignKeyConstraint(['product_id'], ['product.id'], ),
+        sa.ForeignKeyConstraint(['organization_id'], ['organization.id'], ),
+        sa.Index('ix_user_product_acl_product_id_user_openid',
+                 'product_id', 'user_openid'),
+        sa.Index('ix_user_product_acl_organization_id', 'organization_id'),
+        mysql_charset=MYSQL_CHARSET
+    )
+
+    member = sa.table('user_to_group',
+                      sa.column('user_openid'), sa.column('group_id'))
+    organization = sa.table('organization',
+                            sa.column('id'), sa.column('group_id'))
+    product = sa.table('product',
+                       sa.column('id'), sa.column('organization_id'))
+    rights = (sa.select([member.c.user_openid, product.c.id,
+                         product.c.organization_id,
+                         sa.literal(datetime.datetime.utcnow()),
+                         sa.literal(0)])
+              .select_from(
+                  product
+                  .join(organization,
+                        organization.c.id == product.c.organization_id)
+                  .join(member, member.c.group_id == organization.c.group_id))
+              .distinct())
+    op.execute(acl.insert().from_select(
+        ['user_openid', 'product_id', 'organization_id', 'created_at',
+         'deleted'], rights))
+
+
+def downgrade():
+    """Downgrade DB."""
+    op.drop_table('user_product_acl')
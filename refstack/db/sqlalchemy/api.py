@@ -16,14 +16,19 @@
 """Implementation of SQLAlchemy backend."""
 
 import base64
+import datetime
 import hashlib
+import json
 import sys
 import uuid
 
 from oslo_config import cfg
+from oslo_db import exception as db_exc
 from oslo_db import options as db_options
 from oslo_db.sqlalchemy import session as db_session
 from oslo_log import log
+from oslo_utils import timeutils
+import sqlalchemy as sa
 
 
 from refstack.api import constants as api_const
@@ -35,6 +40,9 @@ CONF = cfg.CONF
 _FACADE = None
 LOG = log.getLogger(__name__)
 
+# Maximum number of test names looked up with a single IN clause.
+TEST_NAME_LOOKUP_CHUNK = 500
+
 db_options.set_defaults(cfg.CONF)
 
 
@@ -109,30 +117,305 @@ def _to_dict(sqlalchemy_object, allowed_keys=None):
     return sqlalchemy_object
 
 
-def store_test_results(results):
-    """Store test results."""
-    test = models.Test()
-    test_id = str(uuid.uuid4())
-    test.id = test_id
-    test.cpid = results.get('cpid')
-    test.duration_seconds = results.get('duration_seconds')
-    test.product_version_id = results.get('product_version_id')
+def _update_test_visibility(test):
+    """Derive visibility of a test run from its owner and sharing state."""
+    if test.owner_openid and not test.is_shared:
+        test.visibility = api_const.TEST_PRIVATE
+    else:
+        test.visibility = api_const.TEST_PUBLIC
+
+
+def _sync_test_meta_columns(session, test_id, key, value):
+    """Keep denormalized owner/sharing columns of a test run in sync."""
+    if key not in (api_const.USER, api_const.SHARED_TEST_RUN):
+        return
+    test = session.query(models.Test).filter_by(id=test_id).first()
+    if test is None:
+        return
+    if key == api_const.USER:
+        test.owner_openid = value
+    else:
+        test.is_shared = value is not None
+    _update_test_visibility(test)
+    test.save(session)
+
+
+def _lookup_test_name_ids(session, names):
+    """Get ids of already known (name, uuid) pairs."""
+    name_ids = {}
+    distinct_names = sorted(set(name for name, _ in names))
+    for i in range(0, len(distinct_names), TEST_NAME_LOOKUP_CHUNK):
+        chunk = distinct_names[i:i + TEST_NAME_LOOKUP_CHUNK]
+        rows = (session.query(models.TestName.id, models.TestName.name,
+                              models.TestName.uuid)
+                .filter(models.TestName.name.in_(chunk)).all())
+        for row in rows:
+            if (row.name, row.uuid) in names:
+                name_ids[(row.name, row.uuid)] = row.id
+    return name_ids
+
+
+def _get_test_name_ids(session, names):
+    """Resolve (name, uuid) pairs to test_name ids, adding unknown ones."""
+    names = set(names)
+    name_ids = _lookup_test_name_ids(session, names)
+    missing = [{'name': name, 'uuid': test_uuid}
+               for name, test_uuid in sorted(names - set(name_ids))]
+    if missing:
+        insert = models.TestName.__table__.insert()
+        try:
+            with session.begin_nested():
+                session.execute(insert, missing)
+        except db_exc.DBDuplicateEntry:
+            # Some of the names were added by a concurrent upload,
+            # so add the rest of them one by one.
+            for row in missing:
+                try:
+                    with session.begin_nested():
+                        session.execute(insert, row)
+                except db_exc.DBDuplicateEntry:
+                    pass
+        name_ids.update(_lookup_test_name_ids(
+            session, set((row['name'], row['uuid']) for row in missing)))
+    return name_ids
+
+
+def _result_set_digest(names):
+    """Compute the content address of a list of (name, uuid) pairs."""
+    canonical = json.dumps(sorted(names), separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _insert_result_set_items(session, result_set_id, names):
+    """Insert passing tests of a new result set."""
+    batch_size = max(CONF.results_insert_batch_size, 1)
+    name_ids = _get_test_name_ids(session, names)
+    result_rows = [{'result_set_id': result_set_id, 'name_id': name_ids[name]}
+                   for name in names]
+    for i in range(0, len(result_rows), batch_size):
+        session.execute(models.TestResults.__table__.insert(),
+                        result_rows[i:i + batch_size])
+
+
+def _get_result_set_id(session, names):
+    """Reference the result set with the given passing tests.
+
+    The set is looked up by the digest of its tests and added if it is
+    new. Its reference count is incremented for the new test run.
+    """
+    digest = _result_set_digest(names)
+    query = (session.query(models.ResultSet)
+             .filter_by(digest=digest).with_for_update())
+    result_set = query.first()
+    if result_set is None:
+        try:
+            with session.begin_nested():
+                result_set_id = session.execute(
+                    models.ResultSet.__table__.insert(),
+                    {'digest': digest, 'ref_count': 1}
+                ).inserted_primary_key[0]
+        except db_exc.DBDuplicateEntry:
+            # The same set was added by a concurrent upload.
+            result_set = query.first()
+        else:
+            _insert_result_set_items(session, result_set_id, names)
+            return result_set_id
+    (session.query(models.ResultSet).filter_by(id=result_set.id)
+     .update({'ref_count': models.ResultSet.ref_count + 1},
+             synchronize_session=False))
+    return result_set.id
+
+
+def _release_result_set(session, result_set_id):
+    """Drop a reference to a result set, deleting the set when unused."""
+    result_set = (session.query(models.ResultSet)
+                  .filter_by(id=result_set_id).with_for_update().first())
+    if result_set is None:
+        return
+    if result_set.ref_count > 1:
+        (session.query(models.ResultSet).filter_by(id=result_set_id)
+         .update({'ref_count': models.ResultSet.ref_count - 1},
+                 synchronize_session=False))
+    else:
+        session.query(models.TestResults) \
+            .filter_by(result_set_id=result_set_id).delete()
+        session.query(models.ResultSet) \
+            .filter_by(id=result_set_id).delete()
+
+
+def _insert_test_results(session, results, test_id):
+    """Insert rows of a test run within the current transaction.
+
+    Rows of the test run and its metadata are written with Core INSERT
+    statements. Passing tests are stored once per distinct list in a
+    shared result set, in batches of CONF.results_insert_batch_size rows.
+    """
+    meta = results.get('meta', {})
+    test = models.Test(id=test_id,
+                       cpid=results.get('cpid'),
+                       duration_seconds=results.get('duration_seconds'),
+                       product_version_id=results.get('product_version_id'),
+                       owner_openid=meta.get(api_const.USER),
+                       is_shared=api_const.SHARED_TEST_RUN in meta)
+    _update_test_visibility(test)
+    test_row = {key: getattr(test, key) for key in
+                ('id', 'cpid', 'duration_seconds', 'product_version_id',
+                 'owner_openid', 'is_shared', 'visibility')}
+    meta_rows = [{'test_id': test_id, 'meta_key': k, 'value': v}
+                 for k, v in meta.items()]
+    names = [(result['name'], result.get('uuid') or '')
+             for result in results.get('results', [])]
+    # Result sets are shared by test runs, so the former unique constraint
+    # on the case-insensitive test names of a run is checked here.
+    if len(set(name.lower() for name, _ in names)) != len(names):
+        raise db_exc.DBDuplicateEntry(columns=['name'])
+
+    test_row['result_set_id'] = _get_result_set_id(session, names)
+    session.execute(models.Test.__table__.insert(), test_row)
+    if meta_rows:
+        session.execute(models.TestMeta.__table__.insert(), meta_rows)
+
+
+def store_test_results(results, test_id=None):
+    """Store test results in a single transaction."""
+    test_id = test_id or str(uuid.uuid4())
     session = get_session()
-    with session.begin():
-        for result in results.get('results', []):
-            test_result = models.TestResults()
-            test_result.test_id = test_id
-            test_result.name = result['name']
-            test_result.uuid = result.get('uuid', None)
-            test.results.append(test_result)
-        for k, v in results.get('meta', {}).items():
-            meta = models.TestMeta()
-            meta.meta_key, meta.value = k, v
-            test.meta.append(meta)
-        test.save(session)
+    try:
+        with session.begin():
+            _insert_test_results(session, results, test_id)
+    except db_exc.DBDuplicateEntry:
+        raise Duplication('Test results contain duplicate entries.')
     return test_id
 
 
+def store_test_results_batch(results_list):
+    """Store several test runs, committing them in chunks.
+
+    Each run is stored in a savepoint, so that a run which can not be
+    stored is rolled back and reported as an item error without
+    preventing storing the rest of its chunk.
+    """
+    chunk_size = max(CONF.results_batch_chunk_size, 1)
+    stored = []
+    session = get_session()
+    for i in range(0, len(results_list), chunk_size):
+        with session.begin():
+            for results in results_list[i:i + chunk_size]:
+                test_id = str(uuid.uuid4())
+                try:
+                    with session.begin_nested():
+                        _insert_test_results(session, results, test_id)
+                except db_exc.DBDuplicateEntry:
+                    stored.append(
+                        {'error': 'Test results contain duplicate entries.'})
+                except db_exc.DBError:
+                    LOG.exception('Failed to store test results %s.',
+                                  test_id)
+                    stored.append(
+                        {'error': 'Test results could not be stored.'})
+                else:
+                    stored.append({'test_id': test_id})
+    return stored
+
+
+def spool_test_results(results, openid=None):
+    """Save test results to be stored later by an ingestion worker."""
+    upload = models.ResultUpload()
+    upload.id = str(uuid.uuid4())
+    upload.status = api_const.UPLOAD_PENDING
+    upload.openid = openid
+    upload.data = json.dumps(results).encode('utf-8')
+    session = get_session()
+    with session.begin():
+        upload.save(session)
+    return upload.id
+
+
+def claim_spooled_upload(claim_timeout):
+    """Claim the oldest spooled upload which no worker is processing.
+
+    Uploads claimed more than claim_timeout seconds ago are considered
+    abandoned by their worker and can be claimed again.
+    """
+    session = get_session()
+    now = timeutils.utcnow()
+    stale = now - datetime.timedelta(seconds=claim_timeout)
+    candidates = (
+        session.query(models.ResultUpload.id, models.ResultUpload.status,
+                      models.ResultUpload.claimed_at)
+        .filter(sa.or_(
+            models.ResultUpload.status == api_const.UPLOAD_PENDING,
+            sa.and_(
+                models.ResultUpload.status == api_const.UPLOAD_PROCESSING,
+                models.ResultUpload.claimed_at < stale)))
+        .order_by(models.ResultUpload.created_at)
+        .limit(10).all())
+    for candidate in candidates:
+        # Only one worker can win the update of an unchanged row.
+        claimed = (
+            session.query(models.ResultUpload)
+            .filter_by(id=candidate.id, status=candidate.status,
+                       claimed_at=candidate.claimed_at)
+            .update({'status': api_const.UPLOAD_PROCESSING,
+                     'claimed_at': now,
+                     'attempts': models.ResultUpload.attempts + 1},
+                    synchronize_session=False))
+        if claimed:
+            upload = (session.query(models.ResultUpload)
+                      .filter_by(id=candidate.id).first())
+            upload_info = _to_dict(upload)
+            upload_info['results'] = json.loads(upload.data.decode('utf-8'))
+            return upload_info
+    return None
+
+
+def complete_spooled_upload(upload_id):
+    """Remove a spooled upload whose test results have been stored."""
+    session = get_session()
+    with session.begin():
+        session.query(models.ResultUpload).filter_by(id=upload_id).delete()
+
+
+def release_spooled_upload(upload_id, error, failed=False):
+    """Return a claimed upload to the spool, or mark it as failed."""
+    session = get_session()
+    with session.begin():
+        session.query(models.ResultUpload).filter_by(id=upload_id).update(
+            {'status': (api_const.UPLOAD_FAILED if failed
+                        else api_const.UPLOAD_PENDING),
+             'claimed_at': None,
+             'error': error},
+            synchronize_session=False)
+
+
+def get_spooled_upload(upload_id):
+    """Get status information of a spooled upload."""
+    session = get_session()
+    upload = session.query(models.ResultUpload).filter_by(id=upload_id).first()
+    if not upload:
+        raise NotFound('Upload %s not found' % upload_id)
+    return _to_dict(upload)
+
+
+def purge_expired_sessions(table_name, accessed_before, batch_size):
+    """Delete beaker sessions last accessed before the given time."""
+    table = sa.table(table_name, sa.column('id'), sa.column('accessed'))
+    expired = (sa.select([table.c.id])
+               .where(table.c.accessed < accessed_before)
+               .limit(max(batch_size, 1)))
+    session = get_session()
+    purged = 0
+    while True:
+        # Short transactions keep the table available to API servers.
+        with session.begin():
+            ids = [row.id for row in session.execute(expired)]
+            if ids:
+                session.execute(table.delete().where(table.c.id.in_(ids)))
+        if not ids:
+            return purged
+        purged += len(ids)
+
+
 def get_test_result(test_id, allowed_keys=None):
     """Get test info."""
     session = get_session()
@@ -152,9 +435,12 @@ def delete_test_result(test_id):
         if test:
             session.query(models.TestMeta) \
                 .filter_by(test_id=test_id).delete()
-            session.query(models.TestResults) \
-                .filter_by(test_id=test_id).delete()
+            result_set_id = test.result_set_id
             session.delete(test)
+            if result_set_id is not None:
+                # The test run must be gone before its set can be deleted.
+                session.flush()
+                _release_result_set(session, result_set_id)
         else:
             raise NotFound('Test result %s not found' % test_id)
 
@@ -199,6 +485,7 @@ def save_test_result_meta_item(test_id, key, value):
     meta_item.value = value
     with session.begin():
         meta_item.save(session)
+        _sync_test_meta_columns(session, test_id, key, value)
 
 
 def delete_test_result_meta_item(test_id, key):
@@ -211,6 +498,7 @@ def delete_test_result_meta_item(test_id, key):
     if meta_item:
         with session.begin():
             session.delete(meta_item)
+            _sync_test_meta_columns(session, test_id, key, None)
     else:
         raise NotFound('Metadata key %s '
                        'not found for test run %s' % (key, test_id))
@@ -219,10 +507,41 @@ def delete_test_result_meta_item(test_id, key):
 def get_test_results(test_id):
     """Get test results."""
     session = get_session()
-    results = session.query(models.TestResults). \
-        filter_by(test_id=test_id). \
+    results = session.query(models.TestName.name, models.TestName.uuid). \
+        join(models.TestResults,
+             models.TestResults.name_id == models.TestName.id). \
+        join(models.Test,
+             models.Test.result_set_id == models.TestResults.result_set_id). \
+        filter(models.Test.id == test_id). \
         all()
-    return [_to_dict(result) for result in results]
+    return [{'name': result.name, 'uuid': result.uuid or None}
+            for result in results]
+
+
+def get_test_result_owners(test_ids):
+    """Get ownership information for a batch of test runs."""
+    owners = {}
+    if not test_ids:
+        return owners
+    session = get_session()
+    tests = (session.query(models.Test.id,
+                           models.Test.product_version_id,
+                           models.Product.organization_id,
+                           models.Test.owner_openid,
+                           models.Test.is_shared)
+             .outerjoin(models.ProductVersion,
+                        models.ProductVersion.id ==
+                        models.Test.product_version_id)
+             .outerjoin(models.Product,
+                        models.Product.id == models.ProductVersion.product_id)
+             .filter(models.Test.id.in_(test_ids)))
+    for (test_id, product_version_id, organization_id,
+         owner_openid, is_shared) in tests:
+        owners[test_id] = {'product_version_id': product_version_id,
+                           'organization_id': organization_id,
+                           api_const.USER: owner_openid,
+                           api_const.SHARED_TEST_RUN: is_shared}
+    return owners
 
 
 def _apply_filters_for_query(query, filters):
@@ -254,22 +573,12 @@ def _apply_filters_for_query(query, filters):
     signed = api_const.SIGNED in filters
     # If we only want to get the user's test results.
     if signed:
-        query = (query
-                 .join(models.Test.meta)
-                 .filter(models.TestMeta.meta_key == api_const.USER)
-                 .filter(models.TestMeta.value == filters[api_const.OPENID])
-                 )
+        query = query.filter(models.Test.owner_openid ==
+                             filters[api_const.OPENID])
     elif not all_product_tests:
         # Get all non-signed (aka anonymously uploaded) test results
         # along with signed but shared test results.
-        signed_results = (query.session
-                          .query(models.TestMeta.test_id)
-                          .filter_by(meta_key=api_const.USER))
-        shared_results = (query.session
-                          .query(models.TestMeta.test_id)
-                          .filter_by(meta_key=api_const.SHARED_TEST_RUN))
-        query = (query.filter(models.Test.id.notin_(signed_results))
-                 .union(query.filter(models.Test.id.in_(shared_results))))
+        query = query.filter(models.Test.visibility == api_const.TEST_PUBLIC)
 
     return query
 
@@ -285,6 +594,57 @@ def get_test_result_records(page, per_page, filters):
     return _to_dict(results)
 
 
+def get_test_result_records_by_cursor(position, limit, filters):
+    """Get list of test records following the given keyset position."""
+    session = get_session()
+    query = session.query(models.Test)
+    query = _apply_filters_for_query(query, filters)
+    if position:
+        created_at, test_id = position
+        query = query.filter(sa.or_(
+            models.Test.created_at < created_at,
+            sa.and_(models.Test.created_at == created_at,
+                    models.Test.id < test_id)))
+    results = query.order_by(models.Test.created_at.desc(),
+                             models.Test.id.desc()). \
+        limit(limit).all()
+    return _to_dict(results)
+
+
+def get_test_result_sets(filters, limit=None):
+    """Get test records with their passed tests, read per result set."""
+    session = get_session()
+    query = session.query(models.Test.id, models.Test.cpid,
+                          models.Test.created_at, models.Test.result_set_id)
+    query = _apply_filters_for_query(query, filters)
+    query = query.order_by(models.Test.created_at.desc(),
+                           models.Test.id.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    tests = query.all()
+
+    result_set_ids = sorted(set(test.result_set_id for test in tests
+                                if test.result_set_id is not None))
+    results = dict((result_set_id, []) for result_set_id in result_set_ids)
+    for i in range(0, len(result_set_ids), TEST_NAME_LOOKUP_CHUNK):
+        chunk = result_set_ids[i:i + TEST_NAME_LOOKUP_CHUNK]
+        rows = (session.query(models.TestResults.result_set_id,
+                              models.TestName.name, models.TestName.uuid)
+                .join(models.TestName,
+                      models.TestResults.name_id == models.TestName.id)
+                .filter(models.TestResults.result_set_id.in_(chunk))
+                .all())
+        for row in rows:
+            results[row.result_set_id].append({'name': row.name,
+                                               'uuid': row.uuid or None})
+    return [{'id': test.id,
+             'cpid': test.cpid,
+             'created_at': test.created_at,
+             'result_set_id': test.result_set_id,
+             'results': results.get(test.result_set_id, [])}
+            for test in tests]
+
+
 def get_test_result_records_count(filters):
     """Get total test records count."""
     session = get_session()
@@ -365,6 +725,7 @@ def delete_pubkey(id):
     with session.begin():
         key = session.query(models.PubKey).filter_by(id=id).first()
         session.delete(key)
+        _bump_cache_generation(session, api_const.CACHE_PUBKEYS)
 
 
 def get_user_pubkeys(user_openid):
@@ -374,6 +735,97 @@ def get_user_pubkeys(user_openid):
     return _to_dict(pubkeys)
 
 
+def _bump_cache_generation(session, namespace):
+    """Increment the generation of a cache namespace.
+
+    Must be called in the transaction of the write which invalidates the
+    cached data, so that other processes see the new generation together
+    with the new data.
+    """
+    query = session.query(models.CacheGeneration).filter_by(
+        namespace=namespace)
+    updated = query.update(
+        {'generation': models.CacheGeneration.generation + 1},
+        synchronize_session=False)
+    if updated:
+        return
+    try:
+        with session.begin_nested():
+            session.execute(models.CacheGeneration.__table__.insert(),
+                            {'namespace': namespace, 'generation': 1,
+                             'created_at': timeutils.utcnow()})
+    except db_exc.DBDuplicateEntry:
+        # The row was added by a concurrent transaction.
+        query.update({'generation': models.CacheGeneration.generation + 1},
+                     synchronize_session=False)
+
+
+def get_cache_generations():
+    """Get the current generation of each cache namespace."""
+    session = get_session()
+    rows = session.query(models.CacheGeneration.namespace,
+                         models.CacheGeneration.generation)
+    return dict((row.namespace, row.generation) for row in rows)
+
+
+def _grant_product_acl(session, *criteria):
+    """Add product rights of group members matching the criteria.
+
+    Each member of the group of a vendor may manage all products of the
+    vendor. Rights which already exist are left untouched.
+    """
+    acl = models.UserProductAcl.__table__
+    member = models.UserToGroup.__table__
+    product = models.Product.__table__
+    organization = models.Organization.__table__
+    granted = (sa.select([member.c.user_openid, product.c.id,
+                          product.c.organization_id])
+               .select_from(
+                   product
+                   .join(organization,
+                         organization.c.id == product.c.organization_id)
+                   .join(member, member.c.group_id == organization.c.group_id))
+               .where(~sa.exists().where(sa.and_(
+                   acl.c.user_openid == member.c.user_openid,
+                   acl.c.product_id == product.c.id)))
+               .distinct())
+    for criterion in criteria:
+        granted = granted.where(criterion)
+    session.execute(acl.insert().from_select(
+        ['user_openid', 'product_id', 'organization_id'], granted))
+
+
+def _revoke_product_acl(session, *criteria):
+    """Delete product rights matching the criteria."""
+    (session.query(models.UserProductAcl).filter(*criteria)
+     .delete(synchronize_session=False))
+
+
+def rebuild_product_acl():
+    """Recompute product management rights from vendor groups."""
+    session = get_session()
+    with session.begin():
+        _revoke_product_acl(session)
+        _grant_product_acl(session)
+    return session.query(models.UserProductAcl).count()
+
+
+def is_product_admin(user_openid, product_id):
+    """Check that user may manage the product as a vendor member.
+
+    :raises NotFound: If the product does not exist.
+    """
+    session = get_session()
+    query = (session.query(models.UserProductAcl)
+             .filter_by(user_openid=user_openid, product_id=product_id))
+    if session.query(query.exists()).scalar():
+        return True
+    product = session.query(models.Product).filter_by(id=product_id)
+    if not session.query(product.exists()).scalar():
+        raise NotFound('Product with id %s not found' % product_id)
+    return False
+
+
 def add_user_to_group(user_openid, group_id, created_by_user):
     """Add specified user to specified group."""
     item = models.UserToGroup()
@@ -383,6 +835,10 @@ def add_user_to_group(user_openid, group_id, created_by_user):
         item.group_id = group_id
         item.created_by_user = created_by_user
         item.save(session=session)
+        _grant_product_acl(
+            session, models.UserToGroup.user_openid == user_openid,
+            models.UserToGroup.group_id == group_id)
+        _bump_cache_generation(session, api_const.CACHE_MEMBERSHIP)
 
 
 def remove_user_from_group(user_openid, group_id):
@@ -393,6 +849,12 @@ def remove_user_from_group(user_openid, group_id):
          filter_by(user_openid=user_openid).
          filter_by(group_id=group_id).
          delete(synchronize_session=False))
+        organization_ids = (session.query(models.Organization.id)
+                            .filter_by(group_id=group_id))
+        _revoke_product_acl(
+            session, models.UserProductAcl.user_openid == user_openid,
+            models.UserProductAcl.organization_id.in_(organization_ids))
+        _bump_cache_generation(session, api_const.CACHE_MEMBERSHIP)
 
 
 def add_organization(organization_info, creator):
@@ -419,6 +881,7 @@ def add_organization(organization_info, creator):
         organization.created_by_user = creator
         organization.properties = organization_info.get('properties')
         organization.save(session=session)
+        _bump_cache_generation(session, api_const.CACHE_MEMBERSHIP)
 
         return _to_dict(organization)
 
@@ -459,6 +922,9 @@ def delete_organization(organization_id):
     """delete organization by id."""
     session = get_session()
     with session.begin():
+        _revoke_product_acl(
+            session,
+            models.UserProductAcl.organization_id == organization_id)
         product_ids = (session
                        .query(models.Product.id)
                        .filter_by(organization_id=organization_id))
@@ -471,6 +937,7 @@ def delete_organization(organization_id):
         (session.query(models.Organization).
          filter_by(id=organization_id).
          delete(synchronize_session=False))
+        _bump_cache_generation(session, api_const.CACHE_MEMBERSHIP)
 
 
 def add_product(product_info, creator):
@@ -495,6 +962,7 @@ def add_product(product_info, creator):
         product_version.version = product_info.get('version')
         product_version.product_id = product.id
         product_version.save(session=session)
+        _grant_product_acl(session, models.Product.id == product.id)
 
         return _to_dict(product)
 
@@ -530,6 +998,7 @@ def delete_product(id):
     """delete product by id."""
     session = get_session()
     with session.begin():
+        _revoke_product_acl(session, models.UserProductAcl.product_id == id)
         (session.query(models.ProductVersion)
          .filter_by(product_id=id)
          .delete(synchronize_session=False))
@@ -570,6 +1039,37 @@ def get_organization_users(organization_id):
             for item in users}
 
 
+def get_foundation_group_id():
+    """Get id of the group of foundation, None if there is no foundation."""
+    session = get_session()
+    organization = (
+        session.query(models.Organization.group_id)
+        .filter_by(type=api_const.FOUNDATION).first())
+    if organization is None:
+        LOG.warning('Foundation organization record not found in DB.')
+        return None
+    return organization.group_id
+
+
+def get_organization_group_id(organization_id):
+    """Get id of the group of organization."""
+    session = get_session()
+    organization = (session.query(models.Organization.group_id)
+                    .filter_by(id=organization_id).first())
+    if organization is None:
+        raise NotFound('Organization with id %s is not found'
+                       % organization_id)
+    return organization.group_id
+
+
+def is_user_in_group(user_openid, group_id):
+    """Check that user belongs to group without loading its members."""
+    session = get_session()
+    query = (session.query(models.UserToGroup)
+             .filter_by(user_openid=user_openid, group_id=group_id))
+    return session.query(query.exists()).scalar()
+
+
 def get_organizations(allowed_keys=None):
     """Get all organizations."""
     session = get_session()
@@ -629,15 +1129,12 @@ def get_products_by_user(user_openid, allowed_keys=None, filters=None):
         filters = {}
     session = get_session()
     query = (
-        session.query(models.Product, models.Organization, models.Group,
-                      models.UserToGroup)
+        session.query(models.Product)
+        .join(models.UserProductAcl,
+              models.UserProductAcl.product_id == models.Product.id)
         .join(models.Organization,
               models.Organization.id == models.Product.organization_id)
-        .join(models.Group,
-              models.Group.id == models.Organization.group_id)
-        .join(models.UserToGroup,
-              models.Group.id == models.UserToGroup.group_id)
-        .filter(models.UserToGroup.user_openid == user_openid))
+        .filter(models.UserProductAcl.user_openid == user_openid))
 
     expected_filters = ['organization_id']
     for key, value in filters.items():
@@ -646,7 +1143,6 @@ def get_products_by_user(user_openid, allowed_keys=None, filters=None):
         query = query.filter(getattr(models.Product, key) ==
                              filters[key])
     items = query.order_by(models.Organization.created_at.desc()).all()
-    items = [item[0] for item in items]
     return _to_dict(items, allowed_keys=allowed_keys)
 
 
@@ -24,6 +24,8 @@ import sqlalchemy as sa
 from sqlalchemy import orm
 from sqlalchemy.ext.declarative import declarative_base
 
+from refstack.api import constants as api_const
+
 BASE = declarative_base()
 
 
@@ -51,22 +53,37 @@ class Test(BASE, RefStackBase):  # pragma: no cover
     """Test."""
 
     __tablename__ = 'test'
+    __table_args__ = (
+        sa.Index('ix_test_visibility_created_at',
+                 'visibility', 'created_at'),
+        sa.Index('ix_test_owner_openid_created_at',
+                 'owner_openid', 'created_at'),
+        sa.Index('ix_test_created_at_id', 'created_at', 'id'),
+        {'mysql_engine': 'InnoDB'},
+    )
 
     id = sa.Column(sa.String(36), primary_key=True)
     cpid = sa.Column(sa.String(128), index=True, nullable=False)
     duration_seconds = sa.Column(sa.Integer, nullable=False)
-    results = orm.relationship('TestResults', backref='test')
+    result_set_id = sa.Column(sa.Integer, sa.ForeignKey('result_set.id'),
+                              index=True, nullable=True)
+    result_set = orm.relationship('ResultSet', backref='tests')
     meta = orm.relationship('TestMeta', backref='test')
     product_version_id = sa.Column(sa.String(36),
                                    sa.ForeignKey('product_version.id'),
                                    nullable=True, unique=False)
     verification_status = sa.Column(sa.Integer, nullable=False, default=0)
     product_version = orm.relationship('ProductVersion', backref='test')
+    # Denormalized copies of the 'user' and 'shared' metadata items.
+    owner_openid = sa.Column(sa.String(128), nullable=True)
+    is_shared = sa.Column(sa.Boolean(), nullable=False, default=False)
+    visibility = sa.Column(sa.Integer, nullable=False,
+                           default=api_const.TEST_PUBLIC)
 
     @property
     def _extra_keys(self):
         """Relation should be pointed directly."""
-        return ['results', 'meta', 'product_version']
+        return ['meta', 'product_version']
 
     @property
     def metadata_keys(self):
@@ -81,27 +98,67 @@ class Test(BASE, RefStackBase):  # pragma: no cover
                 'verification_status', 'product_version')
 
 
+class TestName(BASE, RefStackBase):  # pragma: no cover
+    """Dictionary of distinct test names referenced by test results."""
+
+    __tablename__ = 'test_name'
+    __table_args__ = (
+        sa.UniqueConstraint('name', 'uuid', name='uq_test_name_name_uuid'),
+        {'mysql_engine': 'InnoDB'},
+    )
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
+    name = sa.Column(sa.String(512, collation='latin1_bin'), nullable=False)
+    # Empty string when the test has no idempotent id, so that the
+    # unique constraint also covers such names.
+    uuid = sa.Column(sa.String(36), nullable=False, default='')
+
+    @property
+    def default_allowed_keys(self):
+        """Default keys."""
+        return 'id', 'name', 'uuid'
+
+
+class ResultSet(BASE, RefStackBase):  # pragma: no cover
+    """Distinct list of passing tests shared by identical test runs."""
+
+    __tablename__ = 'result_set'
+    __table_args__ = (
+        sa.UniqueConstraint('digest', name='uq_result_set_digest'),
+        {'mysql_engine': 'InnoDB'},
+    )
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
+    # SHA-256 of the canonical form of the sorted test list.
+    digest = sa.Column(sa.String(64), nullable=False)
+    # Number of test runs referencing the set.
+    ref_count = sa.Column(sa.Integer, nullable=False, default=0)
+    results = orm.relationship('TestResults', backref='result_set')
+
+    @property
+    def default_allowed_keys(self):
+        """Default keys."""
+        return 'id', 'digest', 'ref_count'
+
+
 class TestResults(BASE, RefStackBase):  # pragma: no cover
     """Test results."""
 
     __tablename__ = 'results'
     __table_args__ = (
-        sa.UniqueConstraint('test_id', 'name'),
-        # TODO(sslypushenko)
-        # Constraint should turned on after duplication test uuids issue
-        # will be fixed
-        # sa.UniqueConstraint('test_id', 'uuid'),
+        sa.UniqueConstraint('result_set_id', 'name_id',
+                            name='uq_results_result_set_id_name_id'),
+        {'mysql_engine': 'InnoDB'},
     )
     _id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
-    test_id = sa.Column(sa.String(36), sa.ForeignKey('test.id'),
-                        index=True, nullable=False, unique=False)
-    name = sa.Column(sa.String(512, collation='latin1_swedish_ci'),)
-    uuid = sa.Column(sa.String(36))
+    result_set_id = sa.Column(sa.Integer, sa.ForeignKey('result_set.id'),
+                              index=True, nullable=False)
+    name_id = sa.Column(sa.Integer, sa.ForeignKey('test_name.id'),
+                        index=True, nullable=False)
+    test_name = orm.relationship('TestName')
 
     @property
     def default_allowed_keys(self):
         """Default keys."""
-        return 'name', 'uuid'
+        return 'name_id',
 
 
 class TestMeta(BASE, RefStackBase):  # pragma: no cover
@@ -123,6 +180,45 @@ class TestMeta(BASE, RefStackBase):  # pragma: no cover
         return 'meta_key', 'value'
 
 
+class ResultUpload(BASE, RefStackBase):  # pragma: no cover
+    """Test results accepted but not yet stored by an ingestion worker."""
+
+    __tablename__ = 'result_upload'
+    __table_args__ = (
+        sa.Index('ix_result_upload_status_created_at',
+                 'status', 'created_at'),
+        {'mysql_engine': 'InnoDB'},
+    )
+
+    # Id of the test run which will be created from the upload.
+    id = sa.Column(sa.String(36), primary_key=True)
+    status = sa.Column(sa.String(16), nullable=False,
+                       default=api_const.UPLOAD_PENDING)
+    openid = sa.Column(sa.String(128), nullable=True)
+    data = sa.Column(sa.LargeBinary(length=2 ** 32 - 1), nullable=False)
+    attempts = sa.Column(sa.Integer, nullable=False, default=0)
+    claimed_at = sa.Column(sa.DateTime, nullable=True)
+    error = sa.Column(sa.Text(), nullable=True)
+
+    @property
+    def default_allowed_keys(self):
+        """Default keys."""
+        return ('id', 'status', 'openid', 'attempts', 'created_at', 'error')
+
+
+class CacheGeneration(BASE, RefStackBase):  # pragma: no cover
+    """Counter bumped on every write to data cached by API processes."""
+
+    __tablename__ = 'cache_generation'
+    namespace = sa.Column(sa.String(64), primary_key=True)
+    generation = sa.Column(sa.BigInteger, nullable=False, default=0)
+
+    @property
+    def default_allowed_keys(self):
+        """Default keys."""
+        return 'namespace', 'generation'
+
+
 class User(BASE, RefStackBase):  # pragma: no cover
     """User information."""
 
@@ -247,6 +343,34 @@ class Product(BASE, RefStackBase):  # pragma: no cover
         return ('id', 'name', 'organization_id', 'public')
 
 
+class UserProductAcl(BASE, RefStackBase):  # pragma: no cover
+    """Products a user can manage as a member of the vendor's group.
+
+    Denormalized from user_to_group, organization and product, and kept
+    in sync by the writes to these tables.
+    """
+
+    __tablename__ = 'user_product_acl'
+    __table_args__ = (
+        sa.Index('ix_user_product_acl_product_id_user_openid',
+                 'product_id', 'user_openid'),
+        sa.Index('ix_user_product_acl_organization_id', 'organization_id'),
+        {'mysql_engine': 'InnoDB'},
+    )
+    user_openid = sa.Column(sa.String(128), sa.ForeignKey('user.openid'),
+                            primary_key=True)
+    product_id = sa.Column(sa.String(36), sa.ForeignKey('product.id'),
+                           primary_key=True)
+    organization_id = sa.Column(sa.String(36),
+                                sa.ForeignKey('organization.id'),
+                                nullable=False)
+
+    @property
+    def default_allowed_keys(self):
+        """Default keys."""
+        return 'user_openid', 'product_id', 'organization_id'
+
+
 class ProductVersion(BASE, RefStackBase):
     """Product Version definition."""
 
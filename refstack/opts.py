@@ -34,6 +34,10 @@ def list_opts():
 import itertools
 
 import refstack.api.app
+import refstack.api.guideline_local
+import refstack.api.guideline_store
+import refstack.api.ingestion
+import refstack.api.sessions
 import refstack.api.controllers.v1
 import refstack.api.controllers.auth
 import refstack.db.api
@@ -48,7 +52,12 @@ def list_opts():
         #
         ('DEFAULT', itertools.chain(refstack.api.app.UI_OPTS,
                                     refstack.db.api.db_opts)),
-        ('api', itertools.chain(refstack.api.app.API_OPTS,
-                                refstack.api.controllers.CTRLS_OPTS)),
+        ('api', itertools.chain(
+            refstack.api.app.API_OPTS,
+            refstack.api.controllers.CTRLS_OPTS,
+            refstack.api.guideline_local.GUIDELINE_LOCAL_OPTS,
+            refstack.api.guideline_store.GUIDELINE_STORE_OPTS,
+            refstack.api.ingestion.INGESTION_OPTS,
+            refstack.api.sessions.SESSION_OPTS)),
         ('osid', refstack.api.controllers.auth.OPENID_OPTS),
     ]
@@ -15,6 +15,8 @@
 
 """Base classes for API tests."""
 import os
+import shutil
+import tempfile
 
 from oslo_config import fixture as config_fixture
 from oslotest import base
@@ -60,6 +62,11 @@ class FunctionalTest(base.BaseTestCase):
         self.CONF.set_override('connection',
                                self.connection,
                                'database')
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.CONF.set_override('guideline_cache_path',
+                               os.path.join(cache_dir, 'guidelines.sqlite'),
+                               'api')
 
         self.app = pecan.testing.load_test_app(self.config)
 
@@ -15,6 +15,9 @@
 
 """Tests for API's controllers"""
 
+import datetime
+import hashlib
+import io
 import json
 
 import mock
@@ -22,9 +25,13 @@ from oslo_config import fixture as config_fixture
 from six.moves.urllib import parse
 import webob.exc
 
+from refstack import db
 from refstack.api import constants as const
 from refstack.api import exceptions as api_exc
+from refstack.api import guideline_store
+from refstack.api import utils as api_utils
 from refstack.api.controllers import auth
+from refstack.api.controllers import caches
 from refstack.api.controllers import guidelines
 from refstack.api.controllers import results
 from refstack.api.controllers import user
@@ -38,6 +45,7 @@ class BaseControllerTestCase(base.RefstackBaseTestCase):
     def setUp(self):
         super(BaseControllerTestCase, self).setUp()
         self.mock_request = self.setup_mock('pecan.request')
+        self.mock_request.content_length = None
         self.mock_response = self.setup_mock('pecan.response')
         self.mock_abort = \
             self.setup_mock('pecan.abort',
@@ -79,6 +87,7 @@ class ResultsControllerTestCase(BaseControllerTestCase):
                                self.test_results_url,
                                'api')
         self.CONF.set_override('ui_url', self.ui_url)
+        self.mock_request.GET = {}
 
     @mock.patch('refstack.db.get_test_result')
     @mock.patch('refstack.db.get_test_results')
@@ -148,7 +157,9 @@ class ResultsControllerTestCase(BaseControllerTestCase):
     @mock.patch('refstack.db.store_test_results')
     def test_post(self, mock_store_test_results):
         self.mock_request.body = b'{"answer": 42}'
+        self.mock_request.content_length = len(self.mock_request.body)
         self.mock_request.headers = {}
+        self.validator.validate.return_value = {'answer': 42}
         mock_store_test_results.return_value = 'fake_test_id'
         result = self.controller.post()
         self.assertEqual(
@@ -168,11 +179,13 @@ class ResultsControllerTestCase(BaseControllerTestCase):
     def test_post_with_sign(self, mock_get_pubkey, mock_store_test_results,
                             mock_get_version, mock_check, mock_foundation):
         self.mock_request.body = b'{"answer": 42, "cpid": "123"}'
+        self.mock_request.content_length = len(self.mock_request.body)
         self.mock_request.headers = {
             'X-Signature': 'fake-sign',
             'X-Public-Key': 'ssh-rsa Zm9vIGJhcg=='
         }
 
+        self.validator.validate.return_value = {'answer': 42, 'cpid': '123'}
         mock_get_pubkey.return_value.openid = 'fake_openid'
         mock_get_version.return_value = [{'id': 'ver1',
                                           'product_id': 'prod1'}]
@@ -190,6 +203,119 @@ class ResultsControllerTestCase(BaseControllerTestCase):
              'meta': {const.USER: 'fake_openid'}}
         )
 
+    @mock.patch('refstack.db.store_test_results')
+    @mock.patch('refstack.db.spool_test_results')
+    def test_post_async(self, mock_spool, mock_store_test_results):
+        self.CONF.set_override('async_uploads', True, 'api')
+        self.CONF.set_override('api_url', 'https://api.host.org', 'api')
+        self.mock_request.body = b'{"answer": 42}'
+        self.mock_request.content_length = len(self.mock_request.body)
+        self.mock_request.headers = {}
+        self.validator.validate.return_value = {'answer': 42}
+        mock_spool.return_value = 'fake_test_id'
+
+        result = self.controller.post()
+
+        self.assertEqual(
+            {'test_id': 'fake_test_id',
+             'url': parse.urljoin(self.ui_url,
+                                  self.test_results_url) % 'fake_test_id',
+             'status_url': 'https://api.host.org/v1/results/fake_test_id/'
+                           'status'},
+            result)
+        self.assertEqual(202, self.mock_response.status)
+        mock_spool.assert_called_once_with({'answer': 42}, None)
+        mock_store_test_results.assert_not_called()
+
+    @mock.patch('refstack.db.get_product_version_by_cpid',
+                return_value=[])
+    @mock.patch('refstack.db.store_test_results_batch')
+    @mock.patch('refstack.db.get_pubkey')
+    def test_batch(self, mock_get_pubkey, mock_store_batch,
+                   mock_get_version):
+        runs = [{'cpid': 'foo', 'results': [{'name': 'test1'}]},
+                {'cpid': 'bar', 'results': []},
+                {'cpid': 'baz', 'results': [{'name': 'test1'}]}]
+        self.mock_request.headers = {
+            'X-Signature': 'fake-sign',
+            'X-Public-Key': 'ssh-rsa Zm9vIGJhcg=='
+        }
+        mock_get_pubkey.return_value.openid = 'fake_openid'
+        self.controller.batch_validator = mock.Mock()
+        self.controller.batch_validator.validate.return_value = runs
+        self.validator.validate_item.side_effect = [
+            None, api_exc.ValidationError('Empty results'), None]
+        mock_store_batch.return_value = [
+            {'test_id': 'id1'}, {'error': 'Duplicate entries'}]
+
+        result = self.controller.batch()
+
+        self.assertEqual(201, self.mock_response.status)
+        self.assertEqual(
+            {'results': [
+                {'test_id': 'id1',
+                 'url': parse.urljoin(self.ui_url,
+                                      self.test_results_url) % 'id1'},
+                {'error': 'Empty results'},
+                {'error': 'Duplicate entries'}]},
+            result)
+        # The signature is checked once for the whole batch.
+        self.controller.batch_validator.validate.assert_called_once_with(
+            self.mock_request)
+        mock_get_pubkey.assert_called_once_with('Zm9vIGJhcg==')
+        stored_runs = mock_store_batch.call_args[0][0]
+        self.assertEqual(['foo', 'baz'], [r['cpid'] for r in stored_runs])
+        self.assertEqual('fake_openid', stored_runs[0]['meta'][const.USER])
+
+    @mock.patch('refstack.api.utils.check_user_is_foundation_admin')
+    @mock.patch('refstack.api.utils.get_user_id')
+    @mock.patch('refstack.db.get_test_result')
+    @mock.patch('refstack.db.get_spooled_upload')
+    def test_get_upload_status(self, mock_get_upload, mock_get_test_result,
+                               mock_get_user_id, mock_is_foundation):
+        mock_get_user_id.return_value = 'fake_openid'
+        mock_is_foundation.return_value = False
+        mock_get_upload.return_value = {'status': const.UPLOAD_FAILED,
+                                        'openid': 'fake_openid',
+                                        'error': 'fake_error'}
+        self.assertEqual({'test_id': 'fake_id',
+                          'status': const.UPLOAD_FAILED,
+                          'error': 'fake_error'},
+                         self.controller.status.get('fake_id'))
+
+        # Other users only see the status.
+        mock_get_user_id.return_value = 'other_openid'
+        self.assertEqual({'test_id': 'fake_id',
+                          'status': const.UPLOAD_FAILED},
+                         self.controller.status.get('fake_id'))
+
+        # Anonymous users don't see errors of unsigned uploads.
+        mock_get_user_id.return_value = None
+        mock_get_upload.return_value = {'status': const.UPLOAD_FAILED,
+                                        'openid': None,
+                                        'error': 'fake_error'}
+        self.assertEqual({'test_id': 'fake_id',
+                          'status': const.UPLOAD_FAILED},
+                         self.controller.status.get('fake_id'))
+
+        mock_is_foundation.return_value = True
+        self.assertEqual({'test_id': 'fake_id',
+                          'status': const.UPLOAD_FAILED,
+                          'error': 'fake_error'},
+                         self.controller.status.get('fake_id'))
+
+        mock_get_upload.return_value = {'status': const.UPLOAD_PENDING,
+                                        'error': None}
+        self.assertEqual({'test_id': 'fake_id',
+                          'status': const.UPLOAD_PENDING},
+                         self.controller.status.get('fake_id'))
+
+        mock_get_upload.side_effect = db.NotFound
+        result = self.controller.status.get('fake_id')
+        self.assertEqual(const.UPLOAD_STORED, result['status'])
+        mock_get_test_result.assert_called_once_with('fake_id',
+                                                     allowed_keys=['id'])
+
     @mock.patch('refstack.db.get_test_result')
     def test_get_item_failed(self, mock_get_test_result):
         mock_get_test_result.return_value = None
@@ -240,8 +366,7 @@ class ResultsControllerTestCase(BaseControllerTestCase):
         self.assertRaises(webob.exc.HTTPError,
                           self.controller.get)
 
-    @mock.patch('refstack.api.utils.check_owner')
-    @mock.patch('refstack.api.utils.check_user_is_foundation_admin')
+    @mock.patch('refstack.api.utils.resolve_test_permissions')
     @mock.patch('refstack.db.get_test_result_records')
     @mock.patch('refstack.db.get_test_result_records_count')
     @mock.patch('refstack.api.utils.get_page_number')
@@ -251,8 +376,7 @@ class ResultsControllerTestCase(BaseControllerTestCase):
                          get_page,
                          get_test_result_count,
                          db_get_test_result,
-                         check_foundation,
-                         check_owner):
+                         resolve_permissions):
 
         expected_input_params = [
             const.START_DATE,
@@ -268,8 +392,8 @@ class ResultsControllerTestCase(BaseControllerTestCase):
         records_count = 50
         get_test_result_count.return_value = records_count
         get_page.return_value = (page_number, total_pages_number)
-        check_foundation.return_value = False
-        check_owner.return_value = True
+        resolve_permissions.return_value = {
+            111: {'owner': True, 'foundation': False, 'visible': True}}
         self.CONF.set_override('results_per_page',
                                per_page,
                                'api')
@@ -298,14 +422,125 @@ class ResultsControllerTestCase(BaseControllerTestCase):
 
         db_get_test_result.assert_called_once_with(
             page_number, per_page, filters)
+        resolve_permissions.assert_called_once_with([111])
 
+    @mock.patch('refstack.api.utils.resolve_test_permissions')
+    @mock.patch('refstack.db.get_test_result_records_by_cursor')
+    @mock.patch('refstack.db.get_test_result_records_count')
+    @mock.patch('refstack.api.utils.parse_input_params')
+    def test_get_with_cursor(self,
+                             parse_input,
+                             get_test_result_count,
+                             db_get_by_cursor,
+                             resolve_permissions):
+        created_at = datetime.datetime(2018, 2, 1, 12, 0, 0)
+        self.mock_request.GET = {const.LIMIT: '2'}
+        records = [{'id': 'id%d' % i, 'created_at': created_at}
+                   for i in range(3)]
+        db_get_by_cursor.return_value = records
+        resolve_permissions.return_value = {
+            r['id']: {'owner': True, 'foundation': False, 'visible': True}
+            for r in records}
+
+        result = self.controller.get()
+        self.assertEqual(['id0', 'id1'],
+                         [r['id'] for r in result['results']])
+        self.assertEqual(2, result['pagination']['limit'])
+        next_cursor = result['pagination']['next_cursor']
+        self.assertEqual((created_at, 'id1'),
+                         api_utils.decode_cursor(next_cursor))
+        db_get_by_cursor.assert_called_once_with(
+            None, 3, parse_input.return_value)
+        get_test_result_count.assert_not_called()
+
+        db_get_by_cursor.reset_mock()
+        db_get_by_cursor.return_value = records[2:]
+        self.mock_request.GET = {const.LIMIT: '2',
+                                 const.CURSOR: next_cursor}
+        result = self.controller.get()
+        self.assertIsNone(result['pagination']['next_cursor'])
+        db_get_by_cursor.assert_called_once_with(
+            (created_at, 'id1'), 3, parse_input.return_value)
+
+    @mock.patch('refstack.api.utils.resolve_test_permissions')
+    @mock.patch('refstack.db.get_test_result_records')
+    @mock.patch('refstack.db.get_test_result_records_count')
+    @mock.patch('refstack.api.utils.get_page_number')
+    @mock.patch('refstack.api.utils.parse_input_params')
+    def test_get_redacts_not_owned(self,
+                                   parse_input,
+                                   get_page,
+                                   get_test_result_count,
+                                   db_get_test_result,
+                                   resolve_permissions):
+        get_page.return_value = (1, 1)
+        parse_input.return_value = {}
+        db_get_test_result.return_value = [
+            {'id': 'own', 'meta': {'user': 'me', 'shared': 'true'},
+             'product_version': None},
+            {'id': 'other', 'meta': {'user': 'foo', 'shared': 'true'},
+             'product_version': {'product_info': {'public': False}}}]
+        resolve_permissions.return_value = {
+            'own': {'owner': True, 'foundation': False, 'visible': True},
+            'other': {'owner': False, 'foundation': False, 'visible': True}}
+
+        results = self.controller.get()['results']
+        self.assertEqual({'user': 'me', 'shared': 'true'}, results[0]['meta'])
+        self.assertEqual({'shared': 'true'}, results[1]['meta'])
+        self.assertIsNone(results[1]['product_version'])
+
+    @mock.patch('refstack.api.compliance_matrix.get_compliance_matrix')
+    def test_matrix(self, mock_matrix):
+        self.CONF.set_override('compliance_matrix_max_results', 50, 'api')
+        self.mock_request.GET = {const.CPID: 'fake_cpid',
+                                 const.GUIDELINE: '2017.09,2018.02',
+                                 const.TARGET: 'platform,compute'}
+        self.assertEqual(mock_matrix.return_value, self.controller.matrix())
+        mock_matrix.assert_called_once_with(
+            {const.CPID: 'fake_cpid'}, ['2017.09', '2018.02'],
+            ['platform', 'compute'], limit=50)
+
+        mock_matrix.reset_mock()
+        self.mock_request.GET = {const.CPID: 'fake_cpid'}
+        self.controller.matrix()
+        mock_matrix.assert_called_once_with(
+            {const.CPID: 'fake_cpid'}, None, ['platform'], limit=50)
+
+    @mock.patch('refstack.api.utils.check_user_is_vendor_admin')
+    @mock.patch('refstack.api.utils.check_user_is_foundation_admin')
+    @mock.patch('refstack.db.get_product')
+    @mock.patch('refstack.api.compliance_matrix.get_compliance_matrix')
+    def test_matrix_product(self, mock_matrix, mock_get_product,
+                            mock_foundation, mock_vendor):
+        mock_get_product.return_value = {'organization_id': 'org1',
+                                         'public': False}
+        mock_foundation.return_value = False
+        mock_vendor.return_value = True
+        self.mock_request.GET = {const.PRODUCT_ID: 'prod1'}
+        self.controller.matrix()
+        mock_matrix.assert_called_once_with(
+            {const.PRODUCT_ID: 'prod1', const.ALL_PRODUCT_TESTS: True},
+            None, ['platform'], limit=1000)
+
+        # Private products are hidden from other users.
+        mock_vendor.return_value = False
+        self.assertRaises(webob.exc.HTTPError, self.controller.matrix)
+        self.mock_abort.assert_called_with(403, mock.ANY)
+
+    def test_matrix_no_filter(self):
+        self.assertRaises(webob.exc.HTTPError, self.controller.matrix)
+        self.mock_abort.assert_called_with(400, mock.ANY)
+
+    @mock.patch('refstack.api.guidelines.forget_result_compliance')
     @mock.patch('refstack.db.get_test_result')
     @mock.patch('refstack.db.delete_test_result')
-    def test_delete(self, mock_db_delete, mock_get_test_result):
+    def test_delete(self, mock_db_delete, mock_get_test_result,
+                    mock_forget):
         self.mock_get_user_role.return_value = const.ROLE_OWNER
 
         self.controller.delete('test_id')
         self.assertEqual(204, self.mock_response.status)
+        mock_forget.assert_called_once_with('test_id')
 
         # Verified test deletion attempt should raise error.
         mock_get_test_result.return_value = {'verification_status':
@@ -354,6 +589,45 @@ class GuidelinesControllerTestCase(BaseControllerTestCase):
         self.controller.get_one('2010.03')
         self.mock_abort.assert_called_with(500, mock.ANY)
 
+    @mock.patch('refstack.api.guidelines.Guidelines.get_guideline_diff')
+    def test_get_guideline_diff(self, mock_diff):
+        """Test when getting the differences between two guidelines."""
+        diff = {'capabilities': {'added': ['cap-2'], 'removed': [],
+                                 'reclassified': []}}
+        mock_diff.return_value = diff
+        self.mock_request.GET = {'from': '2017.09', 'to': '2018.02',
+                                 'target': 'compute',
+                                 'type': 'required,advisory'}
+        result = self.controller.diff()
+        self.assertEqual({'from': '2017.09', 'to': '2018.02',
+                          'target': 'compute',
+                          'type': ['required', 'advisory'],
+                          'capabilities': diff['capabilities']}, result)
+        mock_diff.assert_called_once_with('2017.09', '2018.02',
+                                          ['required', 'advisory'],
+                                          'compute')
+        # The cached differences are not modified.
+        self.assertEqual(['capabilities'], list(diff))
+
+    @mock.patch('refstack.api.guidelines.Guidelines.get_guideline_diff')
+    def test_get_guideline_diff_error(self, mock_diff):
+        """Test when the guideline differences can't be computed."""
+        self.mock_abort.side_effect = webob.exc.HTTPError
+        self.mock_request.GET = {'from': '2017.09'}
+        self.assertRaises(webob.exc.HTTPError, self.controller.diff)
+        self.mock_abort.assert_called_with(400, mock.ANY)
+
+        self.mock_request.GET = {'from': '2017.09', 'to': '2018.02',
+                                 'target': 'foo'}
+        mock_diff.side_effect = KeyError
+        self.assertRaises(webob.exc.HTTPError, self.controller.diff)
+        self.mock_abort.assert_called_with(400, 'Invalid target: foo')
+
+        mock_diff.side_effect = None
+        mock_diff.return_value = None
+        self.assertRaises(webob.exc.HTTPError, self.controller.diff)
+        self.mock_abort.assert_called_with(500, mock.ANY)
+
 
 class GuidelinesTestsControllerTestCase(BaseControllerTestCase):
 
@@ -395,35 +669,60 @@ class GuidelinesTestsControllerTestCase(BaseControllerTestCase):
     def setUp(self):
         super(GuidelinesTestsControllerTestCase, self).setUp()
         self.controller = guidelines.TestsController()
-
-    @mock.patch('refstack.api.guidelines.Guidelines.get_guideline_contents')
-    @mock.patch('pecan.request')
-    def test_get_guideline_tests(self, mock_request, mock_get_contents):
+        self.setup_mock('refstack.api.guidelines._guideline_index_cache',
+                        None)
+        self.setup_mock('refstack.api.guidelines._test_list_cache', None)
+        self.mock_get_response = self.setup_mock(
+            'refstack.api.guidelines.Guidelines._get_guideline_response',
+            return_value=guideline_store.CachedResponse(
+                200, json.dumps(self.FAKE_GUIDELINES).encode('utf-8')))
+        self.mock_response = self.setup_mock('pecan.response',
+                                             webob.Response())
+
+    def _get(self, version, path='/', headers=None):
+        """Get a test list with a real request and response."""
+        self.setup_mock('pecan.request',
+                        webob.Request.blank(path, headers=headers))
+        return self.controller.get(version)
+
+    def test_get_guideline_tests(self):
         """Test getting the test list string of a guideline."""
-        mock_get_contents.return_value = self.FAKE_GUIDELINES
-        mock_request.GET = {}
-        test_list_str = self.controller.get('2016,01')
+        test_list_str = self._get('2016,01')
         expected_list = ['test_1[id-1234]', 'test_2[id-5678]',
                          'test_2_1[id-5678]', 'test_3[id-1111]',
                          'test_4[id-1233]']
-        expected_result = '\n'.join(expected_list)
+        expected_result = '\n'.join(expected_list).encode('utf-8')
         self.assertEqual(expected_result, test_list_str)
+        etag = self.mock_response.headers['ETag']
+        self.assertEqual('"%s"' % hashlib.sha256(expected_result).hexdigest(),
+                         etag)
 
-    @mock.patch('refstack.api.guidelines.Guidelines.get_guideline_contents')
-    def test_get_guideline_tests_fail(self, mock_get_contents):
+        # Other options give other lists.
+        test_list_str = self._get(
+            '2016,01', '/?alias=false&flag=false&%s=required' % const.TYPE)
+        expected_list = ['test_1[id-1234]', 'test_2[id-5678]',
+                         'test_4[id-1233]']
+        self.assertEqual('\n'.join(expected_list).encode('utf-8'),
+                         test_list_str)
+        self.assertNotEqual(etag, self.mock_response.headers['ETag'])
+
+        # Lists the client already has are not sent again.
+        self.assertEqual('', self._get('2016,01',
+                                       headers={'If-None-Match': etag}))
+        self.assertEqual(304, self.mock_response.status_int)
+        self.assertEqual('', self._get(
+            '2016,01', headers={'If-None-Match': '"other", %s' % etag}))
+        self.assertEqual(304, self.mock_response.status_int)
+
+    def test_get_guideline_tests_fail(self):
         """Test when the JSON content of a guideline can't be retrieved."""
-        mock_get_contents.return_value = None
-        result_str = self.controller.get('2016.02')
+        self.mock_get_response.return_value = None
+        result_str = self._get('2016.02')
         self.assertIn('Error getting JSON', result_str)
 
-    @mock.patch('refstack.api.guidelines.Guidelines.get_guideline_contents')
-    @mock.patch('pecan.request')
-    def test_get_guideline_tests_invalid_target(self, mock_request,
-                                                mock_get_contents):
+    def test_get_guideline_tests_invalid_target(self):
         """Test when the target is invalid."""
-        mock_get_contents.return_value = self.FAKE_GUIDELINES
-        mock_request.GET = {'target': 'foo'}
-        result_str = self.controller.get('2016.02')
+        result_str = self._get('2016.02', '/?target=foo')
         self.assertIn('Invalid target', result_str)
 
 
@@ -435,19 +734,44 @@ class BaseRestControllerWithValidationTestCase(BaseControllerTestCase):
         validation.BaseRestControllerWithValidation.__validator__ = \
             mock.Mock(exposed=False, return_value=self.validator)
         self.controller = validation.BaseRestControllerWithValidation()
+        self.config_fixture = config_fixture.Config()
+        self.CONF = self.useFixture(self.config_fixture).conf
 
     @mock.patch('pecan.response')
     @mock.patch('pecan.request')
     def test_post(self, mock_request, mock_response):
-        mock_request.body = b'[42]'
+        mock_request.body_file = io.BytesIO(b'[42]')
+        mock_request.content_length = None
+        self.validator.validate.return_value = [42]
         self.controller.store_item = mock.Mock(return_value='fake_id')
 
         result = self.controller.post()
 
         self.assertEqual(result, 'fake_id')
+        self.assertEqual(b'[42]', mock_request.body)
         self.assertEqual(mock_response.status, 201)
+        self.validator.validate.assert_called_once_with(mock_request)
         self.controller.store_item.assert_called_once_with([42])
 
+    @mock.patch('pecan.abort', side_effect=webob.exc.HTTPError)
+    @mock.patch('pecan.request')
+    def test_post_too_large(self, mock_request, mock_abort):
+        self.CONF.set_override('max_body_size', 10, 'api')
+        mock_request.content_length = 11
+        self.controller.store_item = mock.Mock()
+
+        self.assertRaises(webob.exc.HTTPError, self.controller.post)
+        self.assertEqual(413, mock_abort.call_args[0][0])
+        self.validator.validate.assert_not_called()
+        self.controller.store_item.assert_not_called()
+
+        # Bodies of unknown length are not read past the limit.
+        mock_request.content_length = None
+        mock_request.body_file = mock.Mock(wraps=io.BytesIO(b'x' * 100))
+        self.assertRaises(webob.exc.HTTPError, self.controller.post)
+        mock_request.body_file.read.assert_called_once_with(11)
+        self.validator.validate.assert_not_called()
+
     def test_get_one_return_schema(self):
         self.validator.assert_id = mock.Mock(return_value=False)
         self.validator.schema = 'fake_schema'
@@ -461,8 +785,7 @@ class ProfileControllerTestCase(BaseControllerTestCase):
         super(ProfileControllerTestCase, self).setUp()
         self.controller = user.ProfileController()
 
-    @mock.patch('refstack.db.get_foundation_users',
-                return_value=['foo@bar.org'])
+    @mock.patch('refstack.db.is_foundation_user', return_value=True)
     @mock.patch('refstack.db.user_get',
                 return_value=mock.Mock(openid='foo@bar.org',
                                        email='foo@bar.org',
@@ -470,8 +793,9 @@ class ProfileControllerTestCase(BaseControllerTestCase):
     @mock.patch('refstack.api.utils.get_user_session',
                 return_value={const.USER_OPENID: 'foo@bar.org'})
     def test_get(self, mock_get_user_session, mock_user_get,
-                 mock_get_foundation_users):
+                 mock_is_foundation_user):
         actual_result = self.controller.get()
+        mock_is_foundation_user.assert_called_once_with('foo@bar.org')
         self.assertEqual({'openid': 'foo@bar.org',
                           'email': 'foo@bar.org',
                           'fullname': 'Dobby',
@@ -703,6 +1027,82 @@ class MetadataControllerTestCase(BaseControllerTestCase):
                           self.controller.delete, 'test_id', 'answer')
 
 
+class ComplianceControllerTestCase(BaseControllerTestCase):
+
+    def setUp(self):
+        super(ComplianceControllerTestCase, self).setUp()
+        self.controller = results.ComplianceController()
+        self.mock_get_user_role.return_value = const.ROLE_USER
+        self.mock_request.GET = {}
+
+    @mock.patch('refstack.db.get_test_result_meta_key')
+    @mock.patch('refstack.api.guidelines.Guidelines')
+    def test_get(self, mock_guidelines, mock_get_meta_key):
+        mock_compliance = mock_guidelines.return_value.get_result_compliance
+        mock_compliance.return_value = {'compliant': True}
+        self.mock_request.GET = {const.GUIDELINE: '2017.01',
+                                 const.TARGET: 'compute',
+                                 const.TYPE: 'required,advisory'}
+        self.assertEqual({'compliant': True},
+                         self.controller.get('test_id'))
+        mock_compliance.assert_called_once_with(
+            'test_id', '2017.01', 'compute', ['required', 'advisory'])
+        mock_get_meta_key.assert_not_called()
+
+        # The guideline and target saved in metadata are used by default.
+        mock_compliance.reset_mock()
+        self.mock_request.GET = {}
+        mock_get_meta_key.side_effect = lambda test_id, key: {
+            const.GUIDELINE: '2016.08', const.TARGET: None}[key]
+        self.controller.get('test_id')
+        mock_compliance.assert_called_once_with(
+            'test_id', '2016.08', 'platform', None)
+        mock_get_meta_key.assert_has_calls(
+            [mock.call('test_id', const.GUIDELINE),
+             mock.call('test_id', const.TARGET)])
+
+    @mock.patch('refstack.db.get_test_result_meta_key')
+    @mock.patch('refstack.api.guidelines.Guidelines')
+    def test_get_error(self, mock_guidelines, mock_get_meta_key):
+        mock_compliance = mock_guidelines.return_value.get_result_compliance
+        mock_get_meta_key.return_value = None
+        self.assertRaises(webob.exc.HTTPError,
+                          self.controller.get, 'test_id')
+        self.mock_abort.assert_called_with(400, mock.ANY)
+        mock_compliance.assert_not_called()
+
+        self.mock_request.GET = {const.GUIDELINE: '2017.01',
+                                 const.TARGET: 'foo'}
+        mock_compliance.side_effect = KeyError('foo')
+        self.assertRaises(webob.exc.HTTPError,
+                          self.controller.get, 'test_id')
+        self.mock_abort.assert_called_with(400, 'Invalid target: foo')
+
+        mock_compliance.side_effect = None
+        mock_compliance.return_value = None
+        self.assertRaises(webob.exc.HTTPError,
+                          self.controller.get, 'test_id')
+        self.mock_abort.assert_called_with(404, mock.ANY)
+
+
+class CachesControllerTestCase(BaseControllerTestCase):
+
+    def setUp(self):
+        super(CachesControllerTestCase, self).setUp()
+        self.controller = caches.CachesController()
+
+    @mock.patch('refstack.api.cache.get_stats')
+    @mock.patch('refstack.api.utils.check_user_is_foundation_admin')
+    def test_get(self, mock_is_foundation, mock_get_stats):
+        mock_is_foundation.return_value = True
+        mock_get_stats.return_value = {'tokens': {'hits': 1}}
+        self.assertEqual({'tokens': {'hits': 1}}, self.controller.get())
+
+        mock_is_foundation.return_value = False
+        self.assertRaises(webob.exc.HTTPError, self.controller.get)
+        self.mock_abort.assert_called_with(403, 'Forbidden.')
+
+
 class PublicKeysControllerTestCase(BaseControllerTestCase):
 
     def setUp(self):
@@ -718,7 +1118,8 @@ class PublicKeysControllerTestCase(BaseControllerTestCase):
     @mock.patch('refstack.api.utils.get_user_id')
     @mock.patch('refstack.db.store_pubkey')
     def test_post(self, mock_store_pubkey, mock_get_user_id):
-        self.controller.validator.validate = mock.Mock()
+        self.controller.validator.validate = mock.Mock(
+            side_effect=lambda r: json.loads(r.body.decode('utf-8')))
         mock_get_user_id.return_value = 'fake_id'
         mock_store_pubkey.return_value = 42
         raw_key = 'fake key Don\'t_Panic.'
@@ -731,6 +1132,7 @@ class PublicKeysControllerTestCase(BaseControllerTestCase):
         self.mock_request.body = json.dumps(
             {'raw_key': raw_key}
         ).encode('utf-8')
+        self.mock_request.content_length = len(self.mock_request.body)
         self.controller.post()
         self.assertEqual(201, self.mock_response.status)
         mock_store_pubkey.assert_called_once_with(fake_pubkey)
@@ -746,6 +1148,7 @@ class PublicKeysControllerTestCase(BaseControllerTestCase):
         self.mock_request.body = json.dumps(
             {'raw_key': raw_key}
         ).encode('utf-8')
+        self.mock_request.content_length = len(self.mock_request.body)
         self.controller.post()
         mock_store_pubkey.assert_called_once_with(fake_pubkey)
 
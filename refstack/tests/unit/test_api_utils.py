@@ -14,6 +14,7 @@
 #    under the License.
 
 """Tests for API's utils"""
+import datetime
 import time
 
 import mock
@@ -26,6 +27,7 @@ import six
 from six.moves.urllib import parse
 from webob import exc
 
+from refstack.api import cache
 from refstack.api import constants as const
 from refstack.api import exceptions as api_exc
 from refstack.api import utils as api_utils
@@ -312,6 +314,40 @@ class APIUtilsTestCase(base.BaseTestCase):
         self.assertEqual(page_number, 2)
         self.assertEqual(total_pages, total_records / per_page)
 
+    def test_encode_decode_cursor(self):
+        created_at = datetime.datetime(2018, 2, 1, 12, 30, 15, 42)
+        cursor = api_utils.encode_cursor(created_at, 'fake-id')
+        self.assertEqual((created_at, 'fake-id'),
+                         api_utils.decode_cursor(cursor))
+        self.assertRaises(api_exc.ParseInputsError,
+                          api_utils.decode_cursor, 'not-a-cursor')
+
+    @mock.patch('pecan.request')
+    def test_get_cursor_params(self, mock_request):
+        self.CONF.set_override('results_per_page', 20, 'api')
+        self.CONF.set_override('max_results_limit', 50, 'api')
+        mock_request.GET = {}
+        self.assertIsNone(api_utils.get_cursor_params())
+
+        mock_request.GET = {const.LIMIT: '10'}
+        self.assertEqual((None, 10), api_utils.get_cursor_params())
+
+        mock_request.GET = {const.LIMIT: '1000'}
+        self.assertEqual((None, 50), api_utils.get_cursor_params())
+
+        created_at = datetime.datetime(2018, 2, 1, 12, 30, 15)
+        cursor = api_utils.encode_cursor(created_at, 'fake-id')
+        mock_request.GET = {const.CURSOR: cursor}
+        self.assertEqual(((created_at, 'fake-id'), 20),
+                         api_utils.get_cursor_params())
+
+        mock_request.GET = {const.LIMIT: 'abc'}
+        self.assertRaises(api_exc.ParseInputsError,
+                          api_utils.get_cursor_params)
+        mock_request.GET = {const.LIMIT: '0'}
+        self.assertRaises(api_exc.ParseInputsError,
+                          api_utils.get_cursor_params)
+
     def test_set_query_params(self):
         url = 'http://e.io/path#fragment'
         new_url = api_utils.set_query_params(url, {'foo': 'bar', '?': 42})
@@ -337,6 +373,41 @@ class APIUtilsTestCase(base.BaseTestCase):
         session = api_utils.get_user_session()
         self.assertEqual(42, session)
 
+    @mock.patch.object(api_utils, 'db')
+    @mock.patch('pecan.request')
+    def test_request_context(self, mock_request, mock_db):
+        session = mock.MagicMock()
+        session.get.side_effect = {const.USER_OPENID: 'fake_user'}.get
+        context = api_utils.RequestContext()
+        mock_request.environ = {'beaker.session': session,
+                                const.REQUEST_CONTEXT_ENV: context}
+        mock_db.is_foundation_user.return_value = False
+        mock_db.get_test_result.return_value = {'product_version_id': 'v1'}
+        mock_db.get_product_version.return_value = {'product_id': 'p1'}
+        mock_db.is_product_admin.return_value = True
+
+        for _ in range(3):
+            self.assertEqual(const.ROLE_OWNER,
+                             api_utils.get_user_role('test_id'))
+            self.assertTrue(api_utils.check_user_is_product_admin('p1'))
+            self.assertEqual('fake_user', api_utils.get_user_id())
+        # Every lookup was done once during the request.
+        mock_db.is_foundation_user.assert_called_once_with('fake_user')
+        mock_db.user_get.assert_called_once_with('fake_user')
+        mock_db.get_test_result.assert_called_once_with('test_id')
+        mock_db.is_product_admin.assert_called_once_with('fake_user', 'p1')
+
+        # Signing out starts over.
+        api_utils.delete_params_from_user_session([const.USER_OPENID])
+        api_utils.get_user_role('test_id')
+        self.assertEqual(2, mock_db.is_foundation_user.call_count)
+
+        # Out of a request, nothing is memoized.
+        mock_request.environ = {'beaker.session': session}
+        api_utils.check_user_is_foundation_admin()
+        api_utils.check_user_is_foundation_admin()
+        self.assertEqual(4, mock_db.is_foundation_user.call_count)
+
     @mock.patch.object(api_utils, 'get_user_session')
     @mock.patch.object(api_utils, 'db')
     @mock.patch('pecan.request')
@@ -493,6 +564,50 @@ class APIUtilsTestCase(base.BaseTestCase):
 
         self.assertRaises(ValueError, fake_controller.post, public_test)
 
+    @mock.patch('refstack.db.get_organizations_by_user')
+    @mock.patch('refstack.db.get_test_result_owners')
+    @mock.patch.object(api_utils, 'check_user_is_foundation_admin')
+    @mock.patch.object(api_utils, 'is_authenticated')
+    @mock.patch.object(api_utils, 'get_user_id')
+    def test_resolve_test_permissions(self, mock_get_user_id,
+                                      mock_is_authenticated,
+                                      mock_foundation_check,
+                                      mock_get_owners,
+                                      mock_get_orgs):
+        mock_get_user_id.return_value = 'fake_openid'
+        mock_is_authenticated.return_value = True
+        mock_foundation_check.return_value = False
+        mock_get_owners.return_value = {
+            'anon': {'product_version_id': None, 'organization_id': None,
+                     const.USER: None, const.SHARED_TEST_RUN: None},
+            'own': {'product_version_id': None, 'organization_id': None,
+                    const.USER: 'fake_openid', const.SHARED_TEST_RUN: None},
+            'other': {'product_version_id': None, 'organization_id': None,
+                      const.USER: 'other', const.SHARED_TEST_RUN: None},
+            'shared': {'product_version_id': None, 'organization_id': None,
+                       const.USER: 'other', const.SHARED_TEST_RUN: 'true'},
+            'product': {'product_version_id': 'ver1',
+                        'organization_id': 'org1',
+                        const.USER: 'other', const.SHARED_TEST_RUN: None},
+        }
+        mock_get_orgs.return_value = [{'id': 'org1'}]
+        test_ids = ['anon', 'own', 'other', 'shared', 'product']
+
+        result = api_utils.resolve_test_permissions(test_ids)
+        self.assertEqual(
+            {'anon': (False, True), 'own': (True, True),
+             'other': (False, False), 'shared': (False, True),
+             'product': (True, True)},
+            {k: (v['owner'], v['visible']) for k, v in result.items()})
+        mock_get_owners.assert_called_once_with(test_ids)
+        mock_get_orgs.assert_called_once_with('fake_openid',
+                                              allowed_keys=['id'])
+
+        mock_is_authenticated.return_value = False
+        result = api_utils.resolve_test_permissions(test_ids)
+        self.assertFalse(any(v['owner'] for v in result.values()))
+        self.assertFalse(result['other']['visible'])
+
     @mock.patch('requests.post')
     @mock.patch('pecan.abort')
     def test_verify_openid_request(self, mock_abort, mock_post):
@@ -527,18 +642,51 @@ class APIUtilsTestCase(base.BaseTestCase):
                  'Please permit access to your name.'
         )
 
-    @mock.patch('refstack.db.get_organization_users')
+    @mock.patch('refstack.db.is_organization_user')
     @mock.patch.object(api_utils, 'get_user_id', return_value='fake_id')
     def test_check_user_is_vendor_admin(self, mock_user, mock_db):
         mock_user.return_value = 'some-user'
-        mock_db.return_value = ['some-user', 'another-user']
+        mock_db.return_value = True
         result = api_utils.check_user_is_vendor_admin('some-vendor')
         self.assertTrue(result)
+        mock_db.assert_called_once_with('some-vendor', 'some-user')
 
-        mock_db.return_value = ['another-user']
+        mock_db.return_value = False
         result = api_utils.check_user_is_vendor_admin('some-vendor')
         self.assertFalse(result)
 
+    @mock.patch('refstack.db.is_product_admin')
+    @mock.patch.object(api_utils, 'get_user_id', return_value='fake_id')
+    def test_check_user_is_product_admin(self, mock_user, mock_db):
+        mock_db.return_value = True
+        self.assertTrue(api_utils.check_user_is_product_admin('product'))
+        mock_db.assert_called_once_with('fake_id', 'product')
+
+        mock_db.return_value = False
+        self.assertFalse(
+            api_utils.check_user_is_product_admin('product', 'other_user'))
+        mock_db.assert_called_with('other_user', 'product')
+
+        # Unknown products are not found rather than forbidden.
+        mock_db.side_effect = db.NotFound('Product')
+        self.assertRaises(db.NotFound,
+                          api_utils.check_user_is_product_admin, 'product')
+
+    @mock.patch('refstack.db.is_foundation_user')
+    @mock.patch.object(api_utils, 'get_user_id', return_value='fake_id')
+    def test_check_user_is_foundation_admin(self, mock_user, mock_db):
+        mock_db.return_value = True
+        self.assertTrue(api_utils.check_user_is_foundation_admin())
+        mock_db.assert_called_once_with('fake_id')
+
+        mock_db.return_value = False
+        self.assertFalse(
+            api_utils.check_user_is_foundation_admin('other_user'))
+        mock_db.assert_called_with('other_user')
+
+    @mock.patch('refstack.db.check_cache_generations', mock.Mock())
+    @mock.patch.object(api_utils, '_token_cache', None)
+    @mock.patch.object(api_utils, '_pubkey_cache', None)
     @mock.patch('refstack.db.get_user_pubkeys')
     def test_encode_token(self, mock_pubkey):
         mock_request = mock.MagicMock()
@@ -577,3 +725,96 @@ class APIUtilsTestCase(base.BaseTestCase):
         self.assertEqual('oid',
                          api_utils.decode_token(
                              mock_request)[const.USER_OPENID])
+
+    @mock.patch('refstack.db.check_cache_generations', mock.Mock())
+    @mock.patch.object(api_utils, '_token_cache', None)
+    @mock.patch.object(api_utils, '_pubkey_cache', None)
+    @mock.patch('cryptography.hazmat.primitives.serialization.'
+                'load_ssh_public_key',
+                wraps=api_utils.serialization.load_ssh_public_key)
+    @mock.patch('refstack.db.get_user_pubkeys')
+    def test_decode_token_kid(self, mock_pubkey, mock_load):
+        fingerprint = api_utils.get_pubkey_fingerprint({'pubkey': PUB_KEY})
+        mock_pubkey.return_value = [{'format': 'ssh-rsa',
+                                     'pubkey': 'AAAAB3NzaC1yc2E='},
+                                    {'format': 'ssh-rsa',
+                                     'pubkey': PUB_KEY}]
+        mock_request = mock.MagicMock()
+
+        def set_token(kid):
+            token = jwt.encode({const.USER_OPENID: 'oid',
+                                'exp': int(time.time()) + 3600},
+                               key=PRIV_KEY, algorithm='RS256',
+                               headers={'kid': kid})
+            mock_request.headers = {
+                const.JWT_TOKEN_HEADER:
+                    'Bearer %s' % six.text_type(token, 'utf-8')}
+
+        # Only the key named by the token is parsed.
+        set_token(fingerprint)
+        self.assertEqual('oid',
+                         api_utils.decode_token(
+                             mock_request)[const.USER_OPENID])
+        self.assertEqual(1, mock_load.call_count)
+
+        # Fingerprints in the 'MD5:aa:bb:...' form are accepted, and the
+        # parsed key is reused.
+        set_token('MD5:' + ':'.join(fingerprint[i:i + 2]
+                                    for i in range(0, 32, 2)).upper())
+        self.assertEqual('oid',
+                         api_utils.decode_token(
+                             mock_request)[const.USER_OPENID])
+        self.assertEqual(1, mock_load.call_count)
+
+        set_token('0' * 32)
+        self.assertRaises(api_exc.ValidationError, api_utils.decode_token,
+                          mock_request)
+
+        # A forgotten key is parsed again.
+        api_utils.forget_pubkey({'pubkey': PUB_KEY})
+        set_token(fingerprint)
+        api_utils.decode_token(mock_request)
+        self.assertEqual(2, mock_load.call_count)
+
+    @mock.patch('refstack.db.check_cache_generations', mock.Mock())
+    @mock.patch.object(api_utils, '_token_cache', None)
+    @mock.patch.object(api_utils, '_pubkey_cache', None)
+    @mock.patch('refstack.db.get_user_pubkeys')
+    def test_decode_token_cache(self, mock_pubkey):
+        mock_pubkey.return_value = [{'format': 'ssh-rsa',
+                                     'pubkey': PUB_KEY}]
+        mock_request = mock.MagicMock()
+        token = jwt.encode({const.USER_OPENID: 'oid',
+                            'exp': int(time.time()) + 3600},
+                           key=PRIV_KEY, algorithm='RS256')
+        mock_request.headers = {
+            const.JWT_TOKEN_HEADER:
+                'Bearer %s' % six.text_type(token, 'utf-8')}
+
+        for _ in range(3):
+            self.assertEqual('oid',
+                             api_utils.decode_token(
+                                 mock_request)[const.USER_OPENID])
+        # The token was only verified on the first request.
+        mock_pubkey.assert_called_once_with('oid')
+        self.assertEqual(2, api_utils._token_cache.hits)
+        self.assertEqual(1, api_utils._token_cache.misses)
+
+        # Verified tokens are evicted when the pubkeys namespace changes.
+        cache.clear_namespace('other')
+        api_utils.decode_token(mock_request)
+        self.assertEqual(1, mock_pubkey.call_count)
+        cache.clear_namespace(const.CACHE_PUBKEYS)
+        api_utils.decode_token(mock_request)
+        self.assertEqual(2, mock_pubkey.call_count)
+
+        # Tokens about to expire are not cached.
+        token = jwt.encode({const.USER_OPENID: 'oid',
+                            'exp': int(time.time()) + 10},
+                           key=PRIV_KEY, algorithm='RS256')
+        mock_request.headers = {
+            const.JWT_TOKEN_HEADER:
+                'Bearer %s' % six.text_type(token, 'utf-8')}
+        api_utils.decode_token(mock_request)
+        api_utils.decode_token(mock_request)
+        self.assertEqual(4, mock_pubkey.call_count)
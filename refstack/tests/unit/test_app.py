@@ -24,7 +24,9 @@ import pecan
 import webob
 
 from refstack.api import app
+from refstack.api import constants as const
 from refstack.api import exceptions as api_exc
+from refstack.api import utils as api_utils
 
 
 def get_response_kwargs(response_mock):
@@ -174,6 +176,22 @@ class CORSHookTestCase(base.BaseTestCase):
                          state.response.headers)
 
 
+class RequestContextHookTestCase(base.BaseTestCase):
+
+    def test_request_context(self):
+        state = mock.Mock()
+        state.request.environ = {}
+        hook = app.RequestContextHook()
+        hook.on_route(state)
+        context = state.request.environ[const.REQUEST_CONTEXT_ENV]
+        self.assertIsInstance(context, api_utils.RequestContext)
+        self.assertEqual(42, context.memoize('key', lambda: 42))
+        self.assertEqual(42, context.memoize('key', lambda: 43))
+
+        hook.after(state)
+        self.assertNotIn(const.REQUEST_CONTEXT_ENV, state.request.environ)
+
+
 class SetupAppTestCase(base.BaseTestCase):
 
     def setUp(self):
@@ -185,12 +203,14 @@ class SetupAppTestCase(base.BaseTestCase):
     @mock.patch.object(app, 'JSONErrorHook')
     @mock.patch.object(app, 'CORSHook')
     @mock.patch.object(app, 'JWTAuthHook')
+    @mock.patch.object(app, 'RequestContextHook')
     @mock.patch('os.path.join')
     @mock.patch('pecan.make_app')
     @mock.patch('refstack.api.app.SessionMiddleware')
     @mock.patch('refstack.api.utils.get_token', return_value='42')
     def test_setup_app(self, get_token, session_middleware, make_app, os_join,
-                       auth_hook, json_error_hook, cors_hook, pecan_hooks):
+                       context_hook, auth_hook, json_error_hook, cors_hook,
+                       pecan_hooks):
 
         self.CONF.set_override('app_dev_mode',
                                True,
@@ -210,6 +230,7 @@ class SetupAppTestCase(base.BaseTestCase):
         json_error_hook.return_value = 'json_error_hook'
         cors_hook.return_value = 'cors_hook'
         auth_hook.return_value = 'jwt_auth_hook'
+        context_hook.return_value = 'request_context_hook'
         pecan_hooks.RequestViewerHook.return_value = 'request_viewer_hook'
         pecan_config = mock.Mock()
         pecan_config.app = {'root': 'fake_pecan_config'}
@@ -226,14 +247,15 @@ class SetupAppTestCase(base.BaseTestCase):
             debug=True,
             static_root='fake_static_root',
             template_path='fake_template_path',
-            hooks=['jwt_auth_hook', 'cors_hook', 'json_error_hook',
-                   'request_viewer_hook']
+            hooks=['request_context_hook', 'jwt_auth_hook', 'cors_hook',
+                   'json_error_hook', 'request_viewer_hook']
         )
         session_middleware.assert_called_once_with(
             'fake_app',
             {'session.key': 'refstack',
              'session.type': 'ext:database',
              'session.url': 'fake_connection',
+             'session.table_name': 'beaker_cache',
              'session.timeout': 604800,
              'session.validate_key': get_token.return_value,
              'session.sa.pool_recycle': 600}
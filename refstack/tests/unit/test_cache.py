@@ -0,0 +1,84 @@
+# Copyright (c) 2018 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+from oslotest import base
+
+from refstack.api import cache
+
+
+class LRUCacheTestCase(base.BaseTestCase):
+
+    def test_lru_eviction(self):
+        lru = cache.LRUCache(2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        # Reading 'a' makes 'b' the least recently used entry.
+        self.assertEqual(1, lru.get('a'))
+        lru.set('c', 3)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(1, lru.get('a'))
+        self.assertEqual(3, lru.get('c'))
+        self.assertEqual(2, len(lru))
+
+        lru.delete('a')
+        self.assertEqual('default', lru.get('a', 'default'))
+        lru.clear()
+        self.assertEqual(0, len(lru))
+
+    @mock.patch('time.time')
+    def test_ttl(self, mock_time):
+        mock_time.return_value = 100
+        lru = cache.LRUCache(2, ttl=10)
+        lru.set('a', 1)
+        mock_time.return_value = 109
+        self.assertEqual(1, lru.get('a'))
+        mock_time.return_value = 110
+        self.assertIsNone(lru.get('a'))
+
+    def test_disabled(self):
+        lru = cache.LRUCache(0)
+        lru.set('a', 1)
+        self.assertIsNone(lru.get('a'))
+
+    def test_stats(self):
+        lru = cache.LRUCache(2, name='fake_cache')
+        lru.set('a', 1)
+        lru.get('a')
+        lru.get('b')
+        self.assertEqual({'size': 1, 'maxsize': 2, 'hits': 1, 'misses': 1},
+                         cache.get_stats()['fake_cache'])
+
+    @mock.patch('time.time')
+    def test_expires_at(self, mock_time):
+        mock_time.return_value = 100
+        lru = cache.LRUCache(2, ttl=10)
+        lru.set('a', 1, expires_at=150)
+        lru.set('b', 2)
+        mock_time.return_value = 120
+        self.assertEqual(1, lru.get('a'))
+        self.assertIsNone(lru.get('b'))
+
+        lru.delete_matching(lambda key, value: value == 1)
+        self.assertEqual(0, len(lru))
+
+    def test_clear_namespace(self):
+        lru = cache.LRUCache(2, name='fake_cache', namespace='fake_ns')
+        other = cache.LRUCache(2, name='other_cache')
+        lru.set('a', 1)
+        other.set('a', 1)
+        cache.clear_namespace('fake_ns')
+        self.assertEqual(0, len(lru))
+        self.assertEqual(1, len(other))
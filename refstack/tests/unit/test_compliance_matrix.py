@@ -0,0 +1,130 @@
+# Copyright (c) 2018 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the compliance matrix of many test runs."""
+
+import mock
+from oslo_config import fixture as config_fixture
+from oslotest import base
+
+from refstack.api import compliance_matrix
+from refstack.api import guidelines
+
+GUIDELINE = {
+    'schema': '1.4',
+    'platform': {'required': ['compute', 'object']},
+    'components': {
+        'compute': {'required': ['cap-1', 'cap-2'],
+                    'advisory': ['cap-3']},
+        'object': {'required': ['cap-2', 'cap-4']}
+    },
+    'capabilities': {
+        'cap-1': {'tests': {
+            'test_1': {'idempotent_id': 'id-1'},
+            'test_2': {'idempotent_id': 'id-2', 'aliases': ['test_2_1']},
+            'test_3': {'idempotent_id': 'id-3', 'flagged': {'reason': 'x'}}
+        }},
+        'cap-2': {'tests': {'test_4': {'idempotent_id': 'id-4'}}},
+        'cap-3': {'tests': {'test_5': {'idempotent_id': 'id-5'}}},
+        'cap-4': {'tests': {
+            'test_1': {'idempotent_id': 'id-1'},
+            'test_6': {'idempotent_id': 'id-6'}
+        }}
+    }
+}
+
+RESULTS = [
+    [],
+    [{'name': 'test_1', 'uuid': None}, {'name': 'test_2_1', 'uuid': None},
+     {'name': 'test_4', 'uuid': None}, {'name': 'test_5', 'uuid': None}],
+    [{'name': 'renamed_1', 'uuid': '1'}, {'name': 'test_2', 'uuid': None},
+     {'name': 'test_4', 'uuid': '4'}, {'name': 'test_6', 'uuid': None}],
+    [{'name': 'test_%d' % i, 'uuid': str(i)} for i in range(1, 7)],
+]
+
+
+class ComplianceMatrixTestCase(base.BaseTestCase):
+    """Test case for the compliance matrix."""
+
+    def setUp(self):
+        super(ComplianceMatrixTestCase, self).setUp()
+        self.config_fixture = config_fixture.Config()
+        self.CONF = self.useFixture(self.config_fixture).conf
+        self.guidelines = guidelines.Guidelines()
+
+    def _check_scores(self, use_numpy):
+        index = compliance_matrix.TestIndex()
+        targets = [compliance_matrix.TargetTests.from_guideline(
+            '2018.02', GUIDELINE, target, index)
+            for target in ('platform', 'compute', 'object')]
+        rows = [index.encode(results) for results in RESULTS]
+        scores = compliance_matrix.compute_scores(rows, targets, len(index),
+                                                  use_numpy=use_numpy)
+        for results, row_scores in zip(RESULTS, scores):
+            for target, (passed, compliant) in zip(targets, row_scores):
+                expected = self.guidelines.check_compliance(
+                    GUIDELINE, results, target=target.target)
+                self.assertEqual(expected['score']['passed'], passed)
+                self.assertEqual(expected['score']['total'], target.total)
+                self.assertEqual(expected['compliant'], compliant)
+
+    def test_scores_bitsets(self):
+        """Test that bitset scores are the ones of check_compliance."""
+        self._check_scores(False)
+
+    def test_scores_numpy(self):
+        """Test that NumPy scores are the ones of check_compliance."""
+        if compliance_matrix.numpy is None:
+            self.skipTest('NumPy is not installed')
+        self._check_scores(True)
+
+    @mock.patch('refstack.db.get_test_result_sets')
+    @mock.patch.object(guidelines.Guidelines, 'get_guideline_contents')
+    @mock.patch.object(guidelines.Guidelines, 'get_guideline_list')
+    def test_get_compliance_matrix(self, mock_list, mock_contents,
+                                   mock_result_sets):
+        mock_list.return_value = {
+            'powered': [{'name': '2018.02.json', 'file': '2018.02.json'},
+                        {'name': '2017.09.json', 'file': '2017.09.json'}]}
+        mock_contents.side_effect = lambda version: (
+            GUIDELINE if version == '2018.02' else None)
+        mock_result_sets.return_value = [
+            {'id': 'id1', 'cpid': 'cpid1', 'created_at': 'date1',
+             'result_set_id': 1, 'results': RESULTS[3]},
+            {'id': 'id2', 'cpid': 'cpid1', 'created_at': 'date2',
+             'result_set_id': 2, 'results': RESULTS[0]},
+            {'id': 'id3', 'cpid': 'cpid1', 'created_at': 'date3',
+             'result_set_id': 1, 'results': RESULTS[3]},
+        ]
+        filters = {'cpid': 'cpid1'}
+
+        matrix = compliance_matrix.get_compliance_matrix(
+            filters, targets=['compute', 'dns'], limit=10)
+
+        mock_result_sets.assert_called_once_with(filters, 10)
+        mock_contents.assert_has_calls([mock.call('2018.02'),
+                                        mock.call('2017.09')])
+        self.assertEqual([{'guideline': '2018.02', 'target': 'compute',
+                           'total': 4}], matrix['columns'])
+        passed = {'passed': 4, 'percentage': 100.0, 'compliant': True}
+        self.assertEqual([
+            {'id': 'id1', 'cpid': 'cpid1', 'created_at': 'date1',
+             'scores': [passed]},
+            {'id': 'id2', 'cpid': 'cpid1', 'created_at': 'date2',
+             'scores': [{'passed': 0, 'percentage': 0.0,
+                         'compliant': False}]},
+            {'id': 'id3', 'cpid': 'cpid1', 'created_at': 'date3',
+             'scores': [passed]},
+        ], matrix['results'])
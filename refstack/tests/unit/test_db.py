@@ -16,10 +16,12 @@
 """Tests for database."""
 
 import base64
+import collections
 import hashlib
 import six
 import mock
 from oslo_config import fixture as config_fixture
+from oslo_db import exception as db_exc
 from oslotest import base
 import sqlalchemy.orm
 
@@ -28,6 +30,8 @@ from refstack.api import constants as api_const
 from refstack.db.sqlalchemy import api
 from refstack.db.sqlalchemy import models
 
+NameRow = collections.namedtuple('NameRow', ('id', 'name', 'uuid'))
+
 
 class DBAPITestCase(base.BaseTestCase):
     """Test case for database API."""
@@ -35,7 +39,33 @@ class DBAPITestCase(base.BaseTestCase):
     @mock.patch.object(api, 'store_test_results')
     def test_store_test_results(self, mock_store_test_results):
         db.store_test_results('fake_results')
-        mock_store_test_results.assert_called_once_with('fake_results')
+        mock_store_test_results.assert_called_once_with('fake_results',
+                                                        test_id=None)
+
+    @mock.patch.object(api, 'store_test_results_batch')
+    def test_store_test_results_batch(self, mock_db):
+        db.store_test_results_batch(['fake_results'])
+        mock_db.assert_called_once_with(['fake_results'])
+
+    @mock.patch.object(api, 'spool_test_results')
+    def test_spool_test_results(self, mock_db):
+        db.spool_test_results('fake_results', 'fake_openid')
+        mock_db.assert_called_once_with('fake_results', openid='fake_openid')
+
+    @mock.patch.object(api, 'claim_spooled_upload')
+    def test_claim_spooled_upload(self, mock_db):
+        db.claim_spooled_upload(600)
+        mock_db.assert_called_once_with(600)
+
+    @mock.patch.object(api, 'release_spooled_upload')
+    def test_release_spooled_upload(self, mock_db):
+        db.release_spooled_upload('fake_id', 'fake_error', failed=True)
+        mock_db.assert_called_once_with('fake_id', 'fake_error', failed=True)
+
+    @mock.patch.object(api, 'purge_expired_sessions')
+    def test_purge_expired_sessions(self, mock_db):
+        db.purge_expired_sessions('fake_table', 'fake_date', 100)
+        mock_db.assert_called_once_with('fake_table', 'fake_date', 100)
 
     @mock.patch.object(api, 'get_test_result')
     def test_get_test_result(self, mock_get_test_result):
@@ -53,12 +83,125 @@ class DBAPITestCase(base.BaseTestCase):
         db.get_test_result_records(1, 2, filters)
         mock_db.assert_called_once_with(1, 2, filters)
 
+    @mock.patch.object(api, 'get_test_result_sets')
+    def test_get_test_result_sets(self, mock_db):
+        filters = mock.Mock()
+        db.get_test_result_sets(filters, 10)
+        mock_db.assert_called_once_with(filters, 10)
+
     @mock.patch.object(api, 'get_test_result_records_count')
     def test_get_test_result_records_count(self, mock_db):
         filters = mock.Mock()
         db.get_test_result_records_count(filters)
         mock_db.assert_called_once_with(filters)
 
+    @mock.patch.object(api, 'get_test_result_owners')
+    def test_get_test_result_owners(self, mock_db):
+        db.get_test_result_owners(['fake_id'])
+        mock_db.assert_called_once_with(['fake_id'])
+
+    @mock.patch.object(api, 'get_test_result_records_by_cursor')
+    def test_get_test_result_records_by_cursor(self, mock_db):
+        filters = mock.Mock()
+        db.get_test_result_records_by_cursor(None, 2, filters)
+        mock_db.assert_called_once_with(None, 2, filters)
+
+    @mock.patch.object(db.api, '_membership_cache', None)
+    @mock.patch.object(db.api, 'check_cache_generations', mock.Mock())
+    @mock.patch.object(api, 'remove_user_from_group')
+    @mock.patch.object(api, 'add_user_to_group')
+    @mock.patch.object(api, 'is_user_in_group')
+    @mock.patch.object(api, 'get_foundation_group_id')
+    def test_is_foundation_user(self, mock_group_id, mock_in_group,
+                                mock_add, mock_remove):
+        mock_group_id.return_value = 'fake_group'
+        mock_in_group.return_value = True
+        self.assertTrue(db.is_foundation_user('fake_user'))
+        self.assertTrue(db.is_foundation_user('fake_user'))
+        mock_group_id.assert_called_once_with()
+        mock_in_group.assert_called_once_with('fake_user', 'fake_group')
+        self.assertFalse(db.is_foundation_user(None))
+
+        # Membership changes are seen right away.
+        db.remove_user_from_group('fake_user', 'fake_group')
+        mock_in_group.return_value = False
+        self.assertFalse(db.is_foundation_user('fake_user'))
+        db.add_user_to_group('fake_user', 'fake_group', 'fake_admin')
+        mock_in_group.return_value = True
+        self.assertTrue(db.is_foundation_user('fake_user'))
+        self.assertEqual(3, mock_in_group.call_count)
+
+    @mock.patch.object(db.api, '_membership_cache', None)
+    @mock.patch.object(db.api, 'check_cache_generations', mock.Mock())
+    @mock.patch.object(api, 'get_foundation_group_id', return_value=None)
+    def test_is_foundation_user_no_foundation(self, mock_group_id):
+        self.assertFalse(db.is_foundation_user('fake_user'))
+        self.assertFalse(db.is_foundation_user('fake_user'))
+        mock_group_id.assert_called_once_with()
+
+    @mock.patch.object(db.api, '_membership_cache', None)
+    @mock.patch.object(db.api, 'check_cache_generations', mock.Mock())
+    @mock.patch.object(api, 'delete_organization')
+    @mock.patch.object(api, 'is_user_in_group', return_value=True)
+    @mock.patch.object(api, 'get_organization_group_id')
+    def test_is_organization_user(self, mock_group_id, mock_in_group,
+                                  mock_delete):
+        mock_group_id.return_value = 'fake_group'
+        self.assertTrue(db.is_organization_user('fake_org', 'user_1'))
+        self.assertTrue(db.is_organization_user('fake_org', 'user_2'))
+        mock_group_id.assert_called_once_with('fake_org')
+        self.assertEqual(2, mock_in_group.call_count)
+
+        db.delete_organization('fake_org')
+        mock_group_id.side_effect = api.NotFound('Organization')
+        self.assertRaises(api.NotFound, db.is_organization_user,
+                          'fake_org', 'user_1')
+
+    @mock.patch.object(api, 'is_product_admin')
+    def test_is_product_admin(self, mock_db):
+        self.assertEqual(mock_db.return_value,
+                         db.is_product_admin('fake_user', 'fake_product'))
+        mock_db.assert_called_once_with('fake_user', 'fake_product')
+
+    @mock.patch.object(api, 'rebuild_product_acl')
+    def test_rebuild_product_acl(self, mock_db):
+        db.rebuild_product_acl()
+        mock_db.assert_called_once_with()
+
+    @mock.patch.object(api, 'get_cache_generations')
+    def test_get_cache_generations(self, mock_db):
+        db.get_cache_generations()
+        mock_db.assert_called_once_with()
+
+    @mock.patch.object(db.api, '_cache_generations_checked', 0)
+    @mock.patch.object(db.api, '_cache_generations', None)
+    @mock.patch('refstack.api.cache.clear_namespace')
+    @mock.patch('time.time')
+    @mock.patch.object(api, 'get_cache_generations')
+    def test_check_cache_generations(self, mock_generations, mock_time,
+                                     mock_clear):
+        mock_time.return_value = 100
+        mock_generations.return_value = {'membership': 1}
+        db.check_cache_generations()
+        mock_clear.assert_not_called()
+
+        # The table is not read again within the check interval.
+        mock_generations.return_value = {'membership': 2}
+        mock_time.return_value = 100.5
+        db.check_cache_generations()
+        self.assertEqual(1, mock_generations.call_count)
+        mock_clear.assert_not_called()
+
+        mock_time.return_value = 101
+        db.check_cache_generations()
+        self.assertEqual(2, mock_generations.call_count)
+        mock_clear.assert_called_once_with('membership')
+
+        mock_clear.reset_mock()
+        mock_time.return_value = 102
+        db.check_cache_generations()
+        mock_clear.assert_not_called()
+
     @mock.patch.object(api, 'user_get')
     def test_user_get(self, mock_db):
         user_openid = 'user@example.com'
@@ -156,13 +299,12 @@ class DBBackendTestCase(base.BaseTestCase):
         self.assertEqual([{'meta': 1}],
                          api._to_dict([fake_model], allowed_keys=('meta')))
 
+    @mock.patch.object(api, '_get_result_set_id')
     @mock.patch.object(api, 'get_session')
-    @mock.patch('refstack.db.sqlalchemy.models.TestResults')
-    @mock.patch('refstack.db.sqlalchemy.models.Test')
-    @mock.patch('refstack.db.sqlalchemy.models.TestMeta')
     @mock.patch('uuid.uuid4')
-    def test_store_test_results(self, mock_uuid, mock_test_meta, mock_test,
-                                mock_test_result, mock_get_session):
+    def test_store_test_results(self, mock_uuid, mock_get_session,
+                                mock_get_result_set_id):
+        mock_get_result_set_id.return_value = 7
         fake_tests_result = {
             'cpid': 'foo',
             'duration_seconds': 10,
@@ -170,33 +312,192 @@ class DBBackendTestCase(base.BaseTestCase):
                 {'name': 'tempest.some.test'},
                 {'name': 'tempest.test', 'uid': '12345678'}
             ],
-            'meta': {'answer': 42}
+            'meta': {'answer': 42, api_const.USER: 'fake_openid'}
         }
         _id = 12345
 
         mock_uuid.return_value = _id
-        test = mock_test.return_value
-        test.save = mock.Mock()
-
         session = mock_get_session.return_value
         session.begin = mock.MagicMock()
 
-        test_result = mock_test_result.return_value
-        test_result.save = mock.Mock()
-
         test_id = api.store_test_results(fake_tests_result)
 
-        mock_test.assert_called_once_with()
         mock_get_session.assert_called_once_with()
-        test.save.assert_called_once_with(session)
         session.begin.assert_called_once_with()
-
         self.assertEqual(test_id, six.text_type(_id))
-        self.assertEqual(test.cpid, fake_tests_result['cpid'])
-        self.assertEqual(test.duration_seconds,
-                         fake_tests_result['duration_seconds'])
-        self.assertEqual(mock_test_result.call_count,
-                         len(fake_tests_result['results']))
+        mock_get_result_set_id.assert_called_once_with(
+            session, [('tempest.some.test', ''), ('tempest.test', '')])
+
+        # One statement for the test run and one for its metadata.
+        calls = session.execute.call_args_list
+        self.assertEqual(2, len(calls))
+        test_row = calls[0][0][1]
+        self.assertEqual('foo', test_row['cpid'])
+        self.assertEqual(10, test_row['duration_seconds'])
+        self.assertEqual('fake_openid', test_row['owner_openid'])
+        self.assertEqual(api_const.TEST_PRIVATE, test_row['visibility'])
+        self.assertEqual(7, test_row['result_set_id'])
+        self.assertEqual(
+            sorted([{'test_id': test_id, 'meta_key': 'answer', 'value': 42},
+                    {'test_id': test_id, 'meta_key': api_const.USER,
+                     'value': 'fake_openid'}],
+                   key=lambda row: row['meta_key']),
+            sorted(calls[1][0][1], key=lambda row: row['meta_key']))
+
+    @mock.patch.object(api, '_get_result_set_id')
+    @mock.patch.object(api, 'get_session')
+    def test_store_test_results_duplication(self, mock_get_session,
+                                            mock_get_result_set_id):
+        session = mock_get_session.return_value
+        session.begin = mock.MagicMock()
+        mock_get_result_set_id.side_effect = db_exc.DBDuplicateEntry()
+
+        self.assertRaises(api.Duplication, api.store_test_results,
+                          {'cpid': 'foo', 'duration_seconds': 10,
+                           'results': [{'name': 'tempest.test'},
+                                       {'name': 'tempest.other'}]})
+
+        # Test names are unique within a run regardless of their uuids
+        # and case.
+        mock_get_result_set_id.reset_mock()
+        for results in ([{'name': 'tempest.test'},
+                         {'name': 'tempest.test'}],
+                        [{'name': 'tempest.test', 'uuid': 'uuid-1'},
+                         {'name': 'tempest.test', 'uuid': 'uuid-2'}],
+                        [{'name': 'tempest.test'},
+                         {'name': 'Tempest.Test'}]):
+            self.assertRaises(api.Duplication, api.store_test_results,
+                              {'cpid': 'foo', 'results': results})
+        mock_get_result_set_id.assert_not_called()
+
+    def test_result_set_digest(self):
+        digest = api._result_set_digest([('b', ''), ('a', 'fake_uuid')])
+        self.assertEqual(64, len(digest))
+        self.assertEqual(
+            digest, api._result_set_digest([('a', 'fake_uuid'), ('b', '')]))
+        self.assertNotEqual(
+            digest, api._result_set_digest([('a', ''), ('b', '')]))
+
+    @mock.patch.object(api, '_get_test_name_ids')
+    def test_get_result_set_id(self, mock_get_name_ids):
+        self.CONF.set_override('results_insert_batch_size', 1)
+        names = [('tempest.a', ''), ('tempest.b', '')]
+        session = mock.MagicMock()
+        lookup = session.query.return_value.filter_by.return_value\
+            .with_for_update.return_value.first
+
+        # A known list of tests only references the existing set.
+        lookup.return_value = mock.Mock(id=3)
+        self.assertEqual(3, api._get_result_set_id(session, names))
+        session.execute.assert_not_called()
+        mock_get_name_ids.assert_not_called()
+        session.query.return_value.filter_by.assert_called_with(id=3)
+        update = session.query.return_value.filter_by.return_value.update
+        self.assertEqual(1, update.call_count)
+
+        # A new list of tests is stored once, in batches.
+        lookup.return_value = None
+        session.execute.return_value.inserted_primary_key = [4]
+        mock_get_name_ids.return_value = {('tempest.a', ''): 1,
+                                          ('tempest.b', ''): 2}
+        self.assertEqual(4, api._get_result_set_id(session, names))
+        calls = session.execute.call_args_list
+        self.assertEqual(3, len(calls))
+        self.assertEqual(api._result_set_digest(names),
+                         calls[0][0][1]['digest'])
+        self.assertEqual([{'result_set_id': 4, 'name_id': 1}],
+                         calls[1][0][1])
+        self.assertEqual([{'result_set_id': 4, 'name_id': 2}],
+                         calls[2][0][1])
+
+        # The same list of tests was stored by a concurrent upload.
+        session.execute.reset_mock()
+        lookup.side_effect = [None, mock.Mock(id=5)]
+        session.execute.side_effect = db_exc.DBDuplicateEntry()
+        self.assertEqual(5, api._get_result_set_id(session, names))
+        self.assertEqual(1, session.execute.call_count)
+
+    @mock.patch.object(api, '_insert_test_results')
+    @mock.patch.object(api, 'get_session')
+    @mock.patch('uuid.uuid4')
+    def test_store_test_results_batch(self, mock_uuid, mock_get_session,
+                                      mock_insert):
+        self.CONF.set_override('results_batch_chunk_size', 2)
+        mock_uuid.side_effect = ['id1', 'id2', 'id3']
+        session = mock_get_session.return_value
+        mock_insert.side_effect = [None, db_exc.DBDuplicateEntry(), None]
+
+        result = api.store_test_results_batch(['run1', 'run2', 'run3'])
+
+        self.assertEqual([{'test_id': 'id1'},
+                          {'error': 'Test results contain duplicate '
+                                    'entries.'},
+                          {'test_id': 'id3'}], result)
+        # Two chunks, each run in its own savepoint.
+        self.assertEqual(2, session.begin.call_count)
+        self.assertEqual(3, session.begin_nested.call_count)
+        mock_insert.assert_any_call(session, 'run3', 'id3')
+
+    @mock.patch.object(api, '_insert_test_results')
+    @mock.patch.object(api, 'get_session')
+    @mock.patch('uuid.uuid4')
+    def test_store_test_results_batch_db_error(self, mock_uuid,
+                                               mock_get_session,
+                                               mock_insert):
+        self.CONF.set_override('results_batch_chunk_size', 1)
+        mock_uuid.side_effect = ['id1', 'id2', 'id3']
+        session = mock_get_session.return_value
+        mock_insert.side_effect = [None, db_exc.DBDataError(), None]
+
+        result = api.store_test_results_batch(['run1', 'run2', 'run3'])
+
+        self.assertEqual([{'test_id': 'id1'},
+                          {'error': 'Test results could not be stored.'},
+                          {'test_id': 'id3'}], result)
+        # The failure of the second chunk doesn't abort the third one.
+        self.assertEqual(3, session.begin.call_count)
+        mock_insert.assert_any_call(session, 'run3', 'id3')
+
+    @mock.patch.object(api, 'get_session')
+    @mock.patch('refstack.db.sqlalchemy.models.ResultUpload')
+    def test_spool_test_results(self, mock_upload, mock_get_session):
+        session = mock_get_session.return_value
+        upload = mock_upload.return_value
+
+        upload_id = api.spool_test_results({'cpid': 'foo'}, 'fake_openid')
+
+        self.assertEqual(upload.id, upload_id)
+        self.assertEqual(api_const.UPLOAD_PENDING, upload.status)
+        self.assertEqual('fake_openid', upload.openid)
+        self.assertEqual(b'{"cpid": "foo"}', upload.data)
+        upload.save.assert_called_once_with(session)
+
+    @mock.patch.object(api, '_to_dict', side_effect=lambda x: {'id': x.id})
+    @mock.patch.object(api, 'get_session')
+    def test_claim_spooled_upload(self, mock_get_session, mock_to_dict):
+        session = mock_get_session.return_value
+        candidates = session.query.return_value.filter.return_value\
+            .order_by.return_value.limit.return_value.all
+        candidates.return_value = [
+            mock.Mock(id='taken', status='pending', claimed_at=None),
+            mock.Mock(id='free', status='pending', claimed_at=None)]
+        filter_by = session.query.return_value.filter_by
+        # The first candidate is claimed by another worker in between.
+        filter_by.return_value.update.side_effect = [0, 1]
+        filter_by.return_value.first.return_value = mock.Mock(
+            id='free', data=b'{"cpid": "foo"}')
+
+        upload = api.claim_spooled_upload(600)
+
+        self.assertEqual({'id': 'free', 'results': {'cpid': 'foo'}}, upload)
+        filter_by.assert_any_call(id='taken', status='pending',
+                                  claimed_at=None)
+        update_values = filter_by.return_value.update.call_args[0][0]
+        self.assertEqual(api_const.UPLOAD_PROCESSING,
+                         update_values['status'])
+
+        candidates.return_value = []
+        self.assertIsNone(api.claim_spooled_upload(600))
 
     @mock.patch.object(api, 'get_session')
     @mock.patch('refstack.db.sqlalchemy.models.Test')
@@ -231,21 +532,42 @@ class DBBackendTestCase(base.BaseTestCase):
         test_query = mock.Mock()
         test_meta_query = mock.Mock()
         test_results_query = mock.Mock()
+        result_set_query = mock.Mock()
         session.query = mock.Mock(side_effect={
             mock_models.Test: test_query,
             mock_models.TestMeta: test_meta_query,
-            mock_models.TestResults: test_results_query
+            mock_models.TestResults: test_results_query,
+            mock_models.ResultSet: result_set_query
         }.get)
+        test_query.filter_by.return_value.first.return_value = \
+            mock.Mock(result_set_id=3)
+        result_set_query.filter_by.return_value.with_for_update\
+            .return_value.first.return_value = mock.Mock(ref_count=1)
         db.delete_test_result('fake_id')
         session.begin.assert_called_once_with()
         test_query.filter_by.return_value.first\
             .assert_called_once_with()
         test_meta_query.filter_by.return_value.delete\
             .assert_called_once_with()
-        test_results_query.filter_by.return_value.delete\
-            .assert_called_once_with()
         session.delete.assert_called_once_with(
             test_query.filter_by.return_value.first.return_value)
+        # The last reference to the result set is gone.
+        test_results_query.filter_by.assert_called_once_with(
+            result_set_id=3)
+        test_results_query.filter_by.return_value.delete\
+            .assert_called_once_with()
+        result_set_query.filter_by.return_value.delete\
+            .assert_called_once_with()
+
+        result_set_query.reset_mock()
+        test_results_query.reset_mock()
+        result_set_query.filter_by.return_value.with_for_update\
+            .return_value.first.return_value = mock.Mock(ref_count=2)
+        db.delete_test_result('fake_id')
+        test_results_query.filter_by.assert_not_called()
+        result_set_query.filter_by.return_value.delete.assert_not_called()
+        self.assertEqual(
+            1, result_set_query.filter_by.return_value.update.call_count)
 
         mock_get_session.return_value = mock.MagicMock()
         session = mock_get_session.return_value
@@ -313,6 +635,26 @@ class DBBackendTestCase(base.BaseTestCase):
         self.assertEqual('fake_key', mock_meta_item.meta_key)
         self.assertEqual(42, mock_meta_item.value)
 
+    @mock.patch('refstack.db.sqlalchemy.api.models')
+    @mock.patch.object(api, 'get_session')
+    def test_save_test_result_meta_item_shared(self, mock_get_session,
+                                               mock_models):
+        session = mock_get_session.return_value
+        mock_test = mock.Mock(owner_openid='fake_openid', is_shared=False)
+        session.query.return_value.filter_by.return_value\
+            .first.return_value = mock_test
+        db.save_test_result_meta_item('fake_id', api_const.SHARED_TEST_RUN,
+                                      'true')
+        self.assertTrue(mock_test.is_shared)
+        self.assertEqual(api_const.TEST_PUBLIC, mock_test.visibility)
+        mock_test.save.assert_called_once_with(session)
+
+        mock_test.reset_mock()
+        db.delete_test_result_meta_item('fake_id', api_const.SHARED_TEST_RUN)
+        self.assertFalse(mock_test.is_shared)
+        self.assertEqual(api_const.TEST_PRIVATE, mock_test.visibility)
+        mock_test.save.assert_called_once_with(session)
+
     @mock.patch('refstack.db.sqlalchemy.api.models')
     @mock.patch.object(api, 'get_session')
     def test_delete_test_result_meta_item(self, mock_get_session, mock_models):
@@ -335,35 +677,95 @@ class DBBackendTestCase(base.BaseTestCase):
                           'fake_id', 'fake_key')
 
     @mock.patch.object(api, 'get_session')
-    @mock.patch('refstack.db.sqlalchemy.models.TestResults')
-    def test_get_test_results(self, mock_test_result, mock_get_session):
-        mock_test_result.name = mock.Mock()
-
+    @mock.patch('refstack.db.sqlalchemy.api.models')
+    def test_get_test_results(self, mock_models, mock_get_session):
         session = mock_get_session.return_value
-        session.query = mock.Mock()
         query = session.query.return_value
-        query.filter_by = mock.Mock()
-        filter_by = query.filter_by.return_value
-        mock_result = 'fake_test_results'
-        expected_result = ['fake_test_results']
-        filter_by.all = mock.Mock(return_value=[mock_result])
+        filtered = query.join.return_value.join.return_value\
+            .filter.return_value
+        filtered.all.return_value = [
+            NameRow(None, 'tempest.test1', ''),
+            NameRow(None, 'tempest.test2', 'fake_uuid')]
 
-        test_id = 'fake_id'
-        actual_result = api.get_test_results(test_id)
+        actual_result = api.get_test_results('fake_id')
 
         mock_get_session.assert_called_once_with()
-        session.query.assert_called_once_with(mock_test_result)
-        query.filter_by.assert_called_once_with(test_id=test_id)
-        filter_by.all.assert_called_once_with()
-        self.assertEqual(expected_result, actual_result)
+        session.query.assert_called_once_with(mock_models.TestName.name,
+                                              mock_models.TestName.uuid)
+        self.assertEqual([{'name': 'tempest.test1', 'uuid': None},
+                          {'name': 'tempest.test2', 'uuid': 'fake_uuid'}],
+                         actual_result)
+
+    @mock.patch('refstack.db.sqlalchemy.api.models')
+    def test_get_test_name_ids(self, mock_models):
+        mock_models.TestName.__table__ = mock.MagicMock()
+        session = mock.MagicMock()
+        query = session.query.return_value.filter.return_value
+        query.all.side_effect = [
+            [NameRow(1, 'tempest.known', ''),
+             NameRow(7, 'tempest.known', 'other')],
+            [NameRow(2, 'tempest.new', 'fake_uuid')]]
+
+        result = api._get_test_name_ids(
+            session, [('tempest.known', ''), ('tempest.new', 'fake_uuid'),
+                      ('tempest.known', '')])
+
+        self.assertEqual({('tempest.known', ''): 1,
+                          ('tempest.new', 'fake_uuid'): 2}, result)
+        session.execute.assert_called_once_with(
+            mock_models.TestName.__table__.insert.return_value,
+            [{'name': 'tempest.new', 'uuid': 'fake_uuid'}])
+
+    @mock.patch('refstack.db.sqlalchemy.api.models')
+    def test_get_test_name_ids_concurrent_insert(self, mock_models):
+        mock_models.TestName.__table__ = mock.MagicMock()
+        session = mock.MagicMock()
+        query = session.query.return_value.filter.return_value
+        query.all.side_effect = [
+            [],
+            [NameRow(1, 'tempest.a', ''),
+             NameRow(2, 'tempest.b', '')]]
+        session.execute.side_effect = [db_exc.DBDuplicateEntry(),
+                                       db_exc.DBDuplicateEntry(), None]
+
+        result = api._get_test_name_ids(
+            session, [('tempest.a', ''), ('tempest.b', '')])
+
+        self.assertEqual({('tempest.a', ''): 1, ('tempest.b', ''): 2},
+                         result)
+        self.assertEqual(3, session.execute.call_count)
+
+    @mock.patch('refstack.db.sqlalchemy.api.models')
+    @mock.patch.object(api, 'get_session')
+    def test_get_test_result_owners(self, mock_get_session, mock_models):
+        self.assertEqual({}, api.get_test_result_owners([]))
+        mock_get_session.assert_not_called()
+
+        session = mock_get_session.return_value
+        (session.query.return_value
+         .outerjoin.return_value
+         .outerjoin.return_value
+         .filter.return_value) = [('test1', 'ver1', 'org1', None, False),
+                                  ('test2', None, None, 'fake_openid', True)]
+
+        result = api.get_test_result_owners(['test1', 'test2'])
+        self.assertEqual(
+            {'test1': {'product_version_id': 'ver1',
+                       'organization_id': 'org1',
+                       api_const.USER: None,
+                       api_const.SHARED_TEST_RUN: False},
+             'test2': {'product_version_id': None,
+                       'organization_id': None,
+                       api_const.USER: 'fake_openid',
+                       api_const.SHARED_TEST_RUN: True}},
+            result)
+        self.assertEqual(1, session.query.call_count)
 
     @mock.patch('refstack.db.sqlalchemy.models.Test')
-    @mock.patch('refstack.db.sqlalchemy.models.TestMeta')
-    def test_apply_filters_for_query_unsigned(self, mock_meta,
-                                              mock_test):
+    def test_apply_filters_for_query_unsigned(self, mock_test):
         query = mock.Mock()
         mock_test.created_at = six.text_type()
-        mock_meta.test_id = six.text_type()
+        mock_test.visibility = six.text_type()
 
         filters = {
             api_const.START_DATE: 'fake1',
@@ -376,10 +778,6 @@ class DBBackendTestCase(base.BaseTestCase):
                           .filter.return_value
                           .filter.return_value)
 
-        unsigned_query.session.query.return_value.filter_by.side_effect = (
-            'signed_results_query', 'shared_results_query'
-        )
-
         result = api._apply_filters_for_query(query, filters)
 
         query.filter.assert_called_once_with(mock_test.created_at >=
@@ -393,30 +791,15 @@ class DBBackendTestCase(base.BaseTestCase):
         query.filter.assert_called_once_with(mock_test.cpid ==
                                              filters[api_const.CPID])
 
-        unsigned_query.session.query.assert_has_calls((
-            mock.call(mock_meta.test_id),
-            mock.call().filter_by(meta_key='user'),
-            mock.call(mock_meta.test_id),
-            mock.call().filter_by(meta_key='shared'),
-        ))
-        unsigned_query.filter.assert_has_calls((
-            mock.call(mock_test.id.notin_.return_value),
-            mock.call(mock_test.id.in_.return_value),
-            mock.call().union(unsigned_query.filter.return_value)
-        ))
-        filtered_query = unsigned_query.filter.return_value.union.return_value
-
-        self.assertEqual(result, filtered_query)
+        unsigned_query.filter.assert_called_once_with(
+            mock_test.visibility == api_const.TEST_PUBLIC)
+        self.assertEqual(result, unsigned_query.filter.return_value)
 
     @mock.patch('refstack.db.sqlalchemy.models.Test')
-    @mock.patch('refstack.db.sqlalchemy.models.TestMeta')
-    def test_apply_filters_for_query_signed(self, mock_meta,
-                                            mock_test):
+    def test_apply_filters_for_query_signed(self, mock_test):
         query = mock.Mock()
         mock_test.created_at = six.text_type()
-        mock_meta.test_id = six.text_type()
-        mock_meta.meta_key = 'user'
-        mock_meta.value = 'test-openid'
+        mock_test.owner_openid = six.text_type()
 
         filters = {
             api_const.START_DATE: 'fake1',
@@ -434,14 +817,8 @@ class DBBackendTestCase(base.BaseTestCase):
 
         result = api._apply_filters_for_query(query, filters)
 
-        signed_query.join.assert_called_once_with(mock_test.meta)
-        signed_query = signed_query.join.return_value
         signed_query.filter.assert_called_once_with(
-            mock_meta.meta_key == api_const.USER
-        )
-        signed_query = signed_query.filter.return_value
-        signed_query.filter.assert_called_once_with(
-            mock_meta.value == filters[api_const.OPENID]
+            mock_test.owner_openid == filters[api_const.OPENID]
         )
         filtered_query = signed_query.filter.return_value
         self.assertEqual(result, filtered_query)
@@ -479,6 +856,85 @@ class DBBackendTestCase(base.BaseTestCase):
         ordered_query.offset.assert_called_once_with(per_page)
         query_with_offset.limit.assert_called_once_with(per_page)
 
+    @mock.patch.object(api, '_apply_filters_for_query')
+    @mock.patch.object(api, 'get_session')
+    @mock.patch('refstack.db.sqlalchemy.api.models')
+    def test_get_test_result_sets(self, mock_models, mock_get_session,
+                                  mock_apply):
+        TestRow = collections.namedtuple(
+            'TestRow', ('id', 'cpid', 'created_at', 'result_set_id'))
+        ResultRow = collections.namedtuple(
+            'ResultRow', ('result_set_id', 'name', 'uuid'))
+        filters = mock.Mock()
+        session = mock_get_session.return_value
+        tests_query = mock.Mock()
+        results_query = mock.Mock()
+        session.query.side_effect = [tests_query, results_query]
+        mock_apply.return_value.order_by.return_value.limit.return_value\
+            .all.return_value = [TestRow('id1', 'cpid1', 'date1', 2),
+                                 TestRow('id2', 'cpid2', 'date2', 1),
+                                 TestRow('id3', 'cpid3', 'date3', 2),
+                                 TestRow('id4', 'cpid4', 'date4', None)]
+        results_query.join.return_value.filter.return_value\
+            .all.return_value = [ResultRow(1, 'tempest.test1', ''),
+                                 ResultRow(2, 'tempest.test2', 'fake_uuid')]
+
+        result = api.get_test_result_sets(filters, 10)
+
+        mock_apply.assert_called_once_with(tests_query, filters)
+        mock_apply.return_value.order_by.return_value.limit\
+            .assert_called_once_with(10)
+        results_query.join.return_value.filter.assert_called_once_with(
+            mock_models.TestResults.result_set_id.in_.return_value)
+        mock_models.TestResults.result_set_id.in_.assert_called_once_with(
+            [1, 2])
+        test2 = [{'name': 'tempest.test2', 'uuid': 'fake_uuid'}]
+        self.assertEqual([
+            {'id': 'id1', 'cpid': 'cpid1', 'created_at': 'date1',
+             'result_set_id': 2, 'results': test2},
+            {'id': 'id2', 'cpid': 'cpid2', 'created_at': 'date2',
+             'result_set_id': 1,
+             'results': [{'name': 'tempest.test1', 'uuid': None}]},
+            {'id': 'id3', 'cpid': 'cpid3', 'created_at': 'date3',
+             'result_set_id': 2, 'results': test2},
+            {'id': 'id4', 'cpid': 'cpid4', 'created_at': 'date4',
+             'result_set_id': None, 'results': []}], result)
+        self.assertIs(result[0]['results'], result[2]['results'])
+
+    @mock.patch.object(api, '_to_dict', side_effect=lambda x: x)
+    @mock.patch.object(api, '_apply_filters_for_query')
+    @mock.patch.object(api, 'get_session')
+    def test_get_test_result_records_by_cursor(self, mock_get_session,
+                                               mock_apply, mock_to_dict):
+        filters = mock.Mock()
+        filtered_query = mock_apply.return_value
+        filtered_query.order_by.return_value.limit.return_value\
+            .all.return_value = 'fake_uploads'
+
+        result = api.get_test_result_records_by_cursor(None, 10, filters)
+        self.assertEqual('fake_uploads', result)
+        filtered_query.filter.assert_not_called()
+        filtered_query.order_by.return_value.limit.assert_called_once_with(
+            10)
+
+        seek_query = filtered_query.filter.return_value
+        seek_query.order_by.return_value.limit.return_value\
+            .all.return_value = 'next_uploads'
+        result = api.get_test_result_records_by_cursor(
+            ('fake_date', 'fake_id'), 10, filters)
+        self.assertEqual('next_uploads', result)
+        self.assertEqual(1, filtered_query.filter.call_count)
+        # Runs older than the position, or as old with a lower id.
+        criterion = filtered_query.filter.call_args[0][0]
+        self.assertEqual(
+            'test.created_at < :created_at_1 OR '
+            'test.created_at = :created_at_2 AND test.id < :id_1',
+            str(criterion))
+        self.assertEqual(
+            {'created_at_1': 'fake_date', 'created_at_2': 'fake_date',
+             'id_1': 'fake_id'},
+            criterion.compile().params)
+
     @mock.patch.object(api, '_apply_filters_for_query')
     @mock.patch.object(api, 'get_session')
     @mock.patch('refstack.db.sqlalchemy.models.Test')
@@ -609,9 +1065,12 @@ class DBBackendTestCase(base.BaseTestCase):
         self.assertRaises(db.Duplication,
                           db.store_pubkey, pubkey_info)
 
+    @mock.patch('refstack.api.cache.clear_namespace')
+    @mock.patch.object(api, '_bump_cache_generation')
     @mock.patch.object(api, 'get_session')
     @mock.patch('refstack.db.sqlalchemy.api.models')
-    def test_delete_pubkey(self, mock_models, mock_get_session):
+    def test_delete_pubkey(self, mock_models, mock_get_session, mock_bump,
+                           mock_clear):
         session = mock_get_session.return_value
         db.delete_pubkey('key_id')
         key = session\
@@ -623,6 +1082,9 @@ class DBBackendTestCase(base.BaseTestCase):
             id='key_id')
         session.delete.assert_called_once_with(key)
         session.begin.assert_called_once_with()
+        # Keys and tokens cached by all processes are dropped.
+        mock_bump.assert_called_once_with(session, api_const.CACHE_PUBKEYS)
+        mock_clear.assert_called_once_with(api_const.CACHE_PUBKEYS)
 
     @mock.patch.object(api, 'get_session')
     @mock.patch('refstack.db.sqlalchemy.api.models')
@@ -640,9 +1102,68 @@ class DBBackendTestCase(base.BaseTestCase):
             openid='user_id')
         self.assertEqual(keys, actual_keys)
 
+    @mock.patch.object(api, 'get_session')
+    @mock.patch('refstack.db.sqlalchemy.models.CacheGeneration')
+    def test_bump_cache_generation(self, mock_model, mock_get_session):
+        mock_model.__table__ = mock.MagicMock()
+        session = mock_get_session.return_value
+        query = session.query.return_value.filter_by.return_value
+        query.update.return_value = 1
+        api._bump_cache_generation(session, 'membership')
+        session.query.return_value.filter_by.assert_called_once_with(
+            namespace='membership')
+        query.update.assert_called_once_with(
+            {'generation': mock_model.generation.__add__.return_value},
+            synchronize_session=False)
+        session.execute.assert_not_called()
+
+        # The row of a new namespace is added.
+        query.update.reset_mock()
+        query.update.return_value = 0
+        api._bump_cache_generation(session, 'membership')
+        session.begin_nested.assert_called_once_with()
+        session.execute.assert_called_once_with(
+            mock_model.__table__.insert.return_value, mock.ANY)
+        self.assertEqual({'namespace': 'membership', 'generation': 1},
+                         {k: v for k, v in
+                          session.execute.call_args[0][1].items()
+                          if k != 'created_at'})
+        self.assertEqual(1, query.update.call_count)
+
+        # The row was added concurrently, so it is updated instead.
+        query.update.reset_mock()
+        session.execute.side_effect = db_exc.DBDuplicateEntry()
+        api._bump_cache_generation(session, 'membership')
+        self.assertEqual(2, query.update.call_count)
+
+    @mock.patch.object(api, 'get_session')
+    def test_purge_expired_sessions(self, mock_get_session):
+        Row = collections.namedtuple('Row', ('id',))
+        session = mock_get_session.return_value
+        session.execute.side_effect = [[Row('s1'), Row('s2')], None,
+                                       [Row('s3')], None, []]
+        self.assertEqual(3, api.purge_expired_sessions(
+            'beaker_cache', 'fake_date', 2))
+        self.assertEqual(5, session.execute.call_count)
+        self.assertEqual(3, session.begin.call_count)
+
+    @mock.patch.object(api, 'get_session')
+    @mock.patch('refstack.db.sqlalchemy.api.models')
+    def test_get_cache_generations(self, mock_models, mock_get_session):
+        Row = collections.namedtuple('Row', ('namespace', 'generation'))
+        session = mock_get_session.return_value
+        session.query.return_value = [Row('membership', 3)]
+        self.assertEqual({'membership': 3}, api.get_cache_generations())
+        session.query.assert_called_once_with(
+            mock_models.CacheGeneration.namespace,
+            mock_models.CacheGeneration.generation)
+
+    @mock.patch.object(api, '_grant_product_acl')
+    @mock.patch.object(api, '_bump_cache_generation')
     @mock.patch.object(api, 'get_session')
     @mock.patch('refstack.db.sqlalchemy.models.UserToGroup')
-    def test_add_user_to_group(self, mock_model, mock_get_session):
+    def test_add_user_to_group(self, mock_model, mock_get_session,
+                               mock_bump, mock_grant):
         session = mock_get_session.return_value
         api.add_user_to_group('user-123', 'GUID', 'user-321')
 
@@ -650,19 +1171,29 @@ class DBBackendTestCase(base.BaseTestCase):
         mock_get_session.assert_called_once_with()
         mock_model.return_value.save.assert_called_once_with(session=session)
         session.begin.assert_called_once_with()
+        mock_bump.assert_called_once_with(session,
+                                          api_const.CACHE_MEMBERSHIP)
+        self.assertEqual(session, mock_grant.call_args[0][0])
 
+    @mock.patch.object(api, '_revoke_product_acl')
+    @mock.patch.object(api, '_bump_cache_generation')
     @mock.patch.object(api, 'get_session')
     @mock.patch('refstack.db.sqlalchemy.api.models')
-    def test_remove_user_from_group(self, mock_models, mock_get_session):
+    def test_remove_user_from_group(self, mock_models, mock_get_session,
+                                    mock_bump, mock_revoke):
         session = mock_get_session.return_value
         db.remove_user_from_group('user-123', 'GUID')
 
-        session.query.assert_called_once_with(mock_models.UserToGroup)
+        session.query.assert_any_call(mock_models.UserToGroup)
+        session.query.assert_any_call(mock_models.Organization.id)
+        self.assertEqual(session, mock_revoke.call_args[0][0])
         session.query.return_value.filter_by.assert_has_calls((
             mock.call(user_openid='user-123'),
             mock.call().filter_by(group_id='GUID'),
             mock.call().filter_by().delete(synchronize_session=False)))
         session.begin.assert_called_once_with()
+        mock_bump.assert_called_once_with(session,
+                                          api_const.CACHE_MEMBERSHIP)
 
     @mock.patch.object(api, 'get_session')
     @mock.patch('refstack.db.sqlalchemy.models.Organization')
@@ -694,12 +1225,13 @@ class DBBackendTestCase(base.BaseTestCase):
         user_to_group.save.assert_called_once_with(session=session)
         session.begin.assert_called_once_with()
 
+    @mock.patch.object(api, '_grant_product_acl')
     @mock.patch.object(api, 'get_session')
     @mock.patch('refstack.db.sqlalchemy.models.Product')
     @mock.patch('refstack.db.sqlalchemy.models.ProductVersion')
     @mock.patch.object(api, '_to_dict', side_effect=lambda x: x)
     def test_product_add(self, mock_to_dict, mock_version,
-                         mock_product, mock_get_session):
+                         mock_product, mock_get_session, mock_grant):
         session = mock_get_session.return_value
         version = mock_version.return_value
         product = mock_product.return_value
@@ -717,6 +1249,7 @@ class DBBackendTestCase(base.BaseTestCase):
         mock_get_session.assert_called_once_with()
         product.save.assert_called_once_with(session=session)
         session.begin.assert_called_once_with()
+        self.assertEqual(session, mock_grant.call_args[0][0])
 
     @mock.patch.object(api, 'get_session')
     @mock.patch('refstack.db.sqlalchemy.models.Product')
@@ -799,6 +1332,74 @@ class DBBackendTestCase(base.BaseTestCase):
         session.query.return_value.filter_by.assert_has_calls((
             mock.call(id='product_id'),
             mock.call().delete(synchronize_session=False)))
+        session.query.assert_any_call(mock_models.UserProductAcl)
+        session.begin.assert_called_once_with()
+
+    @mock.patch.object(api, '_to_dict', side_effect=lambda x, allowed_keys: x)
+    @mock.patch.object(api, 'get_session')
+    def test_get_products_by_user(self, mock_get_session, mock_to_dict):
+        session = mock_get_session.return_value
+        query = (session.query.return_value.join.return_value
+                 .join.return_value.filter.return_value)
+        query.filter.return_value = query
+        products = query.order_by.return_value.all.return_value
+
+        self.assertEqual(products, api.get_products_by_user(
+            'fake_user', filters={'organization_id': 'fake_org'}))
+        session.query.assert_called_once_with(models.Product)
+        # Products are ordered by their vendor, newest vendors first.
+        self.assertEqual(
+            'organization.id = product.organization_id',
+            str(session.query.return_value.join.return_value
+                .join.call_args[0][1]))
+        self.assertEqual('organization.created_at DESC',
+                         str(query.order_by.call_args[0][0]))
+
+        self.assertRaises(Exception, api.get_products_by_user,
+                          'fake_user', filters={'foo': 'bar'})
+
+    @mock.patch.object(api, 'get_session')
+    def test_is_product_admin(self, mock_get_session):
+        session = mock_get_session.return_value
+        session.query.return_value.scalar.return_value = True
+        self.assertTrue(api.is_product_admin('fake_user', 'fake_product'))
+        session.query.assert_any_call(models.UserProductAcl)
+        session.query.return_value.filter_by.assert_called_once_with(
+            user_openid='fake_user', product_id='fake_product')
+
+        # Existing products the user can't manage.
+        session.query.return_value.scalar.side_effect = [False, True]
+        self.assertFalse(api.is_product_admin('fake_user', 'fake_product'))
+        session.query.assert_any_call(models.Product)
+        session.query.return_value.filter_by.assert_called_with(
+            id='fake_product')
+
+        # Unknown products.
+        session.query.return_value.scalar.side_effect = [False, False]
+        self.assertRaises(api.NotFound, api.is_product_admin,
+                          None, 'fake_product')
+
+    @mock.patch.object(api, 'get_session')
+    def test_grant_product_acl(self, mock_get_session):
+        session = mock_get_session.return_value
+        api._grant_product_acl(session, models.Product.id == 'fake_product')
+        insert = session.execute.call_args[0][0]
+        self.assertEqual('user_product_acl', insert.table.name)
+        sql = str(insert)
+        self.assertIn('INSERT INTO user_product_acl', sql)
+        self.assertIn('product.id = :id_1', sql)
+        self.assertIn('NOT (EXISTS', sql)
+
+    @mock.patch.object(api, '_grant_product_acl')
+    @mock.patch.object(api, '_revoke_product_acl')
+    @mock.patch.object(api, 'get_session')
+    def test_rebuild_product_acl(self, mock_get_session, mock_revoke,
+                                 mock_grant):
+        session = mock_get_session.return_value
+        session.query.return_value.count.return_value = 5
+        self.assertEqual(5, api.rebuild_product_acl())
+        mock_revoke.assert_called_once_with(session)
+        mock_grant.assert_called_once_with(session)
         session.begin.assert_called_once_with()
 
     @mock.patch.object(api, 'get_session',
@@ -830,6 +1431,33 @@ class DBBackendTestCase(base.BaseTestCase):
         session.query.assert_any_call(mock_models.UserToGroup,
                                       mock_models.User)
 
+    @mock.patch.object(api, 'get_session')
+    @mock.patch('refstack.db.sqlalchemy.api.models')
+    def test_get_organization_group_id(self, mock_models, mock_get_session):
+        session = mock_get_session.return_value
+        first = session.query.return_value.filter_by.return_value.first
+        first.return_value.group_id = 'fake_group'
+        self.assertEqual('fake_group',
+                         api.get_organization_group_id('fake_org'))
+        session.query.return_value.filter_by.assert_called_once_with(
+            id='fake_org')
+
+        first.return_value = None
+        self.assertRaises(api.NotFound, api.get_organization_group_id,
+                          'fake_org')
+
+    @mock.patch.object(api, 'get_session')
+    @mock.patch('refstack.db.sqlalchemy.api.models')
+    def test_is_user_in_group(self, mock_models, mock_get_session):
+        session = mock_get_session.return_value
+        query = session.query.return_value
+        exists = query.filter_by.return_value.exists
+        session.query.return_value.scalar.return_value = True
+        self.assertTrue(api.is_user_in_group('fake_user', 'fake_group'))
+        query.filter_by.assert_called_once_with(user_openid='fake_user',
+                                                group_id='fake_group')
+        session.query.assert_called_with(exists.return_value)
+
     @mock.patch.object(api, 'get_session',
                        return_value=mock.Mock(name='session'),)
     @mock.patch('refstack.db.sqlalchemy.models.Organization')
@@ -0,0 +1,99 @@
+# Copyright (c) 2018 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for guideline files served from a local directory."""
+
+import os
+import shutil
+import tempfile
+
+import mock
+from oslo_config import fixture as config_fixture
+from oslotest import base
+
+from refstack.api import guideline_local
+
+
+class LocalGuidelineSourceTestCase(base.BaseTestCase):
+    """Test case for the local guideline directory index."""
+
+    def setUp(self):
+        super(LocalGuidelineSourceTestCase, self).setUp()
+        self.config_fixture = config_fixture.Config()
+        self.CONF = self.useFixture(self.config_fixture).conf
+        self.CONF.set_override('guideline_local_check_interval', 0, 'api')
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        os.mkdir(os.path.join(self.root, 'add-ons'))
+        self.source = guideline_local.LocalGuidelineSource(self.root)
+
+    def _write(self, path, content, mtime=None):
+        full_path = os.path.join(self.root, path)
+        with open(full_path, 'wb') as f:
+            f.write(content)
+        if mtime is not None:
+            os.utime(full_path, (mtime, mtime))
+
+    def test_list_files(self):
+        self._write('2018.02.json', b'{}')
+        self._write('add-ons/dns.2018.02.json', b'{}')
+        self._write('README.rst', b'')
+        os.mkdir(os.path.join(self.root, '2018.02'))
+        self.assertEqual([{'name': '2018.02.json', 'path': '2018.02.json',
+                           'type': 'file'},
+                          {'name': 'dns.2018.02.json',
+                           'path': 'add-ons/dns.2018.02.json',
+                           'type': 'file'}],
+                         self.source.list_files())
+
+        os.remove(os.path.join(self.root, '2018.02.json'))
+        self._write('next.json', b'{}')
+        self.assertEqual(['add-ons/dns.2018.02.json', 'next.json'],
+                         [f['path'] for f in self.source.list_files()])
+
+    def test_get(self):
+        self._write('2018.02.json', b'{"foo": "bar"}', mtime=1000)
+        response = self.source.get('2018.02.json')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({'foo': 'bar'}, response.json())
+        self.assertEqual(1000, response.fetched_at)
+        self.assertIsNone(self.source.get('missing.json'))
+        self.assertIsNone(self.source.get('../2018.02.json'))
+
+        # Files edited in place are read again.
+        self._write('2018.02.json', b'{"foo": "baz"}', mtime=2000)
+        self.assertEqual({'foo': 'baz'},
+                         self.source.get('2018.02.json').json())
+
+    @mock.patch('time.time')
+    def test_check_interval(self, mock_time):
+        self.CONF.set_override('guideline_local_check_interval', 10, 'api')
+        mock_time.return_value = 1000
+        self._write('2018.02.json', b'{"foo": "bar"}', mtime=1000)
+        self.assertEqual({'foo': 'bar'},
+                         self.source.get('2018.02.json').json())
+
+        self._write('2018.02.json', b'{"foo": "baz"}', mtime=2000)
+        mock_time.return_value = 1005
+        self.assertEqual({'foo': 'bar'},
+                         self.source.get('2018.02.json').json())
+        mock_time.return_value = 1010
+        self.assertEqual({'foo': 'baz'},
+                         self.source.get('2018.02.json').json())
+
+    def test_get_source(self):
+        source = guideline_local.get_source(self.root)
+        self.assertIs(source, guideline_local.get_source(self.root))
+        self.assertEqual(self.root, source.root)
@@ -0,0 +1,297 @@
+# Copyright (c) 2018 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the persistent guideline cache."""
+
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+import mock
+from oslo_config import fixture as config_fixture
+from oslotest import base
+import requests
+
+from refstack.api import guideline_store
+
+URL = 'https://example.com/2018.02.json'
+
+
+class GuidelineStoreTestCase(base.BaseTestCase):
+    """Test case for the guideline cache."""
+
+    def setUp(self):
+        super(GuidelineStoreTestCase, self).setUp()
+        self.config_fixture = config_fixture.Config()
+        self.CONF = self.useFixture(self.config_fixture).conf
+        cache_dir = self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        for patcher in (
+                mock.patch.object(guideline_store, '_memory_cache', None),
+                mock.patch.object(guideline_store, '_unavailable_paths',
+                                  set())):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.CONF.set_override('guideline_cache_path',
+                               os.path.join(cache_dir, 'guidelines.sqlite'),
+                               'api')
+        self.CONF.set_override('guideline_cache_ttl', 100, 'api')
+        self.CONF.set_override('guideline_refresh_timeout', 10, 'api')
+
+    def _response(self, status_code, content):
+        resp = mock.Mock(status_code=status_code, content=content,
+                         headers={'ETag': '"fake"'})
+        return resp
+
+    @mock.patch('time.time')
+    @mock.patch('requests.Session.get')
+    def test_get(self, mock_get, mock_time):
+        mock_time.return_value = 1000
+        mock_get.return_value = self._response(200, b'{"foo": "bar"}')
+        digest = hashlib.sha256(b'{"foo": "bar"}').hexdigest()
+        response = guideline_store.get(URL)
+        self.assertEqual({'foo': 'bar'}, response.json())
+        self.assertEqual(digest, response.digest)
+        self.assertFalse(response.from_cache)
+
+        # Later requests are served from the cache.
+        response = guideline_store.get(URL)
+        self.assertEqual({'foo': 'bar'}, response.json())
+        self.assertEqual({'ETag': '"fake"'}, response.headers)
+        self.assertEqual(digest, response.digest)
+        self.assertTrue(response.from_cache)
+        mock_get.assert_called_once_with(URL, headers={},
+                                         timeout=(5, 30))
+
+    @mock.patch('requests.Session.get')
+    def test_get_not_cached(self, mock_get):
+        mock_get.return_value = self._response(404, b'Not Found')
+        self.assertEqual(404, guideline_store.get(URL).status_code)
+        self.assertEqual(404, guideline_store.get(URL).status_code)
+        self.assertEqual(2, mock_get.call_count)
+
+        mock_get.side_effect = requests.exceptions.RequestException()
+        self.assertRaises(requests.exceptions.RequestException,
+                          guideline_store.get, URL)
+
+    @mock.patch.object(guideline_store, '_start_refresh')
+    @mock.patch('time.time')
+    @mock.patch('requests.Session.get')
+    def test_get_stale(self, mock_get, mock_time, mock_refresh):
+        mock_time.return_value = 1000
+        mock_get.return_value = self._response(200, b'"old"')
+        guideline_store.get(URL)
+
+        # Stale entries are served and refreshed by a single thread.
+        mock_time.return_value = 1100
+        self.assertEqual('old', guideline_store.get(URL).json())
+        self.assertEqual('old', guideline_store.get(URL).json())
+        mock_refresh.assert_called_once_with(URL, mock.ANY)
+
+        # The refresh is attempted again once the claim timed out.
+        mock_time.return_value = 1111
+        guideline_store.get(URL)
+        self.assertEqual(2, mock_refresh.call_count)
+
+    @mock.patch('time.time')
+    @mock.patch('requests.Session.get')
+    def test_refresh(self, mock_get, mock_time):
+        mock_time.return_value = 1000
+        mock_get.return_value = self._response(200, b'"old"')
+        guideline_store.get(URL)
+
+        # Failed refreshes keep the last good copy.
+        mock_get.side_effect = requests.exceptions.RequestException()
+        guideline_store._refresh(URL)
+        mock_get.side_effect = None
+        mock_get.return_value = self._response(500, b'Error')
+        guideline_store._refresh(URL)
+        self.assertEqual('old', guideline_store.get(URL).json())
+
+        mock_get.return_value = self._response(200, b'"new"')
+        guideline_store._refresh(URL)
+        self.assertEqual('new', guideline_store.get(URL).json())
+
+    @mock.patch('time.time')
+    @mock.patch('requests.Session.get')
+    def test_refresh_not_modified(self, mock_get, mock_time):
+        mock_time.return_value = 1000
+        resp = self._response(200, b'"old"')
+        resp.headers = {'etag': '"v1"',
+                        'Last-Modified': 'Mon, 05 Feb 2018 10:00:00 GMT'}
+        mock_get.return_value = resp
+        guideline_store.get(URL)
+
+        # Unchanged files only have their age reset.
+        mock_time.return_value = 1100
+        mock_get.return_value = self._response(304, b'')
+        guideline_store._refresh(URL, guideline_store._read(URL))
+        mock_get.assert_called_with(
+            URL, headers={'If-None-Match': '"v1"',
+                          'If-Modified-Since':
+                              'Mon, 05 Feb 2018 10:00:00 GMT'},
+            timeout=(5, 30))
+        response = guideline_store._read(URL)
+        self.assertEqual('old', response.json())
+        self.assertEqual(hashlib.sha256(b'"old"').hexdigest(),
+                         response.digest)
+        self.assertEqual('"v1"', response.headers['etag'])
+        self.assertEqual(1100, response.fetched_at)
+        self.assertTrue(guideline_store._claim_refresh(URL))
+
+    @mock.patch.object(guideline_store, '_initialized_paths', set())
+    def test_read_without_digest(self):
+        # Caches created before digests were saved are upgraded.
+        conn = sqlite3.connect(self.CONF.api.guideline_cache_path)
+        conn.execute('CREATE TABLE guideline_cache ('
+                     'url TEXT PRIMARY KEY, '
+                     'status_code INTEGER NOT NULL, '
+                     'content BLOB NOT NULL, '
+                     'headers TEXT NOT NULL, '
+                     'fetched_at REAL NOT NULL, '
+                     'refresh_until REAL NOT NULL DEFAULT 0)')
+        conn.execute('INSERT INTO guideline_cache (url, status_code, '
+                     'content, headers, fetched_at) VALUES (?, ?, ?, ?, ?)',
+                     (URL, 200, b'"old"', '{}', 1000))
+        conn.commit()
+        conn.close()
+
+        response = guideline_store._read(URL)
+        self.assertEqual('old', response.json())
+        self.assertIsNone(response.digest)
+
+    @mock.patch('requests.Session.get')
+    def test_get_cache_directory(self, mock_get):
+        path = os.path.join(self.cache_dir, 'refstack', 'guidelines.sqlite')
+        self.CONF.set_override('guideline_cache_path', path, 'api')
+        mock_get.return_value = self._response(200, b'"foo"')
+        guideline_store.get(URL)
+        self.assertTrue(guideline_store.get(URL).from_cache)
+        self.assertEqual(0o700, os.stat(os.path.dirname(path)).st_mode & 0o777)
+        self.assertEqual(1, mock_get.call_count)
+
+    @mock.patch('refstack.api.guideline_store.LOG')
+    @mock.patch('requests.Session.get')
+    def test_get_cache_unavailable(self, mock_get, mock_log):
+        # The directory of the cache can't be created under a file.
+        not_dir = os.path.join(self.cache_dir, 'file')
+        open(not_dir, 'w').close()
+        self.CONF.set_override('guideline_cache_path',
+                               os.path.join(not_dir, 'guidelines.sqlite'),
+                               'api')
+        mock_get.return_value = self._response(200, b'"foo"')
+        response = guideline_store.get(URL)
+        self.assertEqual('foo', response.json())
+        self.assertFalse(response.from_cache)
+
+        # Responses are then cached in memory, and the warning is logged
+        # once.
+        response = guideline_store.get(URL)
+        self.assertEqual('foo', response.json())
+        self.assertTrue(response.from_cache)
+        self.assertEqual(1, mock_get.call_count)
+        self.assertEqual(1, mock_log.warning.call_count)
+
+        mock_get.return_value = self._response(404, b'Not Found')
+        self.assertEqual(404, guideline_store.get(URL + '.missing')
+                         .status_code)
+        guideline_store.get(URL + '.missing')
+        self.assertEqual(3, mock_get.call_count)
+
+    @mock.patch('requests.Session.get')
+    def test_get_cache_other_owner(self, mock_get):
+        mock_get.return_value = self._response(200, b'"foo"')
+        guideline_store.get(URL)
+        self.assertEqual(1, mock_get.call_count)
+
+        # A cache file owned by another user is not read.
+        owner = os.stat(self.CONF.api.guideline_cache_path).st_uid
+        with mock.patch('os.geteuid', return_value=owner + 1):
+            self.assertFalse(guideline_store.get(URL).from_cache)
+            self.assertRaises(sqlite3.DatabaseError,
+                              guideline_store._connect)
+        self.assertEqual(2, mock_get.call_count)
+        self.assertTrue(guideline_store.get(URL).from_cache)
+
+    def test_single_flight(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def fetch(url):
+            calls.append(url)
+            started.set()
+            release.wait()
+            return 'response'
+
+        results = []
+
+        def call():
+            results.append(guideline_store._single_flight(URL, fetch))
+
+        threads = [threading.Thread(target=call) for _ in range(3)]
+        threads[0].start()
+        started.wait()
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([URL], calls)
+        self.assertEqual(['response'] * 3, results)
+        self.assertEqual({}, guideline_store._flights)
+
+    def test_single_flight_error(self):
+        fetch = mock.Mock(side_effect=requests.exceptions.RequestException)
+        self.assertRaises(requests.exceptions.RequestException,
+                          guideline_store._single_flight, URL, fetch)
+        self.assertEqual({}, guideline_store._flights)
+
+    @mock.patch('requests.Session.get')
+    def test_fetch_missing_with_lock(self, mock_get):
+        self.CONF.set_override('guideline_fetch_lock', True, 'api')
+        mock_get.return_value = self._response(200, b'"foo"')
+        self.assertEqual('foo', guideline_store.get(URL).json())
+        self.assertTrue(os.path.exists(
+            self.CONF.api.guideline_cache_path + '.lock'))
+
+        # A response cached by another process meanwhile is used.
+        response = guideline_store._fetch_missing(URL)
+        self.assertTrue(response.from_cache)
+        mock_get.assert_called_once_with(URL, headers={},
+                                         timeout=(5, 30))
+
+    @mock.patch('requests.Session.get')
+    def test_get_many(self, mock_get):
+        urls = ['https://example.com/%d' % i for i in range(4)]
+
+        def get(url, headers, timeout):
+            if url == urls[2]:
+                raise requests.exceptions.ConnectionError()
+            return self._response(200, ('"%s"' % url).encode('utf-8'))
+
+        mock_get.side_effect = get
+        responses = guideline_store.get_many(urls)
+        self.assertEqual([urls[0], urls[1]],
+                         [response.json() for response in responses[:2]])
+        self.assertIsInstance(responses[2],
+                              requests.exceptions.ConnectionError)
+        self.assertEqual(urls[3], responses[3].json())
+        self.assertEqual([], guideline_store.get_many([]))
@@ -13,13 +13,19 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import hashlib
 import json
+import os
+import shutil
+import tempfile
 
 import httmock
 import mock
+from oslo_config import fixture as config_fixture
 from oslotest import base
 import requests
 
+from refstack import db
 from refstack.api import guidelines
 
 
@@ -27,6 +33,13 @@ class GuidelinesTestCase(base.BaseTestCase):
 
     def setUp(self):
         super(GuidelinesTestCase, self).setUp()
+        self.config_fixture = config_fixture.Config()
+        self.CONF = self.useFixture(self.config_fixture).conf
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.CONF.set_override('guideline_cache_path',
+                               os.path.join(cache_dir, 'guidelines.sqlite'),
+                               'api')
         self.guidelines = guidelines.Guidelines()
 
     def test_guidelines_list(self):
@@ -84,7 +97,7 @@ class GuidelinesTestCase(base.BaseTestCase):
             result = self.guidelines.get_guideline_list()
         self.assertEqual(result, {'powered': []})
 
-    @mock.patch('requests.get')
+    @mock.patch('requests.Session.get')
     def test_get_guidelines_exception(self, mock_requests_get):
         """Test when the GET request raises an exception."""
         mock_requests_get.side_effect = requests.exceptions.RequestException()
@@ -114,13 +127,43 @@ class GuidelinesTestCase(base.BaseTestCase):
             result = self.guidelines.get_guideline_contents('2010.03.json')
         self.assertIsNone(result)
 
-    @mock.patch('requests.get')
+    @mock.patch('requests.Session.get')
     def test_get_capability_file_exception(self, mock_requests_get):
         """Test when the GET request raises an exception."""
         mock_requests_get.side_effect = requests.exceptions.RequestException()
         result = self.guidelines.get_guideline_contents('2010.03.json')
         self.assertIsNone(result)
 
+    def test_local_guidelines(self):
+        """Test guidelines served from a local directory."""
+        local_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, local_dir)
+        os.mkdir(os.path.join(local_dir, 'add-ons'))
+        for path in ('2015.03.json', 'next.json', 'README.rst',
+                     'add-ons/test.2018.02.json', 'add-ons/test.next.json'):
+            with open(os.path.join(local_dir, path), 'w') as f:
+                json.dump({'path': path}, f)
+        local_guidelines = guidelines.Guidelines(local_path=local_dir)
+
+        with mock.patch('requests.Session.get') as mock_requests_get:
+            result = local_guidelines.get_guideline_list()
+            self.assertEqual({'path': '2015.03.json'},
+                             local_guidelines.get_guideline_contents(
+                                 '2015.03'))
+            self.assertEqual({'path': 'add-ons/test.next.json'},
+                             local_guidelines.get_guideline_contents(
+                                 'test.next.json'))
+            self.assertIsNone(local_guidelines.get_guideline_contents(
+                '../2015.03.json'))
+            mock_requests_get.assert_not_called()
+        self.assertEqual([{'name': '2015.03.json', 'file': '2015.03.json'},
+                          {'name': 'next.json', 'file': 'next.json'}],
+                         result['powered'])
+        self.assertEqual([{'name': '2018.02.json',
+                           'file': 'test.2018.02.json'},
+                          {'name': 'next.json', 'file': 'test.next.json'}],
+                         result['test'])
+
     def test_get_target_capabilities(self):
         """Test getting relevant capabilities."""
 
@@ -294,3 +337,320 @@ class GuidelinesTestCase(base.BaseTestCase):
         }
         tests = self.guidelines.get_test_list(json, ['cap-2'])
         self.assertEqual(['test_3'], tests)
+
+    def test_guideline_index(self):
+        """Test that compiled guidelines give the same test lists."""
+        capabilities = {
+            'cap-1': {
+                'tests': {
+                    'test_1': {'idempotent_id': 'id-1234'},
+                    'test_2': {'idempotent_id': 'id-5678',
+                               'aliases': ['test_2_1']},
+                    'test_3': {'idempotent_id': 'id-1111',
+                               'aliases': ['test_3_1'],
+                               'flagged': {'reason': 'foo'}}
+                }
+            },
+            'cap-2': {
+                'tests': {
+                    'test_4': {'idempotent_id': 'id-1233'}
+                }
+            }
+        }
+        guidelines_json = [
+            {'metadata': {'schema': '2.0'}, 'capabilities': capabilities},
+            {'schema': '1.4', 'capabilities': capabilities},
+            {'schema': '1.2',
+             'capabilities': {
+                 'cap-1': {'tests': ['test_1', 'test_2'],
+                           'flagged': ['test_2']},
+                 'cap-2': {'tests': ['test_3'], 'flagged': []}}},
+        ]
+        for json_ in guidelines_json:
+            index = guidelines.GuidelineIndex(json_, 'fake_revision')
+            for caps in (['cap-1'], ['cap-1', 'cap-2', 'cap-3']):
+                for alias in (True, False):
+                    for flag in (True, False):
+                        self.assertEqual(
+                            self.guidelines.get_test_list(
+                                json_, caps, alias, flag),
+                            index.get_test_list(caps, alias, flag))
+
+    def test_guideline_index_statuses_priority(self):
+        guideline = {
+            'schema': '1.4',
+            'platform': {'required': ['compute', 'object']},
+            'components': {
+                'compute': {'required': ['cap-1'],
+                            'advisory': ['cap-2'],
+                            'removed': ['cap-3']},
+                'object': {'required': ['cap-3'],
+                           'deprecated': ['cap-1', 'cap-2']}
+            },
+            'capabilities': {
+                'cap-1': {'tests': {'test_1': {'idempotent_id': 'id-1'}}},
+                'cap-2': {'tests': {'test_1': {'idempotent_id': 'id-1'},
+                                    'test_2': {'idempotent_id': 'id-2'}}},
+                'cap-3': {'tests': {'test_3': {'idempotent_id': 'id-3'}}}
+            }
+        }
+        index = guidelines.GuidelineIndex(guideline, 'fake_revision')
+        cap_statuses, test_statuses, _ = index.get_statuses()
+        # Capabilities and tests get the status of highest priority.
+        self.assertEqual(
+            self.guidelines.get_capability_statuses(guideline), cap_statuses)
+        self.assertEqual({'cap-1': 'required', 'cap-2': 'advisory',
+                          'cap-3': 'required'}, cap_statuses)
+        self.assertEqual({'test_1[id-1]': 'required',
+                          'test_2[id-2]': 'advisory',
+                          'test_3[id-3]': 'required'}, test_statuses)
+
+    @mock.patch.object(guidelines, '_guideline_index_cache', None)
+    @mock.patch.object(guidelines.Guidelines, '_get_guideline_response')
+    def test_get_guideline_index(self, mock_response):
+        guideline = {'schema': '1.4', 'capabilities': {}}
+        content = json.dumps(guideline).encode('utf-8')
+        response = mock.Mock(content=content, digest='fake_digest')
+        response.json.return_value = guideline
+        mock_response.return_value = response
+
+        index = self.guidelines.get_guideline_index('2016.01')
+        self.assertEqual('fake_digest', index.revision)
+        self.assertIs(index, self.guidelines.get_guideline_index('2016.01'))
+        response.json.assert_called_once_with()
+
+        # Files without a saved digest are hashed.
+        response.digest = None
+        index = self.guidelines.get_guideline_index('2016.01')
+        self.assertEqual(hashlib.sha256(content).hexdigest(), index.revision)
+
+        mock_response.return_value = None
+        self.assertIsNone(self.guidelines.get_guideline_index('2016.01'))
+
+    @mock.patch.object(guidelines, '_test_list_cache', None)
+    @mock.patch.object(guidelines, '_guideline_index_cache', None)
+    @mock.patch.object(guidelines.Guidelines, '_get_guideline_response')
+    def test_get_test_list_body(self, mock_response):
+        guideline = {
+            'schema': '1.4',
+            'platform': {'required': ['compute']},
+            'components': {'compute': {'required': ['cap-1'],
+                                       'advisory': ['cap-2']}},
+            'capabilities': {
+                'cap-1': {'tests': {'test_1': {'idempotent_id': 'id-1'}}},
+                'cap-2': {'tests': {'test_2': {'idempotent_id': 'id-2'}}}
+            }
+        }
+        response = mock.Mock(content=json.dumps(guideline).encode('utf-8'),
+                             digest='fake_digest')
+        response.json.return_value = guideline
+        mock_response.return_value = response
+
+        body, sha = self.guidelines.get_test_list_body('2016.01')
+        self.assertEqual(b'test_1[id-1]\ntest_2[id-2]', body)
+        self.assertEqual(hashlib.sha256(body).hexdigest(), sha)
+        self.assertEqual((body, sha),
+                         self.guidelines.get_test_list_body('2016.01'))
+        # The guideline was compiled once for both lists.
+        response.json.assert_called_once_with()
+
+        body, other_sha = self.guidelines.get_test_list_body(
+            '2016.01', types=['required'])
+        self.assertEqual(b'test_1[id-1]', body)
+        self.assertNotEqual(sha, other_sha)
+
+        self.assertRaises(KeyError, self.guidelines.get_test_list_body,
+                          '2016.01', target='object')
+
+        mock_response.return_value = None
+        self.assertIsNone(self.guidelines.get_test_list_body('2016.01'))
+
+    @mock.patch.object(guidelines, '_guideline_diff_cache', None)
+    @mock.patch.object(guidelines, '_guideline_index_cache', None)
+    @mock.patch.object(guidelines.Guidelines, '_get_guideline_response')
+    def test_get_guideline_diff(self, mock_response):
+        old = {
+            'schema': '1.4',
+            'platform': {'required': ['compute']},
+            'components': {'compute': {'required': ['cap-1', 'cap-2'],
+                                       'advisory': ['cap-3']}},
+            'capabilities': {
+                'cap-1': {'tests': {
+                    'test_1': {'idempotent_id': 'id-1'},
+                    'test_2': {'idempotent_id': 'id-2',
+                               'flagged': {'reason': 'foo'}}}},
+                'cap-2': {'tests': {'test_3': {'idempotent_id': 'id-3'}}},
+                'cap-3': {'tests': {'test_4': {'idempotent_id': 'id-4'}}}
+            }
+        }
+        new = {
+            'schema': '1.4',
+            'platform': {'required': ['compute']},
+            'components': {'compute': {'required': ['cap-1', 'cap-3'],
+                                       'advisory': ['cap-4']}},
+            'capabilities': {
+                'cap-1': {'tests': {
+                    'test_1': {'idempotent_id': 'id-1',
+                               'flagged': {'reason': 'bar'}},
+                    'test_2': {'idempotent_id': 'id-2'}}},
+                'cap-3': {'tests': {'test_4': {'idempotent_id': 'id-4'}}},
+                'cap-4': {'tests': {'test_5': {'idempotent_id': 'id-5'}}}
+            }
+        }
+        responses = {}
+        for name, guideline in (('2017.09', old), ('2018.02', new)):
+            response = mock.Mock(
+                content=json.dumps(guideline).encode('utf-8'),
+                digest='digest-' + name)
+            response.json.return_value = guideline
+            responses[name] = response
+        mock_response.side_effect = lambda gl_file: responses.get(gl_file)
+
+        diff = self.guidelines.get_guideline_diff('2017.09', '2018.02')
+        self.assertEqual({
+            'capabilities': {
+                'added': ['cap-4'],
+                'removed': ['cap-2'],
+                'reclassified': [{'name': 'cap-3', 'from': 'advisory',
+                                  'to': 'required'}]},
+            'tests': {
+                'added': ['test_5[id-5]'],
+                'removed': ['test_3[id-3]'],
+                'reclassified': [{'name': 'test_4[id-4]',
+                                  'from': 'advisory', 'to': 'required'}],
+                'flagged': ['test_1[id-1]'],
+                'unflagged': ['test_2[id-2]']}
+        }, diff)
+        self.assertIs(diff, self.guidelines.get_guideline_diff(
+            '2017.09', '2018.02'))
+
+        diff = self.guidelines.get_guideline_diff(
+            '2017.09', '2018.02', types=['required'])
+        self.assertEqual(['cap-2'], diff['capabilities']['removed'])
+        self.assertEqual(['cap-3'], diff['capabilities']['added'])
+        self.assertEqual([], diff['capabilities']['reclassified'])
+
+        self.assertRaises(KeyError, self.guidelines.get_guideline_diff,
+                          '2017.09', '2018.02', target='object')
+        self.assertIsNone(self.guidelines.get_guideline_diff(
+            '2017.09', '2016.01'))
+
+    def test_check_compliance(self):
+        """Test scoring passed tests against a guideline."""
+        json = {
+            'schema': '1.4',
+            'platform': {'required': ['compute', 'object']},
+            'components': {
+                'compute': {
+                    'required': ['cap-1', 'cap-2'],
+                    'advisory': ['cap-3'],
+                    'deprecated': [],
+                    'removed': []
+                },
+                'object': {
+                    'required': [],
+                    'advisory': ['cap-2'],
+                    'deprecated': [],
+                    'removed': []
+                }
+            },
+            'capabilities': {
+                'cap-1': {
+                    'tests': {
+                        'test_1': {'idempotent_id': 'id-1234'},
+                        'test_2': {'idempotent_id': 'id-5678',
+                                   'aliases': ['test_2_1']},
+                        'test_3': {'idempotent_id': 'id-1111',
+                                   'flagged': {'reason': 'foo'}}
+                    }
+                },
+                'cap-2': {
+                    'tests': {
+                        'test_4': {'idempotent_id': 'id-1233'}
+                    }
+                },
+                'cap-3': {
+                    'tests': {
+                        'test_5': {'idempotent_id': 'id-9999'}
+                    }
+                }
+            }
+        }
+        # test_1 passes by name, test_2 by an alias and test_4 by its id
+        # under another name.
+        results = [{'name': 'test_1', 'uuid': None},
+                   {'name': 'test_2_1', 'uuid': None},
+                   {'name': 'test_renamed', 'uuid': '1233'}]
+
+        compliance = self.guidelines.check_compliance(json, results)
+        self.assertEqual('1.4', compliance['schema'])
+        self.assertEqual(
+            [{'id': 'cap-1', 'status': 'required', 'total': 3, 'passed': 2,
+              'flagged': 1, 'flagged_passed': 0},
+             {'id': 'cap-2', 'status': 'required', 'total': 1, 'passed': 1,
+              'flagged': 0, 'flagged_passed': 0},
+             {'id': 'cap-3', 'status': 'advisory', 'total': 1, 'passed': 0,
+              'flagged': 0, 'flagged_passed': 0}],
+            compliance['capabilities'])
+        self.assertEqual({'capabilities': 2, 'total': 4, 'passed': 3,
+                          'flagged': 1},
+                         compliance['statuses']['required'])
+        self.assertEqual({'passed': 3, 'total': 4, 'percentage': 75.0},
+                         compliance['score'])
+        # Only the flagged required test was not passed.
+        self.assertTrue(compliance['compliant'])
+
+        compliance = self.guidelines.check_compliance(json, results[:1])
+        self.assertFalse(compliance['compliant'])
+
+        compliance = self.guidelines.check_compliance(json, results,
+                                                      types=['advisory'])
+        self.assertEqual(['advisory'], list(compliance['statuses']))
+        self.assertEqual(['cap-2', 'cap-3'],
+                         [cap['id'] for cap in compliance['capabilities']])
+        self.assertIsNone(compliance['score']['percentage'])
+        self.assertFalse(compliance['compliant'])
+
+        self.assertRaises(KeyError, self.guidelines.check_compliance,
+                          json, results, target='dns')
+
+    @mock.patch.object(guidelines, '_compliance_cache', None)
+    @mock.patch('refstack.db.get_test_result')
+    @mock.patch('refstack.db.get_test_results')
+    @mock.patch.object(guidelines.Guidelines, 'check_compliance')
+    @mock.patch.object(guidelines.Guidelines, 'get_guideline_contents')
+    def test_get_result_compliance(self, mock_contents, mock_check,
+                                   mock_get_results, mock_get_result):
+        mock_check.return_value = {'compliant': True}
+        compliance = self.guidelines.get_result_compliance(
+            'test_id', '2017.01', 'compute')
+        self.assertEqual({'compliant': True, 'test_id': 'test_id',
+                          'guideline': '2017.01', 'target': 'compute'},
+                         compliance)
+        mock_check.assert_called_once_with(
+            mock_contents.return_value, mock_get_results.return_value,
+            None, 'compute')
+
+        # Reports are computed once per test run, guideline and target.
+        self.assertEqual(compliance, self.guidelines.get_result_compliance(
+            'test_id', '2017.01', 'compute'))
+        self.assertEqual(1, mock_check.call_count)
+        self.guidelines.get_result_compliance('test_id', '2017.01',
+                                              'platform')
+        self.assertEqual(2, mock_check.call_count)
+
+        # Reports of deleted test runs are not served.
+        mock_get_result.side_effect = db.NotFound
+        self.assertRaises(db.NotFound, self.guidelines.get_result_compliance,
+                          'test_id', '2017.01', 'compute')
+        mock_get_result.side_effect = None
+        mock_get_result.assert_called_with('test_id', allowed_keys=['id'])
+
+        guidelines.forget_result_compliance('test_id')
+        self.guidelines.get_result_compliance('test_id', '2017.01',
+                                              'compute')
+        self.assertEqual(3, mock_check.call_count)
+
+        mock_contents.return_value = None
+        self.assertIsNone(self.guidelines.get_result_compliance(
+            'test_id', '2016.01', 'compute'))
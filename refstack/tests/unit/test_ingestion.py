@@ -0,0 +1,123 @@
+# Copyright (c) 2018 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for asynchronous ingestion of test results."""
+
+import mock
+from oslo_config import fixture as config_fixture
+from oslotest import base
+
+from refstack import db
+from refstack.api import constants as const
+from refstack.api import ingestion
+
+
+class IngestionTestCase(base.BaseTestCase):
+    """Test case for spooled uploads ingestion."""
+
+    def setUp(self):
+        super(IngestionTestCase, self).setUp()
+        self.config_fixture = config_fixture.Config()
+        self.CONF = self.useFixture(self.config_fixture).conf
+        self.upload = {'id': 'fake_id',
+                       'openid': None,
+                       'attempts': 1,
+                       'results': {'cpid': 'foo', 'results': []}}
+
+    @mock.patch('refstack.api.utils.check_user_is_foundation_admin')
+    @mock.patch('refstack.api.utils.check_user_is_product_admin')
+    @mock.patch('refstack.db.get_product_version_by_cpid')
+    def test_prepare_test_results(self, mock_get_version, mock_check,
+                                  mock_foundation):
+        test = {'cpid': '123'}
+        self.assertEqual(test, ingestion.prepare_test_results(test))
+        mock_get_version.assert_not_called()
+
+        mock_get_version.return_value = [{'id': 'ver1',
+                                          'product_id': 'prod1'}]
+        mock_check.return_value = False
+        mock_foundation.return_value = True
+        self.assertEqual({'cpid': '123', 'product_version_id': 'ver1',
+                          'meta': {const.USER: 'fake_openid'}},
+                         ingestion.prepare_test_results(test, 'fake_openid'))
+        mock_check.assert_called_once_with('prod1', 'fake_openid')
+
+        mock_get_version.return_value = [{'id': 'ver1',
+                                          'product_id': 'prod1'},
+                                         {'id': 'ver2',
+                                          'product_id': 'prod2'}]
+        self.assertNotIn('product_version_id',
+                         ingestion.prepare_test_results(test, 'fake_openid'))
+
+    @mock.patch('refstack.db.complete_spooled_upload')
+    @mock.patch('refstack.db.store_test_results')
+    @mock.patch('refstack.db.claim_spooled_upload')
+    def test_process_next_upload(self, mock_claim, mock_store,
+                                 mock_complete):
+        mock_claim.return_value = self.upload
+        self.assertTrue(ingestion.process_next_upload())
+        mock_store.assert_called_once_with(self.upload['results'],
+                                           test_id='fake_id')
+        mock_complete.assert_called_once_with('fake_id')
+
+        mock_claim.return_value = None
+        self.assertFalse(ingestion.process_next_upload())
+
+    @mock.patch('refstack.db.get_test_result')
+    @mock.patch('refstack.db.complete_spooled_upload')
+    @mock.patch('refstack.db.store_test_results')
+    @mock.patch('refstack.db.claim_spooled_upload')
+    def test_process_next_upload_already_stored(self, mock_claim,
+                                                mock_store, mock_complete,
+                                                mock_get_test_result):
+        mock_claim.return_value = self.upload
+        mock_store.side_effect = db.Duplication('duplicate')
+        self.assertTrue(ingestion.process_next_upload())
+        mock_get_test_result.assert_called_once_with('fake_id')
+        mock_complete.assert_called_once_with('fake_id')
+
+    @mock.patch('refstack.db.release_spooled_upload')
+    @mock.patch('refstack.db.get_test_result')
+    @mock.patch('refstack.db.store_test_results')
+    @mock.patch('refstack.db.claim_spooled_upload')
+    def test_process_next_upload_failure(self, mock_claim, mock_store,
+                                         mock_get_test_result,
+                                         mock_release):
+        self.CONF.set_override('ingestion_max_attempts', 2, 'api')
+        mock_claim.return_value = self.upload
+        mock_store.side_effect = Exception('connection lost')
+        self.assertTrue(ingestion.process_next_upload())
+        mock_release.assert_called_once_with('fake_id', 'connection lost',
+                                             failed=False)
+
+        mock_release.reset_mock()
+        self.upload['attempts'] = 2
+        self.assertTrue(ingestion.process_next_upload())
+        mock_release.assert_called_once_with('fake_id', 'connection lost',
+                                             failed=True)
+
+        # Invalid uploads are not retried.
+        mock_release.reset_mock()
+        self.upload['attempts'] = 1
+        mock_store.side_effect = db.Duplication('duplicate')
+        mock_get_test_result.side_effect = db.NotFound('not found')
+        self.assertTrue(ingestion.process_next_upload())
+        mock_release.assert_called_once_with('fake_id', 'duplicate',
+                                             failed=True)
+
+    @mock.patch.object(ingestion, 'process_next_upload')
+    def test_drain_spool(self, mock_process):
+        mock_process.side_effect = [True, True, False]
+        self.assertEqual(2, ingestion.drain_spool())
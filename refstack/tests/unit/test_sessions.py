@@ -0,0 +1,75 @@
+# Copyright (c) 2018 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for user session configuration."""
+
+import datetime
+
+import mock
+from oslo_config import cfg
+from oslo_config import fixture as config_fixture
+from oslotest import base
+
+from refstack.api import sessions
+
+
+class SessionsTestCase(base.BaseTestCase):
+    """Test case for beaker session settings."""
+
+    def setUp(self):
+        super(SessionsTestCase, self).setUp()
+        self.config_fixture = config_fixture.Config()
+        self.CONF = self.useFixture(self.config_fixture).conf
+        self.CONF.set_override('session_secret', 'fake_secret', 'api')
+
+    def test_get_beaker_config_cookie(self):
+        self.CONF.set_override('session_type', 'cookie', 'api')
+        self.assertEqual({'session.key': 'refstack',
+                          'session.type': 'cookie',
+                          'session.httponly': True,
+                          'session.timeout': 604800,
+                          'session.validate_key': 'fake_secret'},
+                         sessions.get_beaker_config())
+
+        self.CONF.set_override('session_encrypt_key', 'fake_key', 'api')
+        beaker_conf = sessions.get_beaker_config()
+        self.assertEqual('fake_key', beaker_conf['session.encrypt_key'])
+        self.assertEqual('cryptography', beaker_conf['session.crypto_type'])
+
+    def test_get_beaker_config_cookie_no_secret(self):
+        self.CONF.set_override('session_type', 'cookie', 'api')
+        self.CONF.clear_override('session_secret', 'api')
+        self.assertRaises(cfg.RequiredOptError, sessions.get_beaker_config)
+
+    def test_get_beaker_config_file(self):
+        self.CONF.set_override('session_type', 'dbm', 'api')
+        self.CONF.set_override('session_data_dir', '/fake/dir', 'api')
+        self.assertEqual({'session.key': 'refstack',
+                          'session.type': 'dbm',
+                          'session.timeout': 604800,
+                          'session.validate_key': 'fake_secret',
+                          'session.data_dir': '/fake/dir',
+                          'session.lock_dir': '/fake/dir'},
+                         sessions.get_beaker_config())
+
+    @mock.patch('refstack.db.purge_expired_sessions')
+    @mock.patch.object(sessions, 'datetime')
+    def test_purge_expired_sessions(self, mock_datetime, mock_purge):
+        mock_datetime.timedelta = datetime.timedelta
+        mock_datetime.datetime.now.return_value = datetime.datetime(2018, 1, 8)
+        self.CONF.set_override('session_timeout', 86400, 'api')
+        sessions.purge_expired_sessions(100)
+        mock_purge.assert_called_once_with(
+            'beaker_cache', datetime.datetime(2018, 1, 7), 100)
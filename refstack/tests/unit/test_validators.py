@@ -95,13 +95,30 @@ class TestResultValidatorTestCase(base.BaseTestCase):
         self.assertFalse(self.validator.assert_id('some_string'))
 
     def test_validation(self):
-        with mock.patch('jsonschema.validate') as mock_validate:
+        with mock.patch.object(self.validator._body_validator,
+                               'validate') as mock_validate:
             request = mock.Mock()
             request.body = json.dumps(self.FAKE_JSON).encode('utf-8')
             request.headers = {}
+            body = self.validator.validate(request)
+            mock_validate.assert_called_once_with(self.FAKE_JSON)
+            self.assertEqual(self.FAKE_JSON, body)
+
+    def test_validation_uuid_format(self):
+        body = {'cpid': 'foo', 'duration_seconds': 10,
+                'results': [{'name': 'tempest.test', 'uuid': 'not-a-uuid'}]}
+        request = mock.Mock()
+        request.body = json.dumps(body).encode('utf-8')
+        request.headers = {}
+        self.assertEqual(body, self.validator.validate(request))
+
+    def test_validation_uses_compiled_schema(self):
+        request = mock.Mock()
+        request.body = json.dumps(self.FAKE_JSON).encode('utf-8')
+        request.headers = {}
+        with mock.patch('jsonschema.validate') as mock_validate:
             self.validator.validate(request)
-            mock_validate.assert_called_once_with(self.FAKE_JSON,
-                                                  self.validator.schema)
+        mock_validate.assert_not_called()
 
     def test_validation_with_signature(self):
         request = mock.Mock()
@@ -204,6 +221,41 @@ class TestResultValidatorTestCase(base.BaseTestCase):
             self.assertIsInstance(e.exc, ValueError)
 
 
+class TestResultBatchValidatorTestCase(base.BaseTestCase):
+    """Test case for TestResultBatchValidator."""
+
+    def setUp(self):
+        super(TestResultBatchValidatorTestCase, self).setUp()
+        self.validator = validators.TestResultBatchValidator()
+        self.item_validator = validators.TestResultValidator()
+
+    def test_validation(self):
+        runs = [TestResultValidatorTestCase.FAKE_JSON, {'foo': 'bar'}]
+        request = mock.Mock()
+        request.body = json.dumps(runs).encode('utf-8')
+        request.headers = {}
+        with mock.patch.object(self.validator,
+                               'check_signature') as mock_check:
+            self.assertEqual(runs, self.validator.validate(request))
+            mock_check.assert_called_once_with(request)
+
+        # Runs are checked one by one.
+        self.item_validator.validate_item(runs[0])
+        self.assertRaises(api_exc.ValidationError,
+                          self.item_validator.validate_item, runs[1])
+        self.assertRaises(
+            api_exc.ValidationError, self.item_validator.validate_item,
+            TestResultValidatorTestCase.FAKE_JSON_WITH_EMPTY_RESULTS)
+
+    def test_validation_fail(self):
+        request = mock.Mock()
+        request.headers = {}
+        for body in ({'cpid': 'foo'}, []):
+            request.body = json.dumps(body).encode('utf-8')
+            self.assertRaises(api_exc.ValidationError,
+                              self.validator.validate, request)
+
+
 class PubkeyValidatorTestCase(base.BaseTestCase):
     """Test case for TestResultValidator."""
 
@@ -227,7 +279,7 @@ class PubkeyValidatorTestCase(base.BaseTestCase):
     def test_validation(self):
         request = mock.Mock()
         request.body = json.dumps(self.FAKE_JSON).encode('utf-8')
-        self.validator.validate(request)
+        self.assertEqual(self.FAKE_JSON, self.validator.validate(request))
 
     def test_validation_fail_no_json(self):
         wrong_request = mock.Mock()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2018 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark of test result ingestion into a local refstack database.
+
+Stores the same synthetic uploads through the ORM unit-of-work path which
+store_test_results used before and through the current bulk INSERT path,
+and reports the number of result rows written per second by each of them.
+All test runs created by the benchmark are deleted afterwards.
+
+Usage:
+    benchmark-ingestion.py --config-file /etc/refstack/refstack.conf \
+        --tests 1500 --uploads 20
+"""
+
+import argparse
+import sys
+import time
+import uuid
+
+from oslo_config import cfg
+
+from refstack import db
+from refstack.db.sqlalchemy import api
+from refstack.db.sqlalchemy import models
+
+
+def orm_store(results):
+    """Store test results with one ORM object per row."""
+    test = models.Test()
+    test_id = str(uuid.uuid4())
+    test.id = test_id
+    test.cpid = results.get('cpid')
+    test.duration_seconds = results.get('duration_seconds')
+    session = api.get_session()
+    with session.begin():
+        names = [(result['name'], result.get('uuid') or '')
+                 for result in results.get('results', [])]
+        name_ids = api._get_test_name_ids(session, names)
+        result_set = models.ResultSet()
+        result_set.digest = api._result_set_digest(names)
+        result_set.ref_count = 1
+        for name in names:
+            test_result = models.TestResults()
+            test_result.name_id = name_ids[name]
+            result_set.results.append(test_result)
+        test.result_set = result_set
+        for k, v in results.get('meta', {}).items():
+            meta = models.TestMeta()
+            meta.meta_key, meta.value = k, v
+            test.meta.append(meta)
+        api._update_test_visibility(test)
+        test.save(session)
+    return test_id
+
+
+def make_upload(tests):
+    """Build a synthetic upload with the given number of passing tests.
+
+    Every upload has a distinct list of passing tests, so that no path
+    benefits from sharing result sets between identical uploads.
+    """
+    results = [{'name': 'tempest.api.benchmark.Test.test_%d' % i,
+                'uuid': str(uuid.UUID(int=i))}
+               for i in range(tests - 1)]
+    results.append({'name': 'tempest.api.benchmark.Test.test_%s'
+                    % uuid.uuid4().hex})
+    return {
+        'cpid': uuid.uuid4().hex,
+        'duration_seconds': 1000,
+        'results': results,
+        'meta': {'benchmark': 'ingestion'},
+    }
+
+
+def run(store, uploads, tests):
+    """Return result rows per second written by the store function."""
+    test_ids = []
+    try:
+        started = time.time()
+        for _ in range(uploads):
+            test_ids.append(store(make_upload(tests)))
+        elapsed = time.time() - started
+    finally:
+        for test_id in test_ids:
+            db.delete_test_result(test_id)
+    return uploads * tests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--config-file', required=True,
+                        help='refstack config file with database settings')
+    parser.add_argument('--tests', type=int, default=1500,
+                        help='number of passing tests per upload')
+    parser.add_argument('--uploads', type=int, default=20,
+                        help='number of uploads stored by each path')
+    args = parser.parse_args()
+    cfg.CONF([], project='refstack', default_config_files=[args.config_file])
+
+    # Warm up the test name dictionary so that both paths do the same work.
+    run(db.store_test_results, 1, args.tests)
+
+    orm_rate = run(orm_store, args.uploads, args.tests)
+    bulk_rate = run(db.store_test_results, args.uploads, args.tests)
+    print('ORM unit of work: %10.1f rows/sec' % orm_rate)
+    print('Bulk INSERT:      %10.1f rows/sec (batch size %d)'
+          % (bulk_rate, cfg.CONF.results_insert_batch_size))
+    print('Speedup:          %10.2fx' % (bulk_rate / orm_rate))
+
+
+if __name__ == '__main__':
+    sys.exit(main())